@@ -0,0 +1,163 @@
+"""
+Load-Time Cost Analysis
+
+Predicts the work of the dynamic loader when an executable starts:
+how many libraries it loads transitively, how deep the dependency
+tree is, and how many files dyld or ld.so tries before each library is
+found. Each loaded image is counted once: the loader maps it once, and
+a name that is already loaded is not searched again.
+
+The report is plain JSON so it can be compared across releases.
+"""
+
+import json
+
+from ld_vulcanize.logger import log
+
+
+ANALYSES = ('loadcost',)
+
+
+class LoadCost(object):
+
+    def __init__(self, binaries, worst=10):
+        """
+        Load-time cost of all executables
+
+        Args:
+            binaries (:class:`ld_vulcanize.find.ArtifactFinder`): the
+                scanned tree
+            worst (int): number of executables to list as the worst
+                offenders
+        """
+        self._binaries = binaries
+        self._worst = worst
+        self._artifacts = dict(
+            (artifact.path, artifact) for artifact in
+            list(binaries.executable) + list(binaries.internal_shlib) + list(binaries.external_shlib))
+        self._probes = dict()
+
+    def _load_probes(self, path):
+        """
+        Return the memoized :meth:`load_probes` of an artifact
+        """
+        try:
+            return self._probes[path]
+        except KeyError:
+            pass
+        artifact = self._artifacts.get(path)
+        result = self._probes[path] = [] if artifact is None else artifact.load_probes()
+        return result
+
+    def _load(self, path):
+        """
+        Follow the breadth-first load order of the loader
+
+        Returns:
+            tuple ``(libraries, depth, probes, missing)``: the loaded
+            libraries in load order, the number of levels, the files
+            tried and the names that were not found
+        """
+        loaded = set([path])
+        libraries = []
+        level = [path]
+        depth = probes = 0
+        missing = set()
+        while True:
+            next_level = []
+            for node in level:
+                for name, count, found in self._load_probes(node):
+                    if found is None:
+                        probes += count
+                        missing.add(name)
+                    elif found not in loaded:
+                        probes += count
+                        loaded.add(found)
+                        next_level.append(found)
+            if not next_level:
+                return libraries, depth, probes, missing
+            libraries.extend(next_level)
+            level = next_level
+            depth += 1
+
+    def executable(self, exe):
+        """
+        Return the cost of starting one executable
+
+        Args:
+            exe (:class:`ld_vulcanize.binary.ExecutableABC`): the
+                executable
+
+        Returns:
+            dict: with the keys ``path``, ``libraries`` (number of
+            libraries loaded transitively), ``depth``, ``probes``
+            (files tried by the loader), ``missing`` (names not found)
+            and ``duplicates`` (library names loaded from more than
+            one path)
+        """
+        libraries, depth, probes, missing = self._load(exe.path)
+        by_name = dict()
+        for path in libraries:
+            by_name.setdefault(path.absolute().rsplit('/', 1)[-1], []).append(path.absolute())
+        duplicates = [dict(name=name, paths=sorted(paths))
+                      for name, paths in sorted(by_name.items()) if len(paths) > 1]
+        return dict(
+            path=exe.path.absolute(),
+            libraries=len(libraries),
+            depth=depth,
+            probes=probes,
+            missing=sorted(missing),
+            duplicates=duplicates,
+        )
+
+    def report(self):
+        """
+        Return the report of all executables
+
+        Returns:
+            dict: the ``executables`` sorted by path, the ``worst``
+            offenders by probes and number of libraries, and a
+            ``summary`` of the totals
+        """
+        log.info('Analyzing load cost of {0} executables'.format(len(self._binaries.executable)))
+        executables = [self.executable(exe) for exe in
+                       sorted(self._binaries.executable, key=lambda exe: exe.path.absolute())]
+        worst = sorted(executables, key=lambda entry: (-entry['probes'], -entry['libraries']))
+        return dict(
+            root=self._binaries.root_path.absolute(),
+            executables=executables,
+            worst=[entry['path'] for entry in worst[:self._worst]],
+            summary=dict(
+                executables=len(executables),
+                probes=sum(entry['probes'] for entry in executables),
+                max_libraries=max([entry['libraries'] for entry in executables] or [0]),
+                max_depth=max([entry['depth'] for entry in executables] or [0]),
+                duplicates=sum(len(entry['duplicates']) for entry in executables),
+                missing=sum(len(entry['missing']) for entry in executables),
+            ),
+        )
+
+
+def analyze(binaries, analysis):
+    """
+    Run an analysis of the scanned tree
+
+    Args:
+        binaries (:class:`ld_vulcanize.find.ArtifactFinder`): the
+            scanned tree
+        analysis (str): one of :data:`ANALYSES`
+
+    Returns:
+        dict: the JSON-serializable report
+    """
+    if analysis == 'loadcost':
+        return LoadCost(binaries).report()
+    raise ValueError('analysis must be one of {0}, got {1}'.format(ANALYSES, analysis))
+
+
+def dump(report, f):
+    """
+    Write the report as JSON
+    """
+    json.dump(report, f, indent=2, sort_keys=True)
+    f.write('\n')
@@ -0,0 +1,6 @@
+"""
+Benchmarks
+
+Standalone scripts, run them with ``python -m
+ld_vulcanize.benchmark.<name> --help``.
+"""
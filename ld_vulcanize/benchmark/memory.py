@@ -0,0 +1,132 @@
+"""
+Memory Usage of the Native Parsers
+
+Parses synthetic Mach-O and ELF binaries of increasing size and
+reports the peak resident memory of each parse. The binaries are
+sparse files, only the headers are real data. Since the parsers work
+on memory-mapped files the peak memory must not grow with the file
+size.
+
+Each parse runs in a fresh interpreter so that the peaks are
+independent::
+
+    python -m ld_vulcanize.benchmark.memory --sizes 1 64 4096
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+
+from ld_vulcanize import synthetic
+
+
+FORMATS = ('macho', 'elf')
+
+
+def make_binary(filename, fmt, size):
+    """
+    Write a sparse binary of the given size
+
+    Args:
+        filename (str): the file to create
+        fmt (str): one of :data:`FORMATS`
+        size (int): the file size in bytes
+    """
+    if fmt == 'macho':
+        data = synthetic.macho_image(
+            filetype=synthetic.MH_DYLIB, dylibs=['/usr/lib/libSystem.B.dylib'],
+            install_name='/opt/lib/libbig.dylib')
+    else:
+        data = synthetic.elf_image(needed=['libc.so.6'], soname='libbig.so')
+    with open(filename, 'wb') as f:
+        f.write(data)
+        f.truncate(max(size, len(data)))
+
+
+def max_rss():
+    """
+    Return the peak resident memory of this process in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def parse(filename, fmt):
+    if fmt == 'macho':
+        from ld_vulcanize.tool.macho import macho_load_commands
+        return list(macho_load_commands(filename))
+    from ld_vulcanize.tool.elf import elf_dynamic_entries
+    return elf_dynamic_entries(filename)
+
+
+def measure(filename, fmt):
+    """
+    Return the growth of the peak memory in bytes while parsing
+
+    Runs the parse in a subprocess.
+    """
+    output = subprocess.check_output([
+        sys.executable, '-m', 'ld_vulcanize.benchmark.memory',
+        '--child', fmt, filename])
+    return int(output.decode('ascii').strip())
+
+
+def _child(fmt, filename):
+    from ld_vulcanize.tool import macho, elf   # noqa: F401, import before measuring
+    before = max_rss()
+    parse(filename, fmt)
+    print(max_rss() - before)
+
+
+def run(sizes, directory):
+    """
+    Measure all formats and sizes
+
+    Args:
+        sizes (list of int): file sizes in bytes
+        directory (str): where to create the sparse files
+
+    Returns:
+        list of triples ``(format, size, peak_growth)``
+    """
+    result = []
+    for fmt in FORMATS:
+        for size in sizes:
+            filename = os.path.join(directory, 'big.{0}'.format(fmt))
+            make_binary(filename, fmt, size)
+            try:
+                result.append((fmt, size, measure(filename, fmt)))
+            finally:
+                os.remove(filename)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Peak memory of the native parsers')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 64, 1024, 4096],
+                        help='File sizes in MiB')
+    parser.add_argument('--directory', default=None,
+                        help='Directory for the sparse files (default: temporary)')
+    parser.add_argument('--child', nargs=2, metavar=('FORMAT', 'FILE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        _child(*args.child)
+        return
+    directory = args.directory or tempfile.mkdtemp()
+    try:
+        results = run([size << 20 for size in args.sizes], directory)
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory)
+    print('{0:<6} {1:>10} {2:>12}'.format('format', 'size MiB', 'peak KiB'))
+    for fmt, size, peak in results:
+        print('{0:<6} {1:>10} {2:>12}'.format(fmt, size >> 20, peak >> 10))
+
+
+if __name__ == '__main__':
+    main()
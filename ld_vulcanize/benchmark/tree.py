@@ -0,0 +1,236 @@
+"""
+Phase Timings on Synthetic Trees
+
+Generates a prefix of minimal Mach-O or ELF binaries, no toolchain
+needed, and reports the phases of
+:class:`ld_vulcanize.find.ArtifactFinder` as recorded by
+:mod:`ld_vulcanize.stats`:
+
+* discovery: walking the tree and classifying the files
+* parse: reading the load commands and resolving the dependents
+* link: connecting the artifacts to the shared library objects
+* rewrite: :meth:`make_paths_relative`
+
+The results are written as JSON, a previous result can be passed as
+baseline to compare against::
+
+    python -m ld_vulcanize.benchmark.tree --libraries 2000 --output new.json
+    python -m ld_vulcanize.benchmark.tree --libraries 2000 --baseline new.json
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+
+from ld_vulcanize import stats
+from ld_vulcanize import synthetic
+from ld_vulcanize.tool import elf
+
+
+FORMATS = ('macho', 'elf')
+
+PHASES = ('discovery', 'parse', 'link', 'rewrite')
+
+NOISE_EXT = ('', '.h', '.txt', '.py', '.dat')
+
+
+def _library_name(fmt, layer, index):
+    if fmt == 'macho':
+        return 'lib{0}_{1}.dylib'.format(layer, index)
+    return 'lib{0}_{1}.so'.format(layer, index)
+
+
+def _text_offset(names):
+    """
+    Return a text offset leaving room for the load commands of ``names``
+    """
+    size = 1024 + sum(32 + len(name) for name in names)
+    return 0x1000 * (size // 0x1000 + 1)
+
+
+def _write(fmt, filename, names, libdir, kind):
+    if fmt == 'macho':
+        filetype = synthetic.MH_EXECUTE if kind == 'executable' else synthetic.MH_DYLIB
+        dylibs = [os.path.join(libdir, name) for name in names]
+        data = synthetic.macho_image(filetype, dylibs=dylibs, text_offset=_text_offset(dylibs))
+    else:
+        e_type = elf.ET_EXEC if kind == 'executable' else elf.ET_DYN
+        data = synthetic.elf_image(
+            e_type, needed=names, runpath=libdir if names else None,
+            soname=None if kind == 'executable' else os.path.basename(filename))
+    synthetic.write_binary(filename, data, executable=(kind == 'executable'))
+
+
+def generate_tree(root, fmt='macho', executables=100, libraries=1000, fanout=4,
+                  depth=4, noise=1000, seed=0):
+    """
+    Write a synthetic prefix
+
+    The libraries are split into ``depth`` layers, each library links
+    ``fanout`` libraries of the next layer and the executables link
+    libraries of the first layer. All install names and search paths
+    are absolute.
+
+    Args:
+        root (str): the directory to create
+        fmt (str): one of :data:`FORMATS`
+        executables (int): number of executables in ``bin``
+        libraries (int): number of shared libraries in ``lib``
+        fanout (int): number of libraries linked by each binary
+        depth (int): number of library layers
+        noise (int): number of files that are not binaries in
+            ``share``, to exercise the classification
+        seed (int): seed of the random choice of the links
+
+    Returns:
+        dict: the number of ``files`` written
+    """
+    if fmt not in FORMATS:
+        raise ValueError('format must be one of {0}, got {1}'.format(FORMATS, fmt))
+    rng = random.Random(seed)
+    libdir = os.path.join(root, 'lib')
+    depth = max(1, min(depth, libraries))
+    layers = [[_library_name(fmt, layer, index)
+               for index in range(libraries * layer // depth, libraries * (layer + 1) // depth)]
+              for layer in range(depth)]
+
+    def links(layer):
+        if layer >= len(layers) or not layers[layer]:
+            return []
+        return rng.sample(layers[layer], min(fanout, len(layers[layer])))
+
+    for layer, names in enumerate(layers):
+        for name in names:
+            _write(fmt, os.path.join(libdir, name), links(layer + 1), libdir, 'shared_library')
+    for index in range(executables):
+        _write(fmt, os.path.join(root, 'bin', 'exe{0}'.format(index)), links(0), libdir, 'executable')
+    share = os.path.join(root, 'share')
+    for index in range(noise):
+        subdir = os.path.join(share, 'dir{0}'.format(index % 16))
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+        filename = os.path.join(subdir, 'noise{0}{1}'.format(index, NOISE_EXT[index % len(NOISE_EXT)]))
+        with open(filename, 'wb') as f:
+            f.write(bytes(bytearray(rng.getrandbits(8) for i in range(64))))
+    return dict(files=libraries + executables + noise)
+
+
+def time_phases(root, fmt, jobs=None):
+    """
+    Scan and rewrite a generated tree once
+
+    Returns:
+        dict: the seconds of each of the :data:`PHASES`
+    """
+    recorder = stats.get_stats()
+    before = recorder.to_dict()
+    finder_class = synthetic.MachOFinder if fmt == 'macho' else synthetic.ElfFinder
+    finder_class(root, jobs=jobs).make_paths_relative()
+    timings = recorder.difference(before)['timings']
+    return dict(
+        discovery=timings.get('walk', 0.0) + timings.get('classify', 0.0),
+        parse=timings.get('parse', 0.0),
+        link=timings.get('link', 0.0),
+        rewrite=timings.get('rewrite', 0.0),
+    )
+
+
+def run(fmt='macho', repeat=3, jobs=None, directory=None, **params):
+    """
+    Generate fresh trees and time the phases
+
+    Args:
+        fmt (str): one of :data:`FORMATS`
+        repeat (int): number of runs, the fastest time of each phase
+            is reported
+        jobs (int or None): concurrent jobs of the finder
+        directory (str or None): where to generate the trees.
+            Default: a temporary directory
+        **params: passed to :func:`generate_tree`
+
+    Returns:
+        dict: the JSON-serializable result
+    """
+    repeat = max(1, repeat)
+    best = dict()
+    tmp = tempfile.mkdtemp(dir=directory)
+    try:
+        for i in range(repeat):
+            root = os.path.join(os.path.realpath(tmp), 'prefix{0}'.format(i))
+            counts = generate_tree(root, fmt, **params)
+            timings = time_phases(root, fmt, jobs)
+            for phase in PHASES:
+                best[phase] = min(best.get(phase, timings[phase]), timings[phase])
+            shutil.rmtree(root)
+    finally:
+        shutil.rmtree(tmp)
+    parameters = dict(params, format=fmt, repeat=repeat, jobs=jobs)
+    return dict(
+        parameters=parameters,
+        files=counts['files'],
+        python=platform.python_version(),
+        platform=sys.platform,
+        timings=best,
+        total=sum(best.values()),
+    )
+
+
+def compare(baseline, result):
+    """
+    Return the ratio of the new to the baseline time of each phase
+    """
+    ratios = dict()
+    for phase in PHASES + ('total',):
+        old = baseline['total'] if phase == 'total' else baseline['timings'].get(phase)
+        new = result['total'] if phase == 'total' else result['timings'].get(phase)
+        if old and new is not None:
+            ratios[phase] = new / old
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Phase timings on a synthetic tree')
+    parser.add_argument('--format', dest='fmt', default='macho', choices=FORMATS)
+    parser.add_argument('--executables', type=int, default=100)
+    parser.add_argument('--libraries', type=int, default=1000)
+    parser.add_argument('--fanout', type=int, default=4,
+                        help='Number of libraries linked by each binary')
+    parser.add_argument('--depth', type=int, default=4,
+                        help='Number of library layers')
+    parser.add_argument('--noise', type=int, default=1000,
+                        help='Number of files that are not binaries')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--directory', default=None,
+                        help='Directory for the trees (default: temporary)')
+    parser.add_argument('--output', default=None,
+                        help='JSON file for the results')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON file of a previous run to compare with')
+    args = parser.parse_args(argv)
+    result = run(
+        args.fmt, repeat=args.repeat, jobs=args.jobs, directory=args.directory,
+        executables=args.executables, libraries=args.libraries, fanout=args.fanout,
+        depth=args.depth, noise=args.noise, seed=args.seed)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    ratios = dict()
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            ratios = compare(json.load(f), result)
+    print('{0:<10} {1:>10} {2:>10}'.format('phase', 'seconds', 'ratio'))
+    for phase in PHASES + ('total',):
+        seconds = result['total'] if phase == 'total' else result['timings'][phase]
+        ratio = '{0:.2f}'.format(ratios[phase]) if phase in ratios else ''
+        print('{0:<10} {1:>10.3f} {2:>10}'.format(phase, seconds, ratio))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,6 @@
 Abstraction for binaries (executables and shared libraries)
 """
 
-import subprocess
 import os
 
 from ld_vulcanize.logger import log
@@ -11,12 +10,32 @@ from ld_vulcanize.path import Path
 
 class FilesystemArtifact(object):
 
+    FORMAT = None
+    KIND = None
+
+    _inherited = ()
+
+    _missing = ()
+
     def __init__(self, filename):
         self._path = Path(filename)
 
-    def _init_dependents(self, binaries, make_shared_library=None):
+    def _init_dependents(self, binaries, make_shared_library=None, found=None):
+        """
+        Classify the dependents as internal or external
+
+        Args:
+            binaries (:class:`ld_vulcanize.find.ArtifactFinder`): the
+                finder collecting all artifacts
+            make_shared_library: callback for dependents that are not
+                yet known, or ``None``
+            found (iterable or None): the output of
+                :meth:`find_dependents` if it was already run
+        """
+        if found is None:
+            found = self.find_dependents()
         dependents = []
-        for path in self.find_dependents():
+        for path in found:
             log.debug('Found that %s depends on %s', self.path, path)
             if not path.is_abs():
                 raise RuntimeError('dependent {0} is not absolute path'.format(path))
@@ -27,8 +46,9 @@ class FilesystemArtifact(object):
                     if path not in binaries.root_path:
                         raise RuntimeError('internal {0} not in {1}'.format(path, binaries.root_path))
                 else:
-                    # must be external library
-                    if path in binaries.root_path:
+                    # must be external library, unless not every file was
+                    # listed or the walk skipped it
+                    if binaries.walks_whole_tree and path in binaries.root_path:
                         raise RuntimeError('library {0} in {1}'.format(path, binaries.root_path))
                     if make_shared_library:
                         make_shared_library(path)
@@ -43,6 +63,21 @@ class FilesystemArtifact(object):
         :class:`ld_vulcanize.path.Path` objects.
         """
         return self._dependents
+
+    @property
+    def slice_dependents(self):
+        """
+        Return the dependents of each architecture
+
+        Returns:
+            dict mapping the architecture name to the tuple of
+            dependents of that slice. Artifacts that are not fat
+            binaries have the single key ``None``.
+        """
+        slices = getattr(self, '_slice_dependents', None)
+        if slices is None:
+            return {None: self._dependents}
+        return slices
         
     def _init_shlib(self, internal_shlib, external_shlib):
         self._internal_shlib = frozenset(internal_shlib)
@@ -64,13 +99,189 @@ class FilesystemArtifact(object):
     def filename(self):
         return os.path.split(self.path.absolute())[1]
 
+    @classmethod
+    def is_file(cls, path, st=None):
+        """
+        Whether the file is of this kind of artifact
+
+        Args:
+            path (:class:`ld_vulcanize.path.Path`): the file
+            st: the ``stat`` result of the file, if already known
+        """
+        from ld_vulcanize.classify import classify_file
+        return classify_file(path, st) == (cls.FORMAT, cls.KIND)
+
     def __eq__(self, other):
         return self.path == other.path
 
     def __hash__(self):
         return hash(self.path)
 
-    def find_dependents(self):
+    def find_linker_paths(self):
+        """
+        Parse the binary for the linked shared libraries
+
+        Returns:
+            Iterable of strings, the linker paths as stored in the
+            binary. These may contain special components like
+            ``@loader_path``.
+        """
+        raise NotImplementedError('to be implemented in derived class')
+
+    @classmethod
+    def find_linker_paths_many(cls, artifacts, jobs=None):
+        """
+        Run :meth:`find_linker_paths` on many artifacts of this format
+
+        Args:
+            artifacts: the artifacts to parse
+            jobs (int or None): number of threads
+
+        Returns:
+            list: tuples of linker paths, in the same order
+        """
+        from ld_vulcanize.parallel import parallel_map
+        return parallel_map(
+            lambda artifact: tuple(artifact.find_linker_paths()), artifacts, jobs)
+
+    def find_dependents(self, linker_paths=None):
+        """
+        Resolve the linker paths
+
+        Args:
+            linker_paths (iterable or None): the output of
+                :meth:`find_linker_paths`, which is run if omitted.
+
+        Returns:
+            Iterable of :class:`ld_vulcanize.path.Path`
+        """
+        raise NotImplementedError('to be implemented in derived class')
+
+    def _restore(self, linker_paths, dependents):
+        """
+        Restore the scan results instead of running :meth:`find_dependents`
+
+        Args:
+            linker_paths: the output of :meth:`find_linker_paths`
+            dependents (iterable of str): the resolved dependents
+
+        Returns:
+            tuple of :class:`ld_vulcanize.path.Path`
+        """
+        self._linker_paths = tuple(tuple(entry) for entry in linker_paths)
+        self._slice_dependents = None
+        self._missing = ()
+        return tuple(Path.canonical(dependent) for dependent in dependents)
+
+    @property
+    def missing(self):
+        """
+        The linked names that :meth:`find_dependents` could not resolve
+        """
+        return self._missing
+
+    @property
+    def inherited_search_path(self):
+        """
+        The library search path inherited from the loading binaries
+
+        The loader does not search for the libraries of a library
+        along its own search path alone, but also along that of the
+        binaries that loaded it. This is the latter, in the order the
+        loading binaries were found.
+
+        Returns:
+            tuple of directories
+        """
+        return self._inherited
+
+    def inherit_search_path(self, dirnames):
+        """
+        Add the search path passed on by a loading binary
+
+        Args:
+            dirnames: the :meth:`passed_search_path` of the loader
+
+        Returns:
+            bool: whether :meth:`find_dependents` must be run again,
+            that is, the binary was already scanned, new directories
+            were added and it searches them
+        """
+        added = tuple(dirname for dirname in dirnames if dirname not in self._inherited)
+        if not added:
+            return False
+        self._inherited = self._inherited + added
+        return getattr(self, '_linker_paths', None) is not None and self._uses_inherited()
+
+    def _uses_inherited(self):
+        return False
+
+    def _needs_inherited(self):
+        # unknown, assume the worst
+        return True
+
+    def _closure_needs_inherited(self):
+        """
+        Whether a library loaded directly or indirectly needs our search path
+        """
+        seen = set()
+        pending = list(self.internal_shlib) + list(self.external_shlib)
+        while pending:
+            shlib = pending.pop()
+            if shlib in seen:
+                continue
+            seen.add(shlib)
+            if shlib._needs_inherited():
+                return True
+            pending.extend(shlib.internal_shlib)
+            pending.extend(shlib.external_shlib)
+        return False
+
+    def passed_search_path(self):
+        """
+        The library search path that the libraries loaded by this one inherit
+
+        Must be called after :meth:`find_dependents`.
+
+        Returns:
+            tuple of directories
+        """
+        return self._inherited
+
+    def load_probes(self):
+        """
+        Predict the work of the dynamic loader for the linked libraries
+
+        Must be called after :meth:`find_dependents`, the binary is not
+        parsed again.
+
+        Returns:
+            list of triples ``(name, probes, path)``, one for each
+            distinct linked name. ``probes`` is the number of files
+            the loader tries, ``path`` the found
+            :class:`ld_vulcanize.path.Path` or ``None`` if the library
+            is missing.
+        """
+        raise NotImplementedError('to be implemented in derived class')
+
+    @property
+    def linker_paths(self):
+        """
+        The linker paths as currently stored in the binary
+        """
+        return self._linker_paths
+
+    def planned_linker_paths(self, mode):
+        """
+        The linker paths after rewriting, without writing anything
+
+        Args:
+            mode (str): one of ``'relative'``, ``'absolute'``, ``'rpath'``
+
+        Returns:
+            the :attr:`linker_paths` that ``make_paths_<mode>`` would
+            leave in the binary
+        """
         raise NotImplementedError('to be implemented in derived class')
     
 
@@ -79,158 +290,619 @@ class FilesystemArtifact(object):
 
 class SharedLibraryABC(FilesystemArtifact):
 
-    EXT = frozenset()
+    KIND = 'shared_library'
 
-    @classmethod
-    def is_file(cls, path):
-        basename, extension = os.path.splitext(path.absolute())
-        return extension in cls.EXT
-    
     def __repr__(self):
         return 'SO:{0}'.format(self.filename)
 
 
-class SharedLibraryOSX(SharedLibraryABC):
+class MachOArtifact(object):
+    """
+    Rewriting of Mach-O install names
+
+    Mixin for the OSX artifacts, all changes to one file are applied
+    together. The linker paths are the ``(arch, cmd, value)`` triples
+    of the ``LC_LOAD_DYLIB`` and ``LC_RPATH`` load commands.
+    """
+
+    RELATIVE_PATH = None
 
-    EXT = frozenset([
-        '.dylib',     # normal OSX convention
-        '.so',        # Python uses this on OSX
-        '.fas',       # Maxima uses this on OSX
-    ])
+    RPATH = '@rpath'
 
-    def find_dependents(self):
+    def find_linker_paths(self):
+        # LC_ID_DYLIB is only relevant when linking but not when executing
+        from ld_vulcanize.tool import linker_commands
+        return linker_commands(self.path)
+
+    @classmethod
+    def find_linker_paths_many(cls, artifacts, jobs=None):
+        # the otool backend submits all files to its engine at once
+        from ld_vulcanize.tool import linker_commands_many
+        return linker_commands_many([artifact.path for artifact in artifacts], jobs)
+
+    def _rpaths(self, arch=False):
+        """
+        Return the ``LC_RPATH`` search paths in order
+
+        Args:
+            arch: only the search paths of this architecture, or of
+                all architectures if ``False``
+        """
+        result = []
+        for entry_arch, cmd, value in self._linker_paths:
+            if cmd == 'LC_RPATH' and arch in (False, entry_arch) and value not in result:
+                result.append(value)
+        return result
+
+    def find_dependents(self, linker_paths=None):
+        """
+        Resolve the install names of all architectures
+
+        Each distinct install name is resolved once, ``@rpath``
+        names once per architecture along its ``LC_RPATH`` search
+        paths followed by the :attr:`inherited_search_path`. The
+        dependencies of each slice are kept in
+        :attr:`slice_dependents`, the result is their union. Names
+        that cannot be resolved are left out and kept in
+        :attr:`missing`.
+        """
+        if linker_paths is None:
+            linker_paths = self.find_linker_paths()
+        self._linker_paths = tuple(tuple(entry) for entry in linker_paths)
+        actual_path = dict()
+        resolved = dict()
         self._linker_path = dict()
-        from ld_vulcanize.tool.otool import otool_load_commands, ActualPath
-        actual_path = ActualPath(loader_path=self.path.dirname())
-        for load_cmd in otool_load_commands(self.path):
-            if load_cmd['cmd'] == 'LC_LOAD_DYLIB':
-                linker_path = load_cmd['filename']
-                path = actual_path(linker_path)
-                self._linker_path[path] = linker_path
-                yield path
-            if load_cmd['cmd'] == 'LC_ID_DYLIB':
-                # install name for a dylib; only relevant when linking but not when executing
-                # print('LC_ID_DYLIB', self, load_cmd)
-                pass
+        slices = dict()
+        missing = []
+        result = []
+        for arch, cmd, linker_path in self._linker_paths:
+            if cmd != 'LC_LOAD_DYLIB':
+                continue
+            key = (arch, linker_path) if linker_path.startswith(self.RPATH + '/') else linker_path
+            path = resolved.get(key)
+            if path is None:
+                if arch not in actual_path:
+                    actual_path[arch] = self._actual_path(self._rpaths(arch))
+                path = actual_path[arch](linker_path)
+                if path is None:
+                    log.debug('{0} needs {1}, which cannot be found yet'.format(
+                        self.path, linker_path))
+                    if linker_path not in missing:
+                        missing.append(linker_path)
+                    continue
+                resolved[key] = path
+            self._linker_path[(arch, linker_path)] = path
+            slices.setdefault(arch, []).append(path)
+            if path not in result:
+                result.append(path)
+        self._slice_dependents = dict(
+            (arch, tuple(paths)) for arch, paths in slices.items())
+        self._missing = tuple(missing)
+        return result
+
+    def _uses_inherited(self):
+        return any(cmd == 'LC_LOAD_DYLIB' and value.startswith(self.RPATH + '/')
+                   for arch, cmd, value in self._linker_paths)
+
+    def passed_search_path(self):
+        """
+        The ``LC_RPATH`` directories followed by the inherited ones
+
+        dyld searches the run paths of every binary along the chain
+        of loaders, up to the main executable.
+        """
+        return tuple(self._actual_path(self._rpaths()).search_path())
+
+    def load_probes(self):
+        """
+        Count the files dyld tries for each install name
+
+        Absolute and ``@loader_path`` names take one probe, ``@rpath``
+        names one for each search path tried until the library is
+        found.
+        """
+        actual_path = dict()
+        seen = set()
+        result = []
+        for arch, cmd, linker_path in self._linker_paths:
+            if cmd != 'LC_LOAD_DYLIB' or linker_path in seen:
+                continue
+            seen.add(linker_path)
+            if arch not in actual_path:
+                actual_path[arch] = self._actual_path(self._rpaths(arch))
+            path, probes = actual_path[arch].probe(linker_path)
+            result.append((linker_path, probes, path))
+        return result
+
+    def _internal_paths(self):
+        return set(shlib.path for shlib in self.internal_shlib)
+
+    def _internal_changes(self, new_name):
+        """
+        Return the new install names of the internal libraries
+
+        All architectures share the install name changes, so a name
+        loading different libraries in different slices is kept.
+        """
+        internal = self._internal_paths()
+        resolved = dict()
+        for (arch, linker_path), path in self._linker_path.items():
+            resolved.setdefault(linker_path, set()).add(path)
+        changes = dict()
+        for linker_path, paths in resolved.items():
+            if len(paths) > 1:
+                log.warning('{0}: {1} loads a different library in each architecture, '
+                            'not rewritten'.format(self.path, linker_path))
+                continue
+            path, = paths
+            if path in internal:
+                changes[linker_path] = new_name(path)
+        return changes
+
+    def _relative_dirname(self, dirname):
+        relpath = os.path.relpath(dirname, self.path.dirname())
+        if relpath == os.curdir:
+            return self.RELATIVE_PATH
+        return self.RELATIVE_PATH + '/' + relpath
+
+    def _arches(self):
+        """
+        Return the architectures, ``None`` for a thin binary
+        """
+        arches = set(arch for arch, cmd, value in self._linker_paths) or set([None])
+        return sorted(arches, key=str)
+
+    def _foreign_rpaths(self, arch=False):
+        """
+        Return the search paths that do not point at internal libraries
+        """
+        internal_dirs = set(shlib.path.dirname() for shlib in self.internal_shlib)
+        search_path = self._actual_path()
+        result = []
+        for rpath in self._rpaths(arch):
+            try:
+                dirname = os.path.normpath(search_path.expand(rpath))
+            except RuntimeError:
+                dirname = None
+            if dirname not in internal_dirs:
+                result.append(rpath)
+        return result
+
+    def _remaining_rpaths(self, changes, arch=False):
+        """
+        Return the search paths once ``changes`` no longer use ``@rpath``
+
+        The internal search paths are dropped, unless an ``@rpath``
+        name that is not changed still loads an internal library, or
+        a library loaded directly or indirectly still needs them.
+
+        Returns:
+            list, or ``None`` if the search paths must be kept
+        """
+        internal = self._internal_paths()
+        for (entry_arch, linker_path), path in self._linker_path.items():
+            if (arch in (False, entry_arch) and linker_path.startswith(self.RPATH + '/')
+                    and linker_path not in changes and path in internal):
+                return None
+        foreign = self._foreign_rpaths(arch)
+        if foreign != self._rpaths(arch) and self._closure_needs_inherited():
+            return None
+        return foreign
+
+    def _needs_inherited(self):
+        """
+        Whether an ``@rpath`` name stays that only the loaders' search path resolves
+
+        Names that load the same internal library in all
+        architectures are rewritten and do not count. If the library
+        was not scanned it might need them.
+        """
+        linker_paths = getattr(self, '_linker_paths', None)
+        if linker_paths is None:
+            return True
+        internal = self._internal_paths()
+        resolved = dict()
+        for (arch, name), path in getattr(self, '_linker_path', dict()).items():
+            resolved.setdefault(name, set()).add(path)
+        for arch, cmd, name in linker_paths:
+            if cmd != 'LC_LOAD_DYLIB' or not name.startswith(self.RPATH + '/'):
+                continue
+            paths = resolved.get(name, ())
+            if len(paths) == 1 and paths <= internal:
+                continue
+            if self._actual_path(self._rpaths(arch), inherit=False)(name) is None:
+                return True
+        return False
+
+    def _plan_relative(self):
+        changes = self._internal_changes(
+            lambda path: os.path.join(self.RELATIVE_PATH, path.relative(self.path)))
+        return changes, dict(
+            (arch, self._remaining_rpaths(changes, arch)) for arch in self._arches())
+
+    def _plan_absolute(self):
+        changes = self._internal_changes(str)
+        return changes, dict(
+            (arch, self._remaining_rpaths(changes, arch)) for arch in self._arches())
+
+    def _plan_rpath(self):
+        internal = self._internal_paths()
+        usage = dict()
+        for path in self.dependents:
+            if path in internal:
+                usage.setdefault(path.dirname(), []).append(path)
+        order = sorted(usage, key=lambda dirname: -len(usage[dirname]))
+        search_path = []
+        rpath_name = dict()
+        for dirname in order:
+            served = [path for path in usage[dirname]
+                      if not any(os.path.exists(os.path.join(other, os.path.basename(path.absolute())))
+                                 for other in search_path)]
+            if served:
+                search_path.append(dirname)
+                for path in served:
+                    rpath_name[path] = self.RPATH + '/' + os.path.basename(path.absolute())
+
+        def new_name(path):
+            if path in rpath_name:
+                return rpath_name[path]
+            return os.path.join(self.RELATIVE_PATH, path.relative(self.path))
+
+        changes = self._internal_changes(new_name)
+        rpaths = [self._relative_dirname(dirname) for dirname in search_path]
+        arch_rpaths = dict()
+        for arch in self._arches():
+            remaining = self._remaining_rpaths(changes, arch)
+            if remaining is None:
+                remaining = self._rpaths(arch)   # still needed by an unchanged @rpath name
+            arch_rpaths[arch] = rpaths + [rpath for rpath in remaining if rpath not in rpaths]
+        return changes, arch_rpaths
 
     def make_paths_relative(self):
-        for shlib in self.internal_shlib:
-            self._make_path_relative_for(shlib)
+        return self._change_dylibs(*self._plan_relative())
 
     def make_paths_absolute(self):
-        for shlib in self.internal_shlib:
-            self._make_path_absolute_for(shlib)
-            
-    def _make_path_relative_for(self, shlib):
-        cmd = [
-            'install_name_tool',
-            '-change',
-            self._linker_path[shlib.path],
-            os.path.join('@loader_path', shlib.path.relative(self.path)),
-            str(self.path)
-        ]
-        log.debug('Exec: "{0}"'.format(' '.join(cmd)))
-        subprocess.check_call(cmd)
-            
-    def _make_path_absolute_for(self, shlib):
-        cmd = [
-            'install_name_tool',
-            '-change',
-            self._linker_path[shlib.path],
-            str(shlib.path),
-            str(self.path)
-        ]
-        log.debug('Exec: "{0}"'.format(' '.join(cmd)))
-        subprocess.check_call(cmd)
-
-                
-    
-class SharedLibraryLinux(SharedLibraryABC):
+        return self._change_dylibs(*self._plan_absolute())
 
-    EXT = frozenset(['.so'])    
+    def make_paths_rpath(self):
+        """
+        Load the internal libraries through a minimal ``@rpath`` search path
+
+        The search path consists of the directories of the internal
+        libraries, relative to the binary, with the most used
+        directory first. This minimizes the number of files dyld
+        probes. A library whose name is found in an earlier directory
+        of the search path keeps a relative install name instead, and
+        a directory is only searched if it serves an ``@rpath`` name.
+        """
+        return self._change_dylibs(*self._plan_rpath())
 
-    
+    def planned_linker_paths(self, mode):
+        changes, rpaths = self._effective_changes(*getattr(self, '_plan_' + mode)())
+        return self._changed_linker_paths(changes, rpaths)
 
-class ExecutableABC(FilesystemArtifact):
+    def _effective_changes(self, changes, rpaths):
+        """
+        Drop the changes that are already in effect
 
-    @classmethod
-    def is_file(cls, path):
-        if not os.access(path.absolute(), os.X_OK):
+        Returns:
+            pair of the install name changes and the map of each
+            architecture to its new search paths, both only with
+            actual changes
+        """
+        changes = dict(
+            (old, new) for old, new in changes.items() if old != new)
+        new_rpaths = dict()
+        for arch in self._arches():
+            value = None if rpaths is None else rpaths.get(arch)
+            if value is not None and value != self._rpaths(arch):
+                new_rpaths[arch] = list(value)
+        return changes, new_rpaths
+
+    def _changed_linker_paths(self, changes, rpaths):
+        linker_paths = []
+        for arch in self._arches():
+            entries = [entry for entry in self._linker_paths if entry[0] == arch]
+            if arch in rpaths:
+                entries = [entry for entry in entries if entry[1] != 'LC_RPATH']
+                entries.extend((arch, 'LC_RPATH', rpath) for rpath in rpaths[arch])
+            linker_paths.extend(
+                (arch, cmd, changes.get(value, value) if cmd == 'LC_LOAD_DYLIB' else value)
+                for arch, cmd, value in entries)
+        return tuple(linker_paths)
+
+    def _change_dylibs(self, changes, rpaths=None):
+        """
+        Apply the install name and search path changes
+
+        Changes that are already in effect are skipped. The install
+        names of all architectures are changed together, the search
+        paths of each architecture separately.
+
+        Args:
+            changes (dict): map of old to new install names
+            rpaths (dict or None): map of the architecture to its new
+                ``LC_RPATH`` search paths, or to ``None`` to keep
+                them. ``None`` keeps those of all architectures.
+
+        Returns:
+            int: the number of commands issued
+        """
+        changes, new_rpaths = self._effective_changes(changes, rpaths)
+        if not changes and not new_rpaths:
+            return 0
+        from ld_vulcanize.tool import change_dylibs
+        log.debug('Rewrite {0}: {1} rpaths {2}'.format(self.path, changes, new_rpaths))
+        arches = self._arches()
+        commands = change_dylibs(
+            self.path, changes,
+            dict((arch, new_rpaths.get(arch)) for arch in arches) if new_rpaths else None,
+            dict((arch, self._rpaths(arch)) for arch in arches))
+        self._linker_paths = self._changed_linker_paths(changes, new_rpaths)
+        self._linker_path = dict(
+            ((arch, changes.get(linker_path, linker_path)), path)
+            for (arch, linker_path), path in self._linker_path.items()
+        )
+        return commands
+
+
+class SharedLibraryOSX(MachOArtifact, SharedLibraryABC):
+
+    FORMAT = 'macho'
+
+    RELATIVE_PATH = '@loader_path'
+
+    def _actual_path(self, rpaths=(), inherit=True):
+        from ld_vulcanize.tool.otool import ActualPath
+        return ActualPath(loader_path=self.path.dirname(), rpaths=rpaths,
+                          inherited=self._inherited if inherit else ())
+
+
+class ElfArtifact(object):
+    """
+    Rewriting of the ELF library search path
+
+    Mixin for the Linux artifacts. The ``DT_NEEDED`` entries are only
+    library names, so relocation changes the ``DT_RUNPATH`` instead.
+    The linker paths are the ``(tag, value)`` pairs of the
+    ``DT_NEEDED``, ``DT_RPATH`` and ``DT_RUNPATH`` entries.
+    """
+
+    FORMAT = 'elf'
+
+    RELATIVE_PATH = '$ORIGIN'
+
+    def find_linker_paths(self):
+        from ld_vulcanize.tool.elf import elf_dynamic_entries
+        return elf_dynamic_entries(self.path)
+
+    def _search_path(self, tag):
+        for entry_tag, value in self._linker_paths:
+            if entry_tag == tag:
+                return value
+        return None
+
+    def _library_search(self, inherit=True):
+        from ld_vulcanize.tool.ldso import LibrarySearch, elf_compatibility
+        self._is_64, machine = elf_compatibility(self.path.absolute())
+        return LibrarySearch(
+            self.path.dirname(), self._is_64, machine,
+            rpath=self._search_path('RPATH'),
+            runpath=self._search_path('RUNPATH'),
+            compatible=elf_compatibility,
+            inherited=self._inherited if inherit else ())
+
+    def find_dependents(self, linker_paths=None):
+        """
+        Resolve the ``DT_NEEDED`` names like ld.so
+
+        Without ``DT_RUNPATH`` the :attr:`inherited_search_path` is
+        searched after the ``DT_RPATH``. Names that cannot be resolved
+        are left out and kept in :attr:`missing`.
+        """
+        if linker_paths is None:
+            linker_paths = self.find_linker_paths()
+        self._linker_paths = tuple(tuple(entry) for entry in linker_paths)
+        self._missing = ()
+        search = self._library_search()
+        for tag, name in self._linker_paths:
+            if tag != 'NEEDED':
+                continue
+            filename = search(name)
+            if filename is None:
+                log.debug('{0} needs {1}, which cannot be found yet'.format(self.path, name))
+                self._missing += (name,)
+                continue
+            yield Path(filename)
+
+    def _uses_inherited(self):
+        return self._search_path('RUNPATH') is None
+
+    def _needs_inherited(self):
+        """
+        Whether a ``DT_NEEDED`` library is only found along the loaders' ``DT_RPATH``
+
+        If the library was not scanned it might be.
+        """
+        if getattr(self, '_linker_paths', None) is None:
+            return True
+        if not self._inherited or not self._uses_inherited():
             return False
-        with open(path.absolute(), 'rb') as f:
-            head = f.read(512)
-        for magic in cls.MAGIC:
-            if head.startswith(magic):
-                return True
-        return False
+        search = self._library_search(inherit=False)
+        return any(tag == 'NEEDED' and name not in self._missing and search(name) is None
+                   for tag, name in self._linker_paths)
+
+    def passed_search_path(self):
+        """
+        The ``DT_RPATH`` directories followed by the inherited ones
+
+        ld.so searches the ``DT_RPATH`` of every object along the
+        chain of loaders, up to the executable, except of those with
+        a ``DT_RUNPATH``.
+        """
+        from ld_vulcanize.tool.ldso import split_search_path
+        if self._search_path('RUNPATH') is not None:
+            own = []
+        else:
+            own = split_search_path(
+                self._search_path('RPATH'), self.path.dirname(), self._is_64)
+        return tuple(own) + tuple(dirname for dirname in self._inherited if dirname not in own)
+
+    def load_probes(self):
+        """
+        Count the directories ld.so tries for each ``DT_NEEDED`` name
+
+        The search path is the ``DT_RPATH`` and the inherited
+        ``DT_RPATH`` of the loaders, or the ``DT_RUNPATH``, followed
+        by the system directories. The ``ld.so.cache`` is not
+        modelled.
+        """
+        search = self._library_search()
+        seen = set()
+        result = []
+        for tag, name in self._linker_paths:
+            if tag != 'NEEDED' or name in seen:
+                continue
+            seen.add(name)
+            filename, probes = search.probe(name)
+            result.append((name, probes, None if filename is None else Path(filename)))
+        return result
+
+    def _relative(self, dirname):
+        relpath = os.path.relpath(dirname, self.path.dirname())
+        if relpath == os.curdir:
+            return self.RELATIVE_PATH
+        return os.path.join(self.RELATIVE_PATH, relpath)
+
+    def make_paths_relative(self):
+        return self._set_runpath(self._plan_runpath(self._relative))
+
+    def make_paths_absolute(self):
+        return self._set_runpath(self._plan_runpath(lambda dirname: dirname))
+
+    def make_paths_rpath(self):
+        """
+        Relative search path with the most used directory first
+
+        ld.so tries the ``DT_RUNPATH`` directories in order for each
+        ``DT_NEEDED`` library, this minimizes the number of probes.
+        """
+        return self._set_runpath(self._plan_runpath(self._relative, by_usage=True))
+
+    def planned_linker_paths(self, mode):
+        if mode == 'absolute':
+            plan = self._plan_runpath(lambda dirname: dirname)
+        else:
+            plan = self._plan_runpath(self._relative, by_usage=mode == 'rpath')
+        return self._changed_linker_paths(plan)
+
+    def _plan_runpath(self, entry, by_usage=False):
+        """
+        Point the search path at the directories of the internal libraries
+
+        Entries for other directories are kept. A ``DT_RPATH`` stays
+        one while a library, loaded directly or indirectly, needs it.
+        A binary without either entry is left alone, it finds its
+        libraries along the search path of its loaders.
+
+        Args:
+            entry: function mapping a directory to the search path entry
+            by_usage (bool): whether to order the directories by the
+                number of internal libraries in them instead of by
+                first use
+
+        Returns:
+            pair ``(old, new)`` of the ``(tag, value)`` linker path
+            entries to replace, or ``None`` if nothing changes
+        """
+        from ld_vulcanize.tool.ldso import split_search_path
+        internal = set(shlib.path for shlib in self.internal_shlib)
+        dirnames = []
+        usage = dict()
+        for path in self.dependents:
+            if path in internal:
+                if path.dirname() not in dirnames:
+                    dirnames.append(path.dirname())
+                usage[path.dirname()] = usage.get(path.dirname(), 0) + 1
+        if by_usage:
+            dirnames.sort(key=lambda dirname: -usage[dirname])
+        if not dirnames:
+            return None
+        runpath = [entry(dirname) for dirname in dirnames]
+        old = self._search_path('RUNPATH')
+        if old is None:
+            old = self._search_path('RPATH')
+        if old is None:
+            log.debug('{0} has no search path to rewrite'.format(self.path))
+            return None
+        for value in (old.split(':') if old else []):
+            expanded = split_search_path(value, self.path.dirname(), self._is_64)
+            if expanded and expanded[0] in dirnames:
+                continue
+            if value not in runpath:
+                runpath.append(value)
+        runpath = ':'.join(runpath)
+        if runpath == old:
+            return None
+        tag = 'RUNPATH' if self._search_path('RUNPATH') is not None else 'RPATH'
+        keep_rpath = tag == 'RPATH' and (
+            self._needs_inherited() or self._closure_needs_inherited())
+        return (tag, old), ('RPATH' if keep_rpath else 'RUNPATH', runpath)
+
+    def _changed_linker_paths(self, plan):
+        if plan is None:
+            return self._linker_paths
+        old, new = plan
+        linker_paths = list(self._linker_paths)
+        linker_paths[linker_paths.index(old)] = new
+        return tuple(linker_paths)
+
+    def _set_runpath(self, plan):
+        """
+        Write the search path planned by :meth:`_plan_runpath`
+
+        Returns:
+            int: the number of commands issued
+        """
+        if plan is None:
+            return 0
+        from ld_vulcanize.tool import set_runpath
+        (old_tag, old), (tag, runpath) = plan
+        log.debug('Rewrite {0}: {1} {2}'.format(self.path, tag, runpath))
+        commands = set_runpath(self.path, runpath, keep_rpath=tag == 'RPATH')
+        self._linker_paths = self._changed_linker_paths(plan)
+        return commands
+
+
+class SharedLibraryLinux(ElfArtifact, SharedLibraryABC):
+    pass
+
+
+
+class ExecutableABC(FilesystemArtifact):
+
+    KIND = 'executable'
 
     def __repr__(self):
         return 'EX:{0}'.format(self.filename)
     
         
 
-class ExecutableOSX(ExecutableABC):
+class ExecutableOSX(MachOArtifact, ExecutableABC):
 
-    MAGIC = frozenset([
-        '\xCA\xFE\xBA\xBE',  # Mach-O Fat Binary
-        '\xFE\xED\xFA\xCE',  # Mach-O binary (32-bit)
-        '\xFE\xED\xFA\xCF',  # Mach-O binary (64-bit)
-        '\xCE\xFA\xED\xFE',  # Mach-O binary (reverse byte ordering scheme, 32-bit)
-        '\xCF\xFA\xED\xFE',  # Mach-O binary (reverse byte ordering scheme, 64-bit)
-    ])
+    FORMAT = 'macho'
 
-    def find_dependents(self):
-        self._linker_path = dict()
-        from ld_vulcanize.tool.otool import otool_load_commands, ActualPath
-        actual_path = ActualPath(executable_path=self.path.dirname())
-        for load_cmd in otool_load_commands(self.path):
-            if load_cmd['cmd'] == 'LC_LOAD_DYLIB':
-                linker_path = load_cmd['filename']
-                path = actual_path(linker_path)
-                self._linker_path[path] = linker_path
-                yield path
-            if load_cmd['cmd'] == 'LC_ID_DYLIB':
-                # Is that legal in an executable?
-                print('LC_ID_DYLIB', self, load_cmd)
+    RELATIVE_PATH = '@executable_path'
 
-    def make_paths_relative(self):
-        for shlib in self.internal_shlib:
-            self._make_path_relative_for(shlib)
+    def _actual_path(self, rpaths=(), inherit=True):
+        from ld_vulcanize.tool.otool import ActualPath
+        return ActualPath(
+            executable_path=self.path.dirname(), loader_path=self.path.dirname(), rpaths=rpaths,
+            inherited=self._inherited if inherit else ())
 
-    def make_paths_absolute(self):
-        for shlib in self.internal_shlib:
-            self._make_path_absolute_for(shlib)
-            
-    def _make_path_relative_for(self, shlib):
-        cmd = [
-            'install_name_tool',
-            '-change',
-            self._linker_path[shlib.path],
-            os.path.join('@executable_path', shlib.path.relative(self.path)),
-            str(self.path)
-        ]
-        log.debug('Exec: "{0}"'.format(' '.join(cmd)))
-        subprocess.check_call(cmd)
-
-    def _make_path_absolute_for(self, shlib):
-        cmd = [
-            'install_name_tool',
-            '-change',
-            self._linker_path[shlib.path],
-            str(shlib.path),
-            str(self.path)
-        ]
-        log.debug('Exec: "{0}"'.format(' '.join(cmd)))
-        subprocess.check_call(cmd)
-        
-            
-            
-                
-class ExecutableLinux(ExecutableABC):
 
-    MAGIC = frozenset(['\x7fELF'])
-
-    
+class ExecutableLinux(ElfArtifact, ExecutableABC):
+    pass
 
 
 
@@ -240,7 +912,7 @@ def platform_dependent(platform):
             shared_library=SharedLibraryOSX,
             executable=ExecutableOSX,
         )
-    elif platform == 'linux2':
+    elif platform in ('linux', 'linux2'):
         return dict(
             shared_library=SharedLibraryLinux,
             executable=ExecutableLinux,
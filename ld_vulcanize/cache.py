@@ -0,0 +1,277 @@
+"""
+Persistent Scan Cache
+
+Remembers the classification and the linker paths of each file across
+runs. Entries are keyed by the file name and only valid as long as the
+device, inode, size and modification time of the file are unchanged.
+
+The :class:`ExternalIndex` does the same for the libraries outside of
+the root, shared by all roots and invalidated when the operating
+system changes.
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import platform
+
+from ld_vulcanize import stats
+from ld_vulcanize.logger import log
+
+
+def stat_signature(st):
+    """
+    Return the part of a ``stat`` result that identifies file contents
+    """
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class ScanCache(object):
+
+    FILENAME = '.ld-vulcanize-cache.sqlite'
+
+    SCHEMA = 3
+
+    def __init__(self, directory):
+        """
+        SQLite-backed cache of scan results
+
+        Only use from a single thread.
+
+        Args:
+            directory (str): the directory holding the cache file
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._filename = os.path.join(directory, self.FILENAME)
+        self._db = sqlite3.connect(self._filename)
+        self._init_schema()
+        self.hits = 0
+        self.misses = 0
+
+    def _init_schema(self):
+        db = self._db
+        version, = db.execute('PRAGMA user_version').fetchone()
+        if version != self.SCHEMA:
+            db.execute('DROP TABLE IF EXISTS artifact')
+            db.execute('PRAGMA user_version = {0}'.format(self.SCHEMA))
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS artifact (
+                path TEXT PRIMARY KEY,
+                dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER,
+                kind TEXT,
+                linker_paths TEXT
+            )""")
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def _lookup(self, path, st=None):
+        if st is None:
+            try:
+                st = os.stat(str(path))
+            except OSError:
+                return None, None
+        signature = stat_signature(st)
+        row = self._db.execute(
+            'SELECT dev, ino, size, mtime, kind, linker_paths FROM artifact WHERE path = ?',
+            (str(path),)).fetchone()
+        if row is None or tuple(row[:4]) != signature:
+            return signature, None
+        return signature, row[4:]
+
+    def get_kind(self, path, st=None):
+        """
+        Return the cached classification
+
+        Args:
+            path: the file
+            st: the ``stat`` result of the file, if already known
+
+        Returns:
+            pair ``(found, kind)``. The kind is one of
+            ``'shared_library'``, ``'executable'``, or ``None`` for
+            uninteresting files.
+        """
+        signature, row = self._lookup(path, st)
+        if row is None:
+            self.misses += 1
+            stats.count('cache_misses')
+            return False, None
+        self.hits += 1
+        stats.count('cache_hits')
+        return True, row[0]
+
+    def get_linker_paths(self, path):
+        """
+        Return the cached linker paths or ``None``
+        """
+        signature, row = self._lookup(path)
+        if row is None or row[1] is None:
+            self.misses += 1
+            stats.count('cache_misses')
+            return None
+        self.hits += 1
+        stats.count('cache_hits')
+        return tuple(json.loads(row[1]))
+
+    def put(self, path, kind, linker_paths=None, st=None):
+        """
+        Store the scan results for the current contents of ``path``
+        """
+        if st is None:
+            st = os.stat(str(path))
+        signature = stat_signature(st)
+        if linker_paths is not None:
+            linker_paths = json.dumps(list(linker_paths))
+        self._db.execute(
+            'INSERT OR REPLACE INTO artifact VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (str(path),) + signature + (kind, linker_paths))
+
+    def close(self):
+        log.info('Scan cache {0}: {1} hits, {2} misses'.format(
+            self._filename, self.hits, self.misses))
+        self._db.commit()
+        self._db.close()
+
+
+LOADER_CACHES = (
+    '/etc/ld.so.cache',
+    '/System/Library/dyld',
+    '/System/Volumes/Preboot/Cryptexes/OS/System/Library/dyld',
+)
+
+
+def system_fingerprint():
+    """
+    Identify the operating system and toolchain
+
+    Changes with the kernel, the OS release, the selected Xcode and
+    whenever the loader cache is rebuilt, which is when the system
+    libraries may have changed.
+
+    Returns:
+        str: a hex digest
+    """
+    uname = platform.uname()
+    parts = [sys.platform, uname.system, uname.release, uname.version, uname.machine,
+             platform.mac_ver()[0], os.environ.get('DEVELOPER_DIR', '')]
+    for filename in LOADER_CACHES:
+        try:
+            parts.append('{0}:{1}'.format(filename, os.stat(filename).st_mtime_ns))
+        except OSError:
+            continue
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class ExternalIndex(object):
+
+    FILENAME = 'external-index.sqlite'
+
+    SCHEMA = 1
+
+    def __init__(self, directory, fingerprint=None):
+        """
+        SQLite-backed index of the scan results of external libraries
+
+        Unlike :class:`ScanCache` it also stores the resolved
+        dependents, so an indexed library is neither parsed nor
+        resolved again. Meant to be long-lived and shared by all
+        roots. Only use from a single thread.
+
+        Args:
+            directory (str or None): the directory holding the index
+                file, or ``None`` for an index in memory that only
+                lasts as long as this object
+            fingerprint (str or None): the entries of a different
+                fingerprint are discarded. Default:
+                :func:`system_fingerprint`
+        """
+        if directory is None:
+            self._filename = ':memory:'
+        else:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._filename = os.path.join(directory, self.FILENAME)
+        self._db = sqlite3.connect(self._filename)
+        self._fingerprint = system_fingerprint() if fingerprint is None else fingerprint
+        self._init_schema()
+        self.hits = 0
+        self.misses = 0
+
+    def _init_schema(self):
+        db = self._db
+        version, = db.execute('PRAGMA user_version').fetchone()
+        if version != self.SCHEMA:
+            db.execute('DROP TABLE IF EXISTS meta')
+            db.execute('DROP TABLE IF EXISTS library')
+            db.execute('PRAGMA user_version = {0}'.format(self.SCHEMA))
+        db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS library (
+                path TEXT PRIMARY KEY,
+                dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER,
+                linker_paths TEXT,
+                dependents TEXT
+            )""")
+        row = db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != self._fingerprint:
+            if row is not None:
+                log.info('System changed, discarding external library index {0}'.format(
+                    self._filename))
+            db.execute('DELETE FROM library')
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)",
+                       (self._fingerprint,))
+        db.commit()
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def __len__(self):
+        count, = self._db.execute('SELECT COUNT(*) FROM library').fetchone()
+        return count
+
+    def get(self, path):
+        """
+        Return the indexed scan results of a library
+
+        Returns:
+            pair ``(linker_paths, dependents)`` with the dependents as
+            strings, or ``None`` if the library is not indexed or has
+            changed
+        """
+        try:
+            signature = stat_signature(os.stat(str(path)))
+        except OSError:
+            signature = None
+        row = self._db.execute(
+            'SELECT dev, ino, size, mtime, linker_paths, dependents FROM library WHERE path = ?',
+            (str(path),)).fetchone()
+        if row is None or tuple(row[:4]) != signature:
+            self.misses += 1
+            stats.count('index_misses')
+            return None
+        self.hits += 1
+        stats.count('index_hits')
+        return tuple(json.loads(row[4])), json.loads(row[5])
+
+    def put(self, path, linker_paths, dependents):
+        """
+        Store the scan results for the current contents of ``path``
+        """
+        signature = stat_signature(os.stat(str(path)))
+        self._db.execute(
+            'INSERT OR REPLACE INTO library VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (str(path),) + signature + (
+                json.dumps(list(linker_paths)),
+                json.dumps([str(dependent) for dependent in dependents])))
+
+    def close(self):
+        log.info('External library index {0}: {1} hits, {2} misses'.format(
+            self._filename, self.hits, self.misses))
+        self._db.commit()
+        self._db.close()
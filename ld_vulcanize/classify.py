@@ -0,0 +1,149 @@
+"""
+Classify Files by their Header
+
+The magic number decides whether a file is a binary, the rest of the
+header whether it is an executable or a shared library. File names are
+only used to skip files that are certainly not binaries. Shared
+libraries are found whatever their name, so every other file is
+opened, but only its first four bytes are read. Executables need one
+of the executable bits, the dynamic section is only parsed for those
+that might be position-independent executables.
+"""
+
+import os
+import stat
+import struct
+
+from ld_vulcanize import stats
+from ld_vulcanize.tool import macho
+from ld_vulcanize.tool import elf
+from ld_vulcanize.tool.mapped import map_file
+
+
+MACHO = 'macho'
+ELF = 'elf'
+
+EXECUTABLE = 'executable'
+SHARED_LIBRARY = 'shared_library'
+
+MAGIC = frozenset([elf.ELF_MAGIC] + [struct.pack('>I', magic) for magic in (
+    macho.FAT_MAGIC, macho.FAT_MAGIC_64, macho.MH_MAGIC, macho.MH_MAGIC_64,
+    macho.MH_CIGAM, macho.MH_CIGAM_64)])
+
+# enough for the ELF e_type and the first fat_arch_64 offset
+HEADER_SIZE = 24
+
+EXECUTABLE_BITS = stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+
+NON_BINARY_EXT = frozenset([
+    '.h', '.hh', '.hpp', '.hxx', '.c', '.cc', '.cpp', '.cxx', '.f', '.f90',
+    '.py', '.pyc', '.pyo', '.pyi', '.pxd', '.pyx', '.pl', '.pm', '.rb', '.sh',
+    '.txt', '.md', '.rst', '.html', '.htm', '.css', '.js', '.json', '.xml',
+    '.tex', '.info', '.man', '.mo', '.po', '.pc', '.cmake', '.la', '.a',
+    '.png', '.jpg', '.gif', '.svg', '.ico', '.pdf', '.ps',
+    '.gz', '.bz2', '.xz', '.zip', '.tar', '.jar',
+])
+
+
+def _macho_kind(filetype, executable):
+    if filetype == macho.MH_EXECUTE:
+        return EXECUTABLE if executable else None
+    if filetype in (macho.MH_DYLIB, macho.MH_BUNDLE):
+        return SHARED_LIBRARY
+    return None
+
+
+def _classify_macho(f, head, executable):
+    magic, = struct.unpack_from('>I', head)
+    if magic in (macho.FAT_MAGIC, macho.FAT_MAGIC_64):
+        nfat_arch, = struct.unpack_from('>I', head, 4)
+        if not 0 < nfat_arch < 32:
+            return None   # Java class files share the magic number
+        # the offset of the first fat_arch or fat_arch_64
+        offset_format = '>I' if magic == macho.FAT_MAGIC else '>Q'
+        if len(head) < 16 + struct.calcsize(offset_format):
+            return None
+        offset, = struct.unpack_from(offset_format, head, 16)
+        f.seek(offset)
+        head = f.read(16)
+        stats.count('bytes_read', len(head))
+        if len(head) < 16:
+            return None
+        magic, = struct.unpack_from('>I', head)
+    if magic in (macho.MH_MAGIC, macho.MH_MAGIC_64):
+        endian = '>'
+    elif magic in (macho.MH_CIGAM, macho.MH_CIGAM_64):
+        endian = '<'
+    else:
+        return None
+    filetype, = struct.unpack_from(endian + 'I', head, 12)
+    return _macho_kind(filetype, executable)
+
+
+def _classify_elf(f, head, executable):
+    ei_class, ei_data = bytearray(head[4:6])
+    if ei_class not in (elf.ELFCLASS32, elf.ELFCLASS64):
+        return None
+    if ei_data == elf.ELFDATA2LSB:
+        endian = '<'
+    elif ei_data == elf.ELFDATA2MSB:
+        endian = '>'
+    else:
+        return None
+    e_type, = struct.unpack_from(endian + 'H', head, 16)
+    if e_type == elf.ET_EXEC:
+        return EXECUTABLE if executable else None
+    if e_type != elf.ET_DYN:
+        return None
+    if not executable:
+        return SHARED_LIBRARY
+    try:
+        with map_file(f) as view:
+            is_pie = elf.ElfFile(view).is_pie
+    except elf.ElfError:
+        return None
+    return EXECUTABLE if is_pie else SHARED_LIBRARY
+
+
+def classify_file(path, st=None):
+    """
+    Classify a file by its header
+
+    Args:
+        path: the file
+        st: the ``stat`` result of the file, if already known
+
+    Returns:
+        pair ``(format, kind)``. The format is one of :data:`MACHO`,
+        :data:`ELF`, the kind one of :data:`EXECUTABLE` and
+        :data:`SHARED_LIBRARY`. Both are ``None`` if the file is not a
+        binary.
+    """
+    filename = str(path)
+    if os.path.splitext(filename)[1] in NON_BINARY_EXT:
+        return None, None
+    if st is not None and st.st_size < 16:
+        return None, None
+    try:
+        f = open(filename, 'rb')
+    except (IOError, OSError):
+        return None, None
+    stats.count('files_opened')
+    with f:
+        head = f.read(4)
+        stats.count('bytes_read', len(head))
+        if head not in MAGIC:
+            return None, None
+        if st is None:
+            st = os.fstat(f.fileno())
+        executable = bool(st.st_mode & EXECUTABLE_BITS)
+        rest = f.read(HEADER_SIZE - 4)
+        stats.count('bytes_read', len(rest))
+        head += rest
+        if len(head) < 20:
+            return None, None
+        if head.startswith(elf.ELF_MAGIC):
+            kind = _classify_elf(f, head, executable)
+            return (ELF, kind) if kind else (None, None)
+        kind = _classify_macho(f, head, executable)
+        return (MACHO, kind) if kind else (None, None)
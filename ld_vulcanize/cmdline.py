@@ -8,9 +8,20 @@ import os
 import warnings
 import argparse
 
+from ld_vulcanize import stats
+from ld_vulcanize.stats import Stats
 from ld_vulcanize.logger import log
 from ld_vulcanize.path import Path
-from ld_vulcanize.find import ArtifactFinder
+from ld_vulcanize.find import read_file_list
+from ld_vulcanize.rules import Rules, PRESETS, read_patterns
+from ld_vulcanize.cache import ScanCache, ExternalIndex
+from ld_vulcanize.manifest import Manifest
+from ld_vulcanize.session import Session, SessionError, read_roots
+from ld_vulcanize.tool import set_backend, set_engine, set_dry_run
+from ld_vulcanize.parallel import default_jobs
+
+
+REWRITE_MODES = ('relative', 'absolute', 'rpath')
 
 
 description = \
@@ -24,13 +35,116 @@ def make_parser():
         '--log', dest='log', default=None,
         help='one of [DEBUG, INFO, ERROR, WARNING, CRITICAL]')
     parser.add_argument(
-        '--path', dest='path', required=True,
-        help='root of the directory tree to operate on')
+        '--path', dest='path', action='append', default=[],
+        help="""root of the directory tree to operate on. Can be given
+        several times, the roots are processed in one session sharing
+        the scanned external libraries""")
+    parser.add_argument(
+        '--roots-from', dest='roots_from', default=None,
+        help="""file listing further roots, one per line, or - for
+        stdin""")
     parser.add_argument(        
         '--rewrite', dest='rewrite', default='readonly',
-        help="""one of [readonly, relative, absolute]. How to rewrite the library
-        search paths. Default: readonly (no changes written to
-        disk)""")
+        help="""one of [readonly, relative, absolute, rpath]. How to rewrite
+        the library search paths. rpath loads the internal libraries
+        through @rpath (OSX) with a minimal search path. Default:
+        readonly (no changes written to disk)""")
+    parser.add_argument(
+        '--backend', dest='backend', default='native',
+        help="""one of [native, otool]. How to read the binaries. Default:
+        native (in-process parser)""")
+    parser.add_argument(
+        '--engine', dest='engine', default='sync',
+        help="""one of [sync, asyncio]. How the otool backend runs the
+        external tools. asyncio runs up to --jobs of them
+        concurrently. Default: sync""")
+    parser.add_argument(
+        '--jobs', dest='jobs', type=int, default=None,
+        help='number of concurrent jobs. Default: number of CPUs')
+    parser.add_argument(
+        '--hardlinks', dest='hardlinks', default='error',
+        help="""one of [split, symlink, error]. What to do with hardlinked
+        binaries in different directories, which need different
+        library paths: split them into copies, replace all but one by
+        symlinks, or refuse to rewrite. Default: error""")
+    parser.add_argument(
+        '--cache-dir', dest='cache_dir', default=None,
+        help="""directory for the persistent scan cache, for example the
+        root. Default: no cache""")
+    parser.add_argument(
+        '--index-dir', dest='index_dir', default=None,
+        help="""directory for the persistent index of the external
+        libraries, shared by all roots and discarded when the
+        operating system changes, for example ~/.cache/ld-vulcanize.
+        Default: no index""")
+    parser.add_argument(
+        '--files-from', dest='files_from', default=None,
+        help="""file listing the installed files below the root, one per
+        line or NUL-separated, or - for stdin. Only these are
+        classified instead of walking the root, libraries they load
+        are still found. Needs a single root""")
+    parser.add_argument(
+        '--exclude', dest='patterns', action='append', default=[],
+        help="""gitignore-style pattern of files and directories to skip,
+        relative to the root. Excluded directories are not entered,
+        their binaries are not rewritten unless another binary loads
+        them. Cannot be combined with --files-from. Can be given several times,
+        the last matching --exclude or --include wins""")
+    parser.add_argument(
+        '--include', dest='patterns', action='append', type=lambda pattern: '!' + pattern,
+        help='pattern of files and directories to keep despite an earlier --exclude')
+    parser.add_argument(
+        '--exclude-from', dest='exclude_from', default=None,
+        help="""file of gitignore-style patterns, applied before --exclude
+        and --include""")
+    parser.add_argument(
+        '--preset', dest='presets', action='append', default=[],
+        help="""one of [{0}]. Built-in exclude patterns, applied first.
+        default skips version control, documentation, headers and
+        Python metadata. Can be given several times""".format(
+            ', '.join(sorted(PRESETS))))
+    parser.add_argument(
+        '--since', dest='since', default=None,
+        help="""manifest file of the previous run. Files that are still in
+        the target state are skipped, and the manifest is updated
+        for the next run""")
+    parser.add_argument(
+        '--impact', dest='impact', default=None,
+        help="""shared library to query. Instead of rewriting, list all
+        binaries that load it directly or indirectly""")
+    parser.add_argument(
+        '--graph', dest='graph', default=None,
+        help="""file to save the dependency graph to after searching the
+        root. If it exists, --impact queries it instead of searching
+        the root again; delete it when the tree changes. Needs a
+        single root""")
+    parser.add_argument(
+        '--analyze', dest='analyze', default=None,
+        help="""one of [loadcost]. Instead of rewriting, print a JSON
+        report. loadcost predicts the libraries loaded and the files
+        probed by the dynamic loader for each executable""")
+    parser.add_argument(
+        '--dry-run', dest='dry_run', action='store_true', default=False,
+        help="""print the install_name_tool (OSX) or patchelf (Linux)
+        commands equivalent to the rewrite instead of changing any
+        file""")
+    parser.add_argument(
+        '--stream', dest='stream', action='store_true', default=False,
+        help="""rewrite while the tree is still being searched, without
+        building the dependency graph. Only for relative, absolute
+        and rpath rewrites, cannot be combined with --since,
+        --files-from, --cache-dir or --index-dir""")
+    parser.add_argument(
+        '--stats', dest='stats', action='store_true', default=False,
+        help="""print the time of each phase and counters like files
+        opened and subprocesses spawned to stderr""")
+    parser.add_argument(
+        '--stats-json', dest='stats_json', default=None,
+        help='write the statistics of --stats to this JSON file')
+    parser.add_argument(
+        '--profile', dest='profile', default=None,
+        help="""run under cProfile and write the profile to this file,
+        for example to inspect with pstats""")
     return parser
 
 
@@ -42,19 +156,171 @@ def launch():
         import logging
         level = getattr(logging, args.log)
         log.setLevel(level=level)
+    set_backend(args.backend)
+    set_engine(args.engine, args.jobs or default_jobs())
+    set_dry_run(args.dry_run)
+    if args.stream and (args.rewrite not in REWRITE_MODES or args.since is not None
+                        or args.impact is not None or args.analyze is not None
+                        or args.files_from is not None or args.cache_dir is not None
+                        or args.index_dir is not None or args.graph is not None):
+        parser.error('--stream needs --rewrite=relative, absolute or rpath, and cannot '
+                     'be combined with --since, --impact, --analyze, --files-from, '
+                     '--cache-dir, --index-dir or --graph')
+    roots = list(args.path)
+    if args.roots_from is not None:
+        roots.extend(read_roots(args.roots_from))
+    if not roots:
+        parser.error('--path or --roots-from is required')
+    if args.files_from is not None and len(roots) != 1:
+        parser.error('--files-from needs a single root')
+    if args.graph is not None and len(roots) != 1:
+        parser.error('--graph needs a single root')
+    patterns = list(args.patterns)
+    if args.files_from is not None and (patterns or args.exclude_from is not None
+                                        or args.presets):
+        parser.error('--files-from cannot be combined with --exclude, --include, '
+                     '--exclude-from or --preset')
+    if args.exclude_from is not None:
+        patterns = read_patterns(args.exclude_from) + patterns
+    try:
+        rules = Rules(patterns, presets=args.presets)
+    except ValueError as error:
+        parser.error(str(error))
+
+    cache = index = None
+    if args.cache_dir is not None:
+        cache = ScanCache(args.cache_dir)
+    if args.index_dir is not None:
+        index = ExternalIndex(os.path.expanduser(args.index_dir))
+    session = Session(jobs=args.jobs, cache=cache, index=index, hardlinks=args.hardlinks,
+                      rules=rules)
+    results = []
+    try:
+        if args.profile is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                results = profiler.runcall(run, args, session, roots)
+            finally:
+                profiler.dump_stats(args.profile)
+        else:
+            results = run(args, session, roots)
+    finally:
+        session.close()
+        if cache is not None:
+            cache.close()
+        if index is not None:
+            index.close()
+        set_engine('sync').close()
+        report_stats(args, results)
+    failed = [result for result in results if result.error is not None]
+    if len(results) == 1 and failed:
+        raise failed[0].error
+    elif failed:
+        raise SessionError(results)
+
 
-    path = Path(args.path)
-    binaries = ArtifactFinder(path)
-    
-    if args.rewrite == 'readonly':
+def report_stats(args, results):
+    """
+    Print or save the statistics, per root if there are several
+    """
+    recorder = stats.get_stats()
+    if args.stats:
+        if len(results) > 1:
+            for result in results:
+                sys.stderr.write('# {0}\n{1}\n'.format(
+                    result.root, Stats.from_dict(result.stats).format_table()))
+            sys.stderr.write('# total\n')
+        sys.stderr.write(recorder.format_table() + '\n')
+    if args.stats_json is not None:
+        recorder.save(args.stats_json,
+                      roots=dict((result.root, result.stats) for result in results))
+
+
+def run(args, session, roots):
+    """
+    Process all roots
+
+    Returns:
+        list of :class:`ld_vulcanize.session.RootResult`
+    """
+    manifest = None
+    if args.since is not None:
+        manifest = Manifest.load(args.since)
+    files = None
+    if args.files_from is not None:
+        files = read_file_list(args.files_from)
+    try:
+        results = session.run(roots, lambda root: process(args, session, root, manifest, files))
+    finally:
+        if manifest is not None and not args.dry_run:
+            manifest.save(args.since)
+    batch = len(roots) > 1
+    if args.analyze is not None:
+        from ld_vulcanize.analyze import dump
+        reports = [result.result for result in results if result.error is None]
+        if batch:
+            dump(reports, sys.stdout)
+        elif reports:
+            dump(reports[0], sys.stdout)
+    elif args.impact is not None:
+        for result in results:
+            for affected in (result.result or []):
+                print(affected)
+    elif args.rewrite in REWRITE_MODES:
+        for result in results:
+            if result.error is None:
+                print(result if batch else result.result)
+    return results
+
+
+def process(args, session, root, manifest, files=None):
+    """
+    Process one root
+
+    Returns:
+        the result of the selected action: a
+        :class:`ld_vulcanize.find.RewriteSummary`, the analysis report,
+        or the list of affected binaries
+    """
+    path = Path(root)
+    if args.stream:
+        from ld_vulcanize.pipeline import Pipeline
+        pipeline = Pipeline(path, jobs=args.jobs, rules=session.rules,
+                            hardlinks=args.hardlinks)
+        return getattr(pipeline, 'make_paths_' + args.rewrite)()
+    if args.impact is not None and args.graph is not None and os.path.exists(args.graph):
+        from ld_vulcanize.graph import DependencyGraph
+        return impact(DependencyGraph.load(args.graph), args.impact)
+    binaries = session.finder(path, files=files)
+    if args.graph is not None:
+        binaries.graph.save(args.graph)
+    if args.impact is not None:
+        return impact(binaries.graph, args.impact)
+    elif args.analyze is not None:
+        from ld_vulcanize.analyze import analyze
+        return analyze(binaries, args.analyze)
+    elif args.rewrite == 'readonly':
         binaries.pretty_print()
-    elif args.rewrite == 'relative':
-        binaries.make_paths_relative()
-    elif args.rewrite == 'absolute':
-        binaries.make_paths_absolute()
+    elif args.rewrite in REWRITE_MODES:
+        return getattr(binaries, 'make_paths_' + args.rewrite)(manifest)
     else:
         raise RuntimeError('invalid value for rewrite: {0}'.format(args.rewrite))
-        
-        
 
 
+def impact(graph, library):
+    """
+    Return the binaries that load the ``library``
+
+    Args:
+        graph (:class:`ld_vulcanize.graph.DependencyGraph`): the
+            dependency graph of the root
+        library (str): the shared library
+
+    Returns:
+        list of :class:`ld_vulcanize.path.Path`
+    """
+    path = Path.lookup(os.path.realpath(library))
+    if path is None or path not in graph:
+        return []
+    return graph.affected_by(path)
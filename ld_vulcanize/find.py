@@ -4,23 +4,152 @@ Find Files in the Filesystem
 
 import os
 import sys
+import stat
+import time
 
+from ld_vulcanize import stats
 from ld_vulcanize.logger import log
 from ld_vulcanize.path import Path
 from ld_vulcanize.binary import platform_dependent
+from ld_vulcanize.classify import classify_file
+from ld_vulcanize.parallel import parallel_map, parallel_apply
 
 
 class Find(object):
 
-    def __init__(self, root_path, factory=Path):
+    def __init__(self, root_path, factory=Path, rules=None):
+        """
+        Walk a directory tree
+
+        Args:
+            root_path: the root directory
+            factory: called with each found :class:`ld_vulcanize.path.Path`
+                when iterating
+            rules (:class:`ld_vulcanize.rules.Rules` or None): the
+                excluded files and directories. Default: none
+        """
         self._path = Path(root_path)
         self._factory = factory
+        self._rules = rules if rules else None
 
     def __iter__(self):
-       for path, dirs, files in os.walk(self._path.absolute()):
-           for filename in files:
-               yield self._factory(os.path.join(path, filename))
-    
+        for path, st in self.walk():
+            yield self._factory(path)
+
+    def walk(self):
+        """
+        Iterate over all regular files below the root
+
+        Symlinks are not followed. A symlink pointing into the root is
+        redundant as its target is found anyway, and binaries outside
+        of the root are not of interest. Hence no path needs to be
+        canonicalized, entries are interned relative to their
+        directory. Excluded directories are not entered.
+
+        Yields:
+            pairs ``(path, st)`` of :class:`ld_vulcanize.path.Path` and
+            the ``lstat`` result.
+        """
+        rules = self._rules
+        stack = [(self._path, '')]
+        while stack:
+            directory, prefix = stack.pop()
+            try:
+                entries = os.scandir(directory.absolute())
+            except OSError as error:
+                log.warning('Cannot list {0}: {1}'.format(directory, error))
+                continue
+            with entries:
+                for entry in entries:
+                    name = entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if rules is not None and rules.exclude_directory(prefix + name, name):
+                            continue
+                        stack.append((directory.child(name), prefix + name + '/'))
+                    elif entry.is_file(follow_symlinks=False):
+                        if rules is not None and rules.exclude_file(prefix + name, name):
+                            continue
+                        stats.count('files_walked')
+                        yield directory.child(name), entry.stat(follow_symlinks=False)
+
+
+class FileList(object):
+
+    def __init__(self, root_path, names):
+        """
+        Files below the root that are known in advance
+
+        Drop-in replacement for :class:`Find` when the build system
+        already knows which files it installed.
+
+        Args:
+            root_path: the root directory
+            names (iterable of str): file names, relative to the root
+                or absolute
+        """
+        self._path = Path(root_path)
+        self._names = names
+
+    def walk(self):
+        """
+        Iterate over the listed regular files
+
+        Like :meth:`Find.walk`, symlinks are skipped. Listed files that
+        do not exist are skipped with a warning.
+
+        Yields:
+            pairs ``(path, st)`` of :class:`ld_vulcanize.path.Path` and
+            the ``lstat`` result.
+
+        Raises:
+            ValueError: a listed file is not below the root
+        """
+        root = self._path.absolute()
+        seen = set()
+        for name in self._names:
+            directory, basename = os.path.split(os.path.join(root, name))
+            filename = os.path.join(os.path.realpath(directory), basename)
+            if os.path.commonpath([root, filename]) != root:
+                raise ValueError('listed file {0} is not below the root {1}'.format(filename, root))
+            try:
+                st = os.lstat(filename)
+            except OSError as error:
+                log.warning('Cannot stat {0}: {1}'.format(filename, error))
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                log.debug('Skipping {0}, not a regular file'.format(filename))
+                continue
+            path = Path.canonical(filename)
+            if path in seen:
+                continue
+            seen.add(path)
+            stats.count('files_listed')
+            yield path, st
+
+
+def read_file_list(filename):
+    """
+    Read a list of files
+
+    The names are separated by NUL characters if there are any, as
+    written by ``find -print0``, otherwise by newlines. Names are taken
+    verbatim, leading and trailing spaces are part of the name. Empty
+    lines are skipped.
+
+    Args:
+        filename (str): the file, or ``'-'`` for standard input
+
+    Returns:
+        list of str
+    """
+    if filename == '-':
+        data = sys.stdin.read()
+    else:
+        with open(filename, 'r') as f:
+            data = f.read()
+    if '\0' in data:
+        return [name for name in data.split('\0') if name]
+    return [line.rstrip('\r') for line in data.split('\n') if line.rstrip('\r')]
 
 
 class UniqueFactory(object):
@@ -30,10 +159,6 @@ class UniqueFactory(object):
     def __init__(self, factory):
         self._factory = factory
 
-    @property
-    def EXT(self):
-        return self._factory.EXT
-        
     def __call__(self, path):
         if not isinstance(path, Path):
             path = Path(path)
@@ -44,14 +169,169 @@ class UniqueFactory(object):
             self._cache[path] = obj
             return obj
 
-                   
-                   
+
+
+class RewriteSummary(object):
+
+    def __init__(self):
+        """
+        Outcome of rewriting the internal artifacts
+        """
+        self.files = 0
+        self.skipped = 0
+        self.commands = 0
+        self.elapsed = 0.0
+        self.failures = []
+
+    def __repr__(self):
+        return ('Rewrote {0} files with {1} commands in {2:.2f}s, '
+                '{3} unchanged since manifest, {4} failed').format(
+            self.files, self.commands, self.elapsed, self.skipped, len(self.failures))
+
+
+class RewriteError(ValueError):
+
+    def __init__(self, summary):
+        """
+        Rewriting failed for some artifacts
+
+        The other artifacts were still rewritten, see ``summary``.
+        """
+        self.summary = summary
+        lines = ['{0}: {1}'.format(artifact.path, error)
+                 for artifact, error in summary.failures]
+        super(RewriteError, self).__init__(
+            'failed to rewrite {0} files\n{1}'.format(len(lines), '\n'.join(lines)))
+
+
+class HardlinkError(ValueError):
+
+    def __init__(self, groups):
+        """
+        Hardlinks in different directories cannot be rewritten
+
+        Args:
+            groups (list): lists of the artifacts sharing a file
+        """
+        self.groups = groups
+        lines = [' = '.join(str(artifact.path) for artifact in group) for group in groups]
+        super(HardlinkError, self).__init__(
+            'hardlinks in different directories need different library paths, '
+            'use another hardlink policy\n{0}'.format('\n'.join(lines)))
+
+
+HARDLINK_POLICIES = ('split', 'symlink', 'error')
+
+
+def resolve_hardlinks(artifacts, inode, policy, mode):
+    """
+    Apply the hardlink policy
+
+    Links whose rewrite would change the file alike, for example
+    because they are in the same directory, are rewritten once
+    through the first of them. Absolute library paths are the same
+    for every link, in ``'absolute'`` mode there are no conflicts.
+
+    Args:
+        artifacts (list): the artifacts to rewrite, sorted
+        inode (dict): maps the path of each hardlinked artifact to its
+            ``(st_dev, st_ino)``. Links that are split are removed.
+        policy (str): one of :data:`HARDLINK_POLICIES`
+        mode (str): one of ``'relative'``, ``'absolute'``, ``'rpath'``
+
+    Returns:
+        list: the artifacts that remain to be rewritten
+
+    Raises:
+        :class:`HardlinkError`: if links need different changes and
+        the policy is ``'error'``
+    """
+    from ld_vulcanize.tool import split_hardlink, replace_by_symlink
+    groups = dict()
+    for artifact in artifacts:
+        key = inode.get(artifact.path)
+        if key is not None:
+            groups.setdefault(key, []).append(artifact)
+    skip = set()
+    conflicts = []
+    for key in sorted(groups):
+        group = groups[key]
+        if len(group) < 2:
+            continue
+        if (mode == 'absolute' or
+                len(set(artifact.path.dirname() for artifact in group)) == 1 or
+                len(set(artifact.planned_linker_paths(mode) for artifact in group)) == 1):
+            skip.update(group[1:])
+        else:
+            conflicts.append(group)
+    if conflicts and policy == 'error':
+        raise HardlinkError(conflicts)
+    for group in conflicts:
+        first = group[0]
+        for artifact in group[1:]:
+            if policy == 'split':
+                log.info('Splitting hardlink {0}'.format(artifact.path))
+                split_hardlink(artifact.path)
+                del inode[artifact.path]
+            else:
+                log.info('Replacing hardlink {0} by symlink to {1}'.format(
+                    artifact.path, first.path))
+                replace_by_symlink(artifact.path, first.path)
+                skip.add(artifact)
+    return [artifact for artifact in artifacts if artifact not in skip]
+
+
 class ArtifactFinder(object):
 
     SharedLibrary = platform_dependent(sys.platform)['shared_library']
     Executable = platform_dependent(sys.platform)['executable']
 
-    def __init__(self, path):
+    def __init__(self, path, jobs=None, cache=None, hardlinks='error', index=None,
+                 files=None, rules=None):
+        """
+        Find all binaries and their dependents
+
+        Hardlinked binaries are parsed once. Links in different
+        directories need different relative library paths, which one
+        file cannot hold; the ``hardlinks`` policy decides what
+        happens to them when rewriting.
+
+        If the ``files`` are given the root is not walked, only the
+        listed files are classified. Libraries below the root that
+        they load are still found and scanned even if not listed.
+
+        Args:
+            path: the root directory or a single binary
+            jobs (int or None): number of concurrent jobs for scanning
+                dependents. Default: number of CPUs
+            cache (:class:`ld_vulcanize.cache.ScanCache` or None): the
+                persistent cache of scan results to use
+            index (:class:`ld_vulcanize.cache.ExternalIndex` or None):
+                the persistent index of external libraries to use
+            hardlinks (str): one of :data:`HARDLINK_POLICIES`. Either
+                ``'split'`` each link into a separate copy, replace
+                all but the first link by a ``'symlink'``, or raise
+                :class:`HardlinkError`
+            files (iterable of str or None): the files below the root
+                to consider, relative to the root or absolute.
+                Default: walk the root
+            rules (:class:`ld_vulcanize.rules.Rules` or None): the
+                files and directories to skip when walking the root.
+                Default: none
+
+        Raises:
+            ValueError: ``files`` are given but the path is not a
+                directory, or a listed file is not below it
+        """
+        if hardlinks not in HARDLINK_POLICIES:
+            raise ValueError('hardlinks must be one of {0}, got {1}'.format(
+                HARDLINK_POLICIES, hardlinks))
+        self._jobs = jobs
+        self._cache = cache
+        self._index = index
+        self._hardlink_policy = hardlinks
+        self._files = files
+        self._rules = rules
         self._shared_library_factory = UniqueFactory(self.SharedLibrary)
         self._executable_factory = UniqueFactory(self.Executable)
         path = Path(path)
@@ -59,23 +339,42 @@ class ArtifactFinder(object):
         if path.is_dir():
             self._root_path = path
             self._init_binaries()
+        elif files is not None:
+            raise ValueError('a file list needs a root directory, got {0}'.format(path))
         else:
             root_path, filename = os.path.split(path.absolute())
             self._root_path = Path(root_path)
             self._init_binary(path)
-        self._init_dependents()
+        with stats.phase('parse'):
+            self._init_dependents()
         self._init_post()
-        self._init_links()
+        with stats.phase('link'):
+            self._init_links()
             
     @property
     def root_path(self):
         return self._root_path
 
+    @property
+    def walks_whole_tree(self):
+        """
+        Whether every file below the root was considered
+
+        Returns:
+            bool: ``False`` if only listed files were classified or the
+            rules skipped some of them. A library below the root that
+            is not internal is then not an error, it was just not seen.
+        """
+        return self._files is None and not self._rules
+
     def _init_pre(self):
         self._shlib_name = dict()
         self._internal_path = dict()
         self._external_path = dict()
         self._executable = set()
+        self._graph = None
+        self._inode = dict()
+        self._inode_kind = dict()
 
     def _init_post(self):
         self._internal_shlib = frozenset(self._internal_path.values())
@@ -101,35 +400,185 @@ class ArtifactFinder(object):
             artifact._init_shlib(internal, external)
         
     def _init_binaries(self):
-        log.info('Searching binaries {0}'.format(self.root_path))
-        find = Find(self._root_path)
+        if self._files is None:
+            log.info('Searching binaries {0}'.format(self.root_path))
+            find = Find(self._root_path, rules=self._rules)
+        else:
+            log.info('Reading listed binaries {0}'.format(self.root_path))
+            find = FileList(self._root_path, self._files)
         count = 0
-        for path in iter(find):
-            if path in self._root_path:   # skip symlinked binaries
-                self._init_binary(path)
-                count += 1
+        start = time.time()
+        classify = 0.0
+        for path, st in find.walk():
+            if st.st_nlink > 1:
+                self._inode[path] = (st.st_dev, st.st_ino)
+            classify_start = time.time()
+            self._init_binary(path, st)
+            classify += time.time() - classify_start
+            count += 1
+        stats.add_time('classify', classify)
+        stats.add_time('walk', time.time() - start - classify)
         log.info('Found {0} files'.format(count))
 
-    def _init_binary(self, path):            
-        if self.SharedLibrary.is_file(path):
+    def _init_binary(self, path, st=None):
+        kind = self._classify(path, st)
+        if kind == self.SharedLibrary.KIND:
             self._make_shared_library(path)
-        elif self.Executable.is_file(path):
+        elif kind == self.Executable.KIND:
             self._make_executable(path)
         else:
             pass  # not interesting file
 
+    def _classify(self, path, st=None):
+        key = self._inode.get(path)
+        if key in self._inode_kind:
+            stats.count('hardlinks')
+            return self._inode_kind[key]
+        if key is not None:
+            kind = self._inode_kind[key] = self._classify_file(path, st)
+            return kind
+        return self._classify_file(path, st)
+
+    def _classify_file(self, path, st=None):
+        if self._cache is not None:
+            found, kind = self._cache.get_kind(path, st)
+            if found:
+                return kind
+        file_format, kind = classify_file(path, st)
+        if file_format != self.Executable.FORMAT:
+            kind = None
+        if self._cache is not None:
+            self._cache.put(path, kind, st=st)
+        return kind
+
+    def _scan(self, artifacts):
+        """
+        Run ``find_dependents`` concurrently
+
+        Only artifacts that are not in the scan cache are parsed, and
+        hardlinks only once. The dependents are resolved for each link
+        separately since they may depend on its directory.
+
+        Returns:
+            list: the found dependents of each artifact, in the same order
+        """
+        cache = self._cache
+        cached = [cache.get_linker_paths(artifact.path) if cache else None
+                  for artifact in artifacts]
+        files = dict()
+        for artifact, hit in zip(artifacts, cached):
+            if hit is None:
+                files.setdefault(self._inode.get(artifact.path, artifact.path), artifact)
+        keys = list(files)
+        parsed = dict(zip(keys, self.SharedLibrary.find_linker_paths_many(
+            [files[key] for key in keys], self._jobs)))
+
+        def scan(item):
+            artifact, linker_paths = item
+            if linker_paths is None:
+                linker_paths = parsed[self._inode.get(artifact.path, artifact.path)]
+            return linker_paths, tuple(artifact.find_dependents(linker_paths))
+
+        results = parallel_map(scan, zip(artifacts, cached), self._jobs)
+        if cache is not None:
+            for artifact, hit, (linker_paths, dependents) in zip(artifacts, cached, results):
+                if hit is None:
+                    cache.put(artifact.path, artifact.KIND, linker_paths)
+        return [dependents for linker_paths, dependents in results]
+
+    def _scan_external(self, artifacts):
+        """
+        Scan the external libraries that are not in the index
+
+        Libraries that are not on disk, like the system libraries in
+        the dyld shared cache, are known externals without
+        dependents.
+
+        Returns:
+            list: the found dependents of each artifact, in the same order
+        """
+        index = self._index
+        result = [None] * len(artifacts)
+        pending = []
+        for i, artifact in enumerate(artifacts):
+            if not os.path.exists(artifact.path.absolute()):
+                log.debug('{0} is not on disk, assuming it is in the loader cache'.format(
+                    artifact.path))
+                result[i] = artifact._restore((), ())
+                continue
+            indexed = None if index is None else index.get(artifact.path)
+            if indexed is None:
+                pending.append(i)
+            else:
+                result[i] = artifact._restore(*indexed)
+        scanned = self._scan([artifacts[i] for i in pending])
+        for i, dependents in zip(pending, scanned):
+            result[i] = dependents
+            if index is not None:
+                index.put(artifacts[i].path, artifacts[i].linker_paths, dependents)
+        return result
+
+    def _sorted(self, artifacts):
+        return sorted(artifacts, key=lambda artifact: artifact.path.absolute())
+
+    def _inherit_search_paths(self, artifacts):
+        """
+        Pass the search paths on along the loader chain
+
+        Args:
+            artifacts: the scanned artifacts
+
+        Returns:
+            list: the internal libraries whose dependents must be
+            resolved again
+        """
+        stale = set()
+        for artifact in artifacts:
+            passed = artifact.passed_search_path()
+            if not passed:
+                continue
+            for path in artifact.dependents:
+                shlib = self._internal_path.get(path)
+                if shlib is not None and shlib.inherit_search_path(passed):
+                    stale.add(shlib)
+        return self._sorted(stale)
+
     def _init_dependents(self):
-        log.info('Searching executable dependencies')
-        for exe in self._executable:
-            exe._init_dependents(self, self._make_shared_library)
-        log.info('Searching shared library dependencies')
-        for shlib in self._internal_path.values():
-            shlib._init_dependents(self, self._make_shared_library)
+        executables = self._sorted(self._executable)
+        internal = self._sorted(self._internal_path.values())
+        log.info('Searching executable and shared library dependencies')
+        pending = executables + internal
+        found = self._scan(pending)
+        scanned = set(pending)
+        while pending:
+            for artifact, dependents in zip(pending, found):
+                artifact._init_dependents(self, self._make_shared_library, dependents)
+            # libraries also search the paths of the binaries loading them
+            stale = self._inherit_search_paths(self._sorted(scanned))
+            # internal libraries that were neither walked nor listed
+            unscanned = self._sorted(shlib for shlib in self._internal_path.values()
+                                     if shlib not in scanned)
+            scanned.update(unscanned)
+            stale = [shlib for shlib in stale if shlib not in unscanned]
+            pending = stale + unscanned
+            found = [tuple(shlib.find_dependents(shlib.linker_paths)) for shlib in stale]
+            found += self._scan(unscanned)
         num_internal = len(self._internal_path)
-        for shlib in self._external_path.values():
-            # Do not create new shared library objects from dependents
-            shlib._init_dependents(self)
+        external = self._sorted(self._external_path.values())
+        scanned = set()
+        while external:
+            # follow the external libraries transitively, the loader does
+            for shlib, dependents in zip(external, self._scan_external(external)):
+                shlib._init_dependents(self, self._make_shared_library, dependents)
+            scanned.update(external)
+            external = self._sorted(shlib for shlib in self._external_path.values()
+                                    if shlib not in scanned)
         assert num_internal == len(self._internal_path), 'external libraries cannot link internal ones'
+        everything = (list(self._executable) + list(self._internal_path.values()) +
+                      list(self._external_path.values()))
+        for artifact in self._sorted(everything):
+            for name in artifact.missing:
+                log.warning('{0} needs {1}, which cannot be found'.format(artifact.path, name))
         log.info('Found {0} external shared libraries'.format(len(self._external_path)))
         
     def _make_shared_library(self, path):
@@ -139,6 +588,8 @@ class ArtifactFinder(object):
         else:
             self._external_path[shlib.path] = shlib
         if shlib.filename in self._shlib_name:
+            if self._shlib_name[shlib.filename] is shlib:
+                return   # already known, reached again from another dependent
             if self._shlib_name[shlib.filename] is not None:
                 log.info('Duplicate library filename: {0} and {1}'.format(
                     shlib.path,
@@ -172,12 +623,13 @@ class ArtifactFinder(object):
         Project-External Shared Libraries
 
         This are all linked shared libraries that are outside of the
-        specified project root. They are not transitively closed, that
-        is, the external libraries in the output may link to further
-        external libraries that are not in the output.
+        specified project root. They are transitively closed, the
+        libraries that external libraries link are followed like the
+        loader does, so the dependency graph and the load cost
+        analysis see everything that gets loaded. They are resolved
+        along their own search path only, not the inherited one.
 
-        Since we can only modify :meth:`internal_shlib` libraries we
-        do not need the transitive closure.
+        Only the :meth:`internal_shlib` libraries are rewritten.
         """
         return frozenset(self._external_shlib)
         
@@ -188,6 +640,20 @@ class ArtifactFinder(object):
         """
         return self._executable
 
+    @property
+    def graph(self):
+        """
+        The dependency graph of all artifacts
+
+        Returns:
+            :class:`ld_vulcanize.graph.DependencyGraph`, built on first use
+        """
+        if self._graph is None:
+            from ld_vulcanize.graph import DependencyGraph
+            self._graph = DependencyGraph.build(
+                list(self.executable) + list(self.internal_shlib) + list(self.external_shlib))
+        return self._graph
+
     @property
     def internal_artifacts(self):
         """
@@ -213,12 +679,108 @@ class ArtifactFinder(object):
         for exe in self.executable:
             print('File {0}:'.format(exe.path))
         
-    def make_paths_relative(self):
-        for artifact in self.internal_artifacts:
-            artifact.make_paths_relative()
+    def _rewrite(self, mode, manifest=None):
+        """
+        Rewrite all internal artifacts concurrently
+
+        Args:
+            mode (str): one of ``'relative'``, ``'absolute'``, ``'rpath'``
+            manifest (:class:`ld_vulcanize.manifest.Manifest` or None):
+                the previous run. Artifacts that it records as being
+                in the target state are skipped. It is updated with
+                the new state.
+
+        Returns:
+            :class:`RewriteSummary`
+
+        Raises:
+            :class:`RewriteError`: if any artifact failed, after all
+            others have been rewritten
+            :class:`HardlinkError`: if hardlinks need different
+            changes and the policy is ``'error'``. Nothing is
+            rewritten in this case.
+        """
+        from ld_vulcanize.tool import is_dry_run, batches_commands
+        start = time.time()
+        method = 'make_paths_' + mode
+        artifacts = self._resolve_hardlinks(self._sorted(self.internal_artifacts), mode)
+        summary = RewriteSummary()
+        # in a dry run nothing is written, so there is no new state to record
+        dry_run = is_dry_run()
+        cache = None if dry_run else self._cache
+        if manifest is not None:
+            manifest.prune(artifacts, self.root_path)
+            pending = [artifact for artifact in artifacts
+                       if not manifest.is_current(artifact, mode)]
+            summary.skipped = len(artifacts) - len(pending)
+            artifacts = pending
+        if batches_commands():
+            results = self._rewrite_batch(method, artifacts)
+        else:
+            results = parallel_apply(
+                lambda artifact: getattr(artifact, method)(), artifacts, self._jobs)
+        for artifact, (commands, error) in zip(artifacts, results):
+            if error is not None:
+                log.error('Failed to rewrite {0}: {1}'.format(artifact.path, error))
+                summary.failures.append((artifact, error))
+                if manifest is not None:
+                    manifest.discard(artifact)
+                continue
+            if commands:
+                summary.files += 1
+                summary.commands += commands
+                if cache is not None:
+                    cache.put(artifact.path, artifact.KIND, artifact.linker_paths)
+            if manifest is not None and not dry_run:
+                manifest.record(artifact, mode)
+        summary.elapsed = time.time() - start
+        stats.add_time('rewrite', summary.elapsed)
+        log.info('{0}'.format(summary))
+        if summary.failures:
+            raise RewriteError(summary)
+        return summary
+
+    def _rewrite_batch(self, method, artifacts):
+        """
+        Plan the rewrites in this thread and run their commands as one batch
+
+        The engine runs the commands of different files concurrently
+        and those of one file in order.
+
+        Returns:
+            list: pairs ``(commands, exception)`` like
+            :func:`ld_vulcanize.parallel.parallel_apply`
+        """
+        from ld_vulcanize.tool import deferred_commands, get_engine
+        results = []
+        batch = []
+        for index, artifact in enumerate(artifacts):
+            state = dict(vars(artifact))
+            with deferred_commands() as argvs:
+                try:
+                    results.append((getattr(artifact, method)(), None))
+                except Exception as error:
+                    results.append((None, error))
+                    continue
+            batch.append((index, state, [(argv, lambda line: None) for argv in argvs]))
+        errors = get_engine().lines_many([job for index, state, job in batch])
+        for (index, state, job), error in zip(batch, errors):
+            if error is not None:
+                # the artifact already recorded its new linker paths
+                vars(artifacts[index]).update(state)
+                results[index] = (None, error)
+        return results
+
+    def _resolve_hardlinks(self, artifacts, mode):
+        return resolve_hardlinks(artifacts, self._inode, self._hardlink_policy, mode)
+
+    def make_paths_relative(self, manifest=None):
+        return self._rewrite('relative', manifest)
             
-    def make_paths_absolute(self):
-        for artifact in self.internal_artifacts:
-            artifact.make_paths_absolute()
+    def make_paths_absolute(self, manifest=None):
+        return self._rewrite('absolute', manifest)
+
+    def make_paths_rpath(self, manifest=None):
+        return self._rewrite('rpath', manifest)
             
 
@@ -0,0 +1,275 @@
+"""
+Dependency Graph
+
+Compressed sparse row (CSR) adjacency arrays over integer artifact
+ids. Edges point from an artifact to the shared libraries it links.
+The queries run on the arrays, independent of the artifact objects.
+"""
+
+import json
+from array import array
+
+from ld_vulcanize.path import Path
+
+
+class DependencyGraph(object):
+
+    def __init__(self, nodes, offsets, targets):
+        """
+        Immutable dependency graph
+
+        Use :meth:`build` to construct it from artifacts.
+
+        Args:
+            nodes (list of :class:`ld_vulcanize.path.Path`): the
+                artifact of each id
+            offsets (array): the edges of node ``i`` are
+                ``targets[offsets[i]:offsets[i+1]]``
+            targets (array): the dependency ids
+        """
+        self._nodes = list(nodes)
+        self._index = dict((path, i) for i, path in enumerate(self._nodes))
+        self._offsets = offsets
+        self._targets = targets
+        self._reverse = None
+
+    @classmethod
+    def build(cls, artifacts):
+        """
+        Construct the graph of the artifacts and their dependents
+
+        Dependents that are not among the artifacts are ignored.
+
+        Args:
+            artifacts: iterable of
+                :class:`ld_vulcanize.binary.FilesystemArtifact`. Ids
+                are assigned in sorted path order.
+        """
+        artifacts = sorted(artifacts, key=lambda artifact: artifact.path.absolute())
+        nodes = [artifact.path for artifact in artifacts]
+        index = dict((path, i) for i, path in enumerate(nodes))
+        offsets = array('l', [0])
+        targets = array('l')
+        for artifact in artifacts:
+            seen = set()
+            for path in artifact.dependents:
+                target = index.get(path)
+                if target is not None and target not in seen:
+                    seen.add(target)
+                    targets.append(target)
+            offsets.append(len(targets))
+        return cls(nodes, offsets, targets)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _lookup(self, path):
+        """
+        Return the id of a path or string, or ``None`` if not a node
+
+        Strings are looked up without interning them.
+        """
+        if not isinstance(path, Path):
+            path = Path.lookup(path)
+            if path is None:
+                return None
+        return self._index.get(path)
+
+    def __contains__(self, path):
+        return self._lookup(path) is not None
+
+    @property
+    def num_edges(self):
+        return len(self._targets)
+
+    @property
+    def nodes(self):
+        return tuple(self._nodes)
+
+    def _id(self, path):
+        node = self._lookup(path)
+        if node is None:
+            raise ValueError('{0} is not in the dependency graph'.format(path))
+        return node
+
+    def _ids(self, paths):
+        if isinstance(paths, (Path, str)):
+            paths = [paths]
+        return [self._id(path) for path in paths]
+
+    def _paths(self, ids):
+        return [self._nodes[i] for i in ids]
+
+    def _reversed(self):
+        """
+        Return the CSR arrays of the transposed graph, built once
+        """
+        if self._reverse is not None:
+            return self._reverse
+        n = len(self._nodes)
+        counts = array('l', [0]) * (n + 1)
+        for target in self._targets:
+            counts[target + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        offsets = array('l', counts)
+        fill = array('l', counts)
+        sources = array('l', [0]) * len(self._targets)
+        for source in range(n):
+            for k in range(self._offsets[source], self._offsets[source + 1]):
+                target = self._targets[k]
+                sources[fill[target]] = source
+                fill[target] += 1
+        self._reverse = (offsets, sources)
+        return self._reverse
+
+    def _reachable(self, starts, offsets, targets):
+        seen = bytearray(len(self._nodes))
+        stack = list(starts)
+        result = []
+        while stack:
+            node = stack.pop()
+            for k in range(offsets[node], offsets[node + 1]):
+                target = targets[k]
+                if not seen[target]:
+                    seen[target] = 1
+                    result.append(target)
+                    stack.append(target)
+        return sorted(result)
+
+    def dependencies(self, path):
+        """
+        Return the shared libraries that ``path`` links directly
+        """
+        node = self._id(path)
+        return self._paths(self._targets[self._offsets[node]:self._offsets[node + 1]])
+
+    def dependents(self, path):
+        """
+        Return the artifacts that link ``path`` directly
+        """
+        offsets, sources = self._reversed()
+        node = self._id(path)
+        return self._paths(sources[offsets[node]:offsets[node + 1]])
+
+    def closure(self, paths):
+        """
+        Return everything loaded transitively by the ``paths``
+
+        Args:
+            paths: a path or an iterable of paths
+
+        Returns:
+            list of :class:`ld_vulcanize.path.Path` sorted by id. The
+            starting points are only included if they are reached
+            through a cycle.
+        """
+        return self._paths(self._reachable(self._ids(paths), self._offsets, self._targets))
+
+    def affected_by(self, paths):
+        """
+        Return the artifacts affected if the ``paths`` move
+
+        These are all artifacts that load any of them, directly or
+        transitively.
+        """
+        offsets, sources = self._reversed()
+        return self._paths(self._reachable(self._ids(paths), offsets, sources))
+
+    def strongly_connected_components(self):
+        """
+        Return the strongly connected components
+
+        Uses an iterative version of Tarjan's algorithm.
+
+        Returns:
+            list of lists of :class:`ld_vulcanize.path.Path`. A
+            component is emitted only after all components it depends
+            on, so this is also a topological order of the
+            condensation.
+        """
+        n = len(self._nodes)
+        offsets, targets = self._offsets, self._targets
+        index = array('l', [-1]) * n
+        lowlink = array('l', [0]) * n
+        on_stack = bytearray(n)
+        stack = []
+        components = []
+        counter = 0
+        for root in range(n):
+            if index[root] >= 0:
+                continue
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            work = [(root, offsets[root])]
+            while work:
+                node, k = work[-1]
+                if k < offsets[node + 1]:
+                    work[-1] = (node, k + 1)
+                    target = targets[k]
+                    if index[target] < 0:
+                        index[target] = lowlink[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        work.append((target, offsets[target]))
+                    elif on_stack[target]:
+                        lowlink[node] = min(lowlink[node], index[target])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(self._paths(sorted(component)))
+        return components
+
+    def topological_order(self):
+        """
+        Return all artifacts, each after the libraries it links
+
+        Raises:
+            ValueError: if the graph has a cycle
+        """
+        result = []
+        for component in self.strongly_connected_components():
+            if len(component) > 1:
+                raise ValueError('dependency cycle: {0}'.format(
+                    ', '.join(str(path) for path in component)))
+            result.extend(component)
+        return result
+
+    def save(self, filename):
+        """
+        Write the graph to a JSON file
+        """
+        data = dict(
+            nodes=[path.absolute() for path in self._nodes],
+            offsets=self._offsets.tolist(),
+            targets=self._targets.tolist(),
+        )
+        with open(filename, 'w') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a graph written by :meth:`save`
+
+        The file names are not checked against the filesystem.
+        """
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        return cls(
+            [Path.canonical(node) for node in data['nodes']],
+            array('l', data['offsets']),
+            array('l', data['targets']))
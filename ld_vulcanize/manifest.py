@@ -0,0 +1,95 @@
+"""
+Run Manifest
+
+Records the state of each rewritten artifact so that the next run can
+skip everything that is already in the target state.
+"""
+
+import os
+import json
+
+from ld_vulcanize.logger import log
+from ld_vulcanize.cache import stat_signature
+
+
+class Manifest(object):
+
+    VERSION = 1
+
+    def __init__(self, artifacts=None):
+        """
+        State of the internal artifacts after a run
+
+        Args:
+            artifacts (dict or None): map of absolute file name to a
+                dictionary with the ``mode`` the file was rewritten to,
+                its stat ``signature`` afterwards and its internal
+                ``dependents``
+        """
+        self._artifacts = dict() if artifacts is None else artifacts
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a manifest, a missing file is an empty manifest
+        """
+        if not os.path.exists(filename):
+            log.info('No previous manifest {0}'.format(filename))
+            return cls()
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != cls.VERSION:
+            log.warning('Ignoring manifest {0} with different version'.format(filename))
+            return cls()
+        return cls(data['artifacts'])
+
+    def save(self, filename):
+        data = dict(version=self.VERSION, artifacts=self._artifacts)
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.rename(tmp, filename)
+
+    def __len__(self):
+        return len(self._artifacts)
+
+    def _state(self, artifact, mode):
+        return dict(
+            mode=mode,
+            signature=list(stat_signature(os.stat(str(artifact.path)))),
+            dependents=sorted(str(shlib.path) for shlib in artifact.internal_shlib),
+        )
+
+    def is_current(self, artifact, mode):
+        """
+        Whether the artifact is unchanged since it was rewritten to ``mode``
+
+        That is, the file is unchanged and it still links to the same
+        internal shared libraries.
+        """
+        recorded = self._artifacts.get(str(artifact.path))
+        return recorded is not None and recorded == self._state(artifact, mode)
+
+    def record(self, artifact, mode):
+        self._artifacts[str(artifact.path)] = self._state(artifact, mode)
+
+    def discard(self, artifact):
+        self._artifacts.pop(str(artifact.path), None)
+
+    def prune(self, artifacts, root=None):
+        """
+        Forget all files that are not among the ``artifacts``
+
+        Args:
+            artifacts: the internal artifacts of the run
+            root (:class:`ld_vulcanize.path.Path` or None): only forget
+                files below this directory, the manifest may also hold
+                other roots. Default: forget all other files
+        """
+        keep = set(str(artifact.path) for artifact in artifacts)
+        prefix = None if root is None else os.path.join(root.absolute(), '')
+        for filename in list(self._artifacts):
+            if filename in keep:
+                continue
+            if prefix is None or filename.startswith(prefix):
+                del self._artifacts[filename]
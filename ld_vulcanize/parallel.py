@@ -0,0 +1,92 @@
+"""
+Worker Pool
+
+The expensive steps (parsing binaries, waiting for subprocesses) are
+independent per file and run on a thread pool.
+"""
+
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+
+_pool = None
+
+
+def default_jobs():
+    """
+    Return the default number of concurrent jobs
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def parallel_map(func, items, jobs=None):
+    """
+    Apply ``func`` to every item concurrently
+
+    Args:
+        func: function of one argument
+        items (iterable): the arguments
+        jobs (int or None): number of worker threads, defaults to
+            :func:`default_jobs`. Runs serially if one.
+
+    Returns:
+        list: the results in the order of the items
+    """
+    items = list(items)
+    if jobs is None:
+        jobs = default_jobs()
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    if _pool is not None:
+        return list(_pool.map(func, items))
+    with ThreadPoolExecutor(max_workers=min(jobs, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+def parallel_apply(func, items, jobs=None):
+    """
+    Apply ``func`` to every item concurrently, collecting failures
+
+    Unlike :func:`parallel_map` an exception does not abort the
+    remaining work.
+
+    Returns:
+        list: pairs ``(result, exception)`` in the order of the items.
+        The exception is ``None`` on success.
+    """
+    def safe(item):
+        try:
+            return (func(item), None)
+        except Exception as error:
+            return (None, error)
+    return parallel_map(safe, items, jobs)
+
+
+@contextlib.contextmanager
+def shared_pool(jobs=None):
+    """
+    Run all concurrent work inside the ``with`` block on one pool
+
+    Otherwise each :func:`parallel_map` starts its own threads. The
+    functions must not call :func:`parallel_map` recursively.
+
+    Args:
+        jobs (int or None): number of worker threads, defaults to
+            :func:`default_jobs`
+    """
+    global _pool
+    if jobs is None:
+        jobs = default_jobs()
+    if _pool is not None or jobs <= 1:
+        yield
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        _pool = pool
+        try:
+            yield
+        finally:
+            _pool = None
@@ -1,23 +1,162 @@
 """
 Abstraction of a path
+
+Paths are interned in a :class:`PathTable`, a :class:`Path` only holds
+the integer id of its node. Comparing and hashing paths never touches
+the filesystem.
 """
 
 import os
+import sys
+import threading
+from array import array
+
+
+class PathTable(object):
+
+    ROOT = 0
+
+    def __init__(self):
+        """
+        Interning table of canonical absolute paths
+
+        Each path is a node with a pointer to its parent directory,
+        so a path component is stored once no matter how many files
+        share it. Interning is thread-safe.
+        """
+        self._lock = threading.Lock()
+        self._children = dict()
+        self._names = ['']
+        self._parents = array('l', [-1])
+        self._depths = array('l', [0])
+
+    def __len__(self):
+        return len(self._names)
+
+    def child(self, parent, name):
+        """
+        Return the id of the entry ``name`` in the directory ``parent``
+        """
+        key = (parent, name)
+        try:
+            return self._children[key]
+        except KeyError:
+            pass
+        with self._lock:
+            node = self._children.get(key)
+            if node is None:
+                node = len(self._names)
+                self._names.append(sys.intern(name))
+                self._parents.append(parent)
+                self._depths.append(self._depths[parent] + 1)
+                self._children[key] = node
+        return node
+
+    def intern(self, path):
+        """
+        Return the id of a canonical absolute path, adding it if necessary
+        """
+        node = self.ROOT
+        for name in path.split('/'):
+            if name:
+                node = self.child(node, name)
+        return node
+
+    def lookup(self, path):
+        """
+        Return the id of a canonical absolute path or ``None`` if unknown
+        """
+        node = self.ROOT
+        for name in path.split('/'):
+            if name:
+                node = self._children.get((node, name))
+                if node is None:
+                    return None
+        return node
+
+    def parent(self, node):
+        return self._parents[node]
+
+    def name(self, node):
+        return self._names[node]
+
+    def string(self, node):
+        names = []
+        while node != self.ROOT:
+            names.append(self._names[node])
+            node = self._parents[node]
+        return '/' + '/'.join(reversed(names))
+
+    def is_ancestor(self, ancestor, node):
+        """
+        Whether ``node`` is ``ancestor`` or below it
+
+        Takes O(depth) steps up the parent pointers.
+        """
+        depths = self._depths
+        if depths[node] < depths[ancestor]:
+            return False
+        parents = self._parents
+        for i in range(depths[node] - depths[ancestor]):
+            node = parents[node]
+        return node == ancestor
 
 
 class Path(object):
 
+    __slots__ = ('_id',)
+
+    TABLE = PathTable()
+
     def __init__(self, path):
         if isinstance(path, Path):
-            self._abs = path.absolute()
-        else:
-            self._abs = os.path.abspath(os.path.realpath(path))
-        if not os.path.exists(self.absolute()):
-            raise ValueError('path must be an existing file or directory, got {0}'.format(self))
+            self._id = path._id
+            return
+        absolute = os.path.abspath(os.path.realpath(path))
+        if not os.path.exists(absolute):
+            raise ValueError('path must be an existing file or directory, got {0}'.format(absolute))
+        self._id = self.TABLE.intern(absolute)
+
+    @classmethod
+    def _from_id(cls, node):
+        obj = cls.__new__(cls)
+        obj._id = node
+        return obj
+
+    @classmethod
+    def canonical(cls, path):
+        """
+        Construct from a canonical path without touching the filesystem
+
+        Args:
+            path (str): an absolute path without symlinks to an
+                existing file or directory
+        """
+        return cls._from_id(cls.TABLE.intern(path))
+
+    @classmethod
+    def lookup(cls, path):
+        """
+        Return the path if it was interned before, without adding it
+
+        Args:
+            path (str): an absolute path, only normalized lexically
+
+        Returns:
+            :class:`Path` or ``None``
+        """
+        node = cls.TABLE.lookup(os.path.abspath(path))
+        return None if node is None else cls._from_id(node)
+
+    def child(self, name):
+        """
+        Return the directory entry ``name`` without touching the filesystem
+        """
+        return self._from_id(self.TABLE.child(self._id, name))
 
     def __repr__(self):
-        return self._abs
-        
+        return self.TABLE.string(self._id)
+
     def absolute(self):
         """
         Return the absolute path
@@ -25,14 +164,14 @@ class Path(object):
         Returns:
             str: The absolute path
         """
-        return self._abs
+        return self.TABLE.string(self._id)
 
     def is_dir(self):
         return os.path.isdir(self.absolute())
-    
+
     def is_abs(self):
         return os.path.isabs(self.absolute())
-    
+
     def relative(self, base):
         """
         Return the path relative to ``base``
@@ -43,19 +182,27 @@ class Path(object):
             return os.path.relpath(self.absolute(), base.absolute())
 
     def dirname(self):
-        return os.path.dirname(self.absolute())
-        
+        return self.TABLE.string(max(self.TABLE.parent(self._id), PathTable.ROOT))
+
     def __hash__(self):
-        return hash(self.absolute())
-    
+        return hash(self._id)
+
     def __add__(lhs, rhs):
         return Path(os.path.join(lhs.absolute(), rhs))
 
     def __eq__(lhs, rhs):
-        if not isinstance(rhs, Path):
-            rhs = Path(rhs)
-        return lhs.absolute() == rhs.absolute()
+        """
+        Compare with another path or a string
 
-    def __contains__(self, path):
-        return path.absolute().startswith(self.absolute())
+        Strings are only normalized lexically, symlinks are not
+        resolved.
+        """
+        if isinstance(rhs, Path):
+            return lhs._id == rhs._id
+        return lhs._id == lhs.TABLE.lookup(os.path.abspath(rhs))
+
+    def __ne__(lhs, rhs):
+        return not lhs == rhs
 
+    def __contains__(self, path):
+        return self.TABLE.is_ancestor(self._id, path._id)
@@ -0,0 +1,273 @@
+"""
+Streaming Rewrite
+
+Overlaps the filesystem walk, parsing and rewriting. Each stage runs
+on its own threads and hands its results to the next stage through a
+bounded queue, so memory stays bounded and the first files are
+rewritten while the walk is still running.
+
+An artifact only needs to know which of its dependents are internal,
+that is, inside the root. Unlike
+:class:`ld_vulcanize.find.ArtifactFinder` no dependency graph is
+built.
+
+Hardlinked files are held back until the walk is complete, since only
+then all links of a file are known. They are rewritten last with the
+same hardlink policy as :class:`ld_vulcanize.find.ArtifactFinder`.
+"""
+
+import os
+import sys
+import time
+import queue
+import threading
+
+from ld_vulcanize import stats
+from ld_vulcanize.logger import log
+from ld_vulcanize.path import Path
+from ld_vulcanize.find import (
+    Find, RewriteSummary, RewriteError, HARDLINK_POLICIES, resolve_hardlinks)
+from ld_vulcanize.binary import platform_dependent
+from ld_vulcanize.classify import classify_file
+from ld_vulcanize.parallel import default_jobs
+
+
+_DONE = object()
+
+
+class _Unreadable(object):
+
+    def __init__(self, path):
+        """
+        Stands in for a file that failed before it became an artifact
+        """
+        self.path = path
+        self.filename = os.path.basename(path.absolute())
+
+
+class Pipeline(object):
+
+    SharedLibrary = platform_dependent(sys.platform)['shared_library']
+    Executable = platform_dependent(sys.platform)['executable']
+
+    def __init__(self, root_path, jobs=None, queue_size=256, rules=None, hardlinks='error'):
+        """
+        Streaming walk, parse and rewrite of a directory tree
+
+        Args:
+            root_path: the root directory
+            jobs (int or None): number of threads of the parse and
+                of the rewrite stage each. Default: number of CPUs
+            queue_size (int): capacity of the queues between stages
+            rules (:class:`ld_vulcanize.rules.Rules` or None): the
+                files and directories to skip. Default: none
+            hardlinks (str): one of
+                :data:`ld_vulcanize.find.HARDLINK_POLICIES`, see
+                :class:`ld_vulcanize.find.ArtifactFinder`
+        """
+        if hardlinks not in HARDLINK_POLICIES:
+            raise ValueError('hardlinks must be one of {0}, got {1}'.format(
+                HARDLINK_POLICIES, hardlinks))
+        self._root_path = Path(root_path)
+        if not self._root_path.is_dir():
+            raise ValueError('streaming needs a directory, got {0}'.format(root_path))
+        self._jobs = max(1, default_jobs() if jobs is None else jobs)
+        self._queue_size = queue_size
+        self._rules = rules
+        self._hardlink_policy = hardlinks
+        self._linked = []
+        self._lock = threading.Lock()
+
+    @property
+    def root_path(self):
+        return self._root_path
+
+    def _make_artifact(self, path, st):
+        file_format, kind = classify_file(path, st)
+        if file_format != self.Executable.FORMAT:
+            return None
+        if kind == self.SharedLibrary.KIND:
+            return self.SharedLibrary(path)
+        if kind == self.Executable.KIND:
+            return self.Executable(path)
+        return None
+
+    def _parse(self, artifact):
+        """
+        Resolve the dependents and split them into internal and external
+        """
+        dependents = tuple(artifact.find_dependents())
+        for name in artifact.missing:
+            log.warning('{0} needs {1}, which cannot be found'.format(artifact.path, name))
+        artifact._dependents = dependents
+        internal = []
+        external = []
+        for path in dependents:
+            if path in self._root_path:
+                internal.append(self.SharedLibrary(path))
+            else:
+                external.append(self.SharedLibrary(path))
+        artifact._init_shlib(internal, external)
+        return artifact
+
+    def _fail(self, summary, artifact, error):
+        log.error('Failed to rewrite {0}: {1}'.format(artifact.path, error))
+        with self._lock:
+            summary.failures.append((artifact, error))
+
+    def _drain(self, items):
+        """
+        Consume a queue up to the end marker
+
+        A stage that stops early must still empty its input, otherwise
+        the previous stage blocks on the full queue forever.
+        """
+        while items.get() is not _DONE:
+            pass
+
+    def _walk_stage(self, found, summary):
+        try:
+            for path, st in Find(self._root_path, rules=self._rules).walk():
+                if st.st_nlink > 1:
+                    self._linked.append((path, st))
+                else:
+                    found.put((path, st))
+        except Exception as error:
+            self._fail(summary, _Unreadable(self._root_path), error)
+
+    def _parse_stage(self, found, parsed, summary):
+        item = None
+        try:
+            while True:
+                item = found.get()
+                if item is _DONE:
+                    return
+                path, st = item
+                artifact = None
+                try:
+                    artifact = self._make_artifact(path, st)
+                    if artifact is None:
+                        continue
+                    artifact = self._parse(artifact)
+                except Exception as error:
+                    self._fail(summary, artifact or _Unreadable(path), error)
+                    continue
+                parsed.put(artifact)
+        finally:
+            if item is not _DONE:
+                self._drain(found)
+
+    def _rewrite_stage(self, parsed, method, summary):
+        artifact = None
+        try:
+            while True:
+                artifact = parsed.get()
+                if artifact is _DONE:
+                    return
+                try:
+                    commands = getattr(artifact, method)()
+                except Exception as error:
+                    self._fail(summary, artifact, error)
+                    continue
+                if commands:
+                    with self._lock:
+                        summary.files += 1
+                        summary.commands += commands
+        finally:
+            if artifact is not _DONE:
+                self._drain(parsed)
+
+    def _rewrite_hardlinks(self, mode, summary):
+        """
+        Rewrite the held back hardlinked files
+
+        Raises:
+            :class:`ld_vulcanize.find.HardlinkError`: if hardlinks
+            need different changes and the policy is ``'error'``.
+            None of the hardlinked files is rewritten in this case,
+            but the others already are.
+        """
+        inode = dict()
+        artifacts = []
+        for path, st in sorted(self._linked, key=lambda item: item[0].absolute()):
+            artifact = None
+            try:
+                artifact = self._make_artifact(path, st)
+                if artifact is None:
+                    continue
+                artifact = self._parse(artifact)
+            except Exception as error:
+                self._fail(summary, artifact or _Unreadable(path), error)
+                continue
+            inode[artifact.path] = (st.st_dev, st.st_ino)
+            artifacts.append(artifact)
+        for artifact in resolve_hardlinks(artifacts, inode, self._hardlink_policy, mode):
+            try:
+                commands = getattr(artifact, 'make_paths_' + mode)()
+            except Exception as error:
+                self._fail(summary, artifact, error)
+                continue
+            if commands:
+                summary.files += 1
+                summary.commands += commands
+
+    def _start(self, target, count, *args):
+        threads = [threading.Thread(target=target, args=args) for i in range(count)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        return threads
+
+    def _rewrite(self, mode):
+        """
+        Run all stages to completion
+
+        Args:
+            mode (str): one of ``'relative'``, ``'absolute'``, ``'rpath'``
+
+        Returns:
+            :class:`ld_vulcanize.find.RewriteSummary`
+
+        Raises:
+            :class:`ld_vulcanize.find.RewriteError`: if any artifact
+            failed, after all others have been rewritten
+            :class:`ld_vulcanize.find.HardlinkError`: see
+            :meth:`_rewrite_hardlinks`
+        """
+        start = time.time()
+        log.info('Streaming rewrite of {0}'.format(self.root_path))
+        summary = RewriteSummary()
+        self._linked = []
+        found = queue.Queue(self._queue_size)
+        parsed = queue.Queue(self._queue_size)
+        walkers = self._start(self._walk_stage, 1, found, summary)
+        parsers = self._start(self._parse_stage, self._jobs, found, parsed, summary)
+        rewriters = self._start(
+            self._rewrite_stage, self._jobs, parsed, 'make_paths_' + mode, summary)
+        for stage, threads, next_queue in ((walkers, parsers, found),
+                                           (parsers, rewriters, parsed)):
+            for thread in stage:
+                thread.join()
+            for thread in threads:
+                next_queue.put(_DONE)
+        for thread in rewriters:
+            thread.join()
+        try:
+            self._rewrite_hardlinks(mode, summary)
+        finally:
+            summary.failures.sort(key=lambda failure: failure[0].path.absolute())
+            summary.elapsed = time.time() - start
+            stats.add_time('stream', summary.elapsed)
+            log.info('{0}'.format(summary))
+        if summary.failures:
+            raise RewriteError(summary)
+        return summary
+
+    def make_paths_relative(self):
+        return self._rewrite('relative')
+
+    def make_paths_absolute(self):
+        return self._rewrite('absolute')
+
+    def make_paths_rpath(self):
+        return self._rewrite('rpath')
@@ -0,0 +1,201 @@
+"""
+Include and Exclude Rules for the Walk
+
+Patterns follow the ``.gitignore`` syntax, relative to the root:
+
+* ``*`` and ``?`` match within one path component, ``**`` across
+  components
+* a trailing ``/`` only matches directories
+* a pattern without a ``/`` (other than a trailing one) matches the
+  name at any depth, otherwise the path relative to the root
+* a leading ``!`` includes again what an earlier pattern excluded
+
+The last matching pattern wins. Excluded directories are not entered,
+so nothing below them can be included again. Binaries in excluded
+directories are neither found nor rewritten, except for libraries that
+a found binary loads.
+"""
+
+import re
+
+from ld_vulcanize import stats
+
+
+PRESETS = {
+    'vcs': ('.git/', '.hg/', '.svn/', '.bzr/', 'CVS/'),
+    'docs': ('**/share/doc/', '**/share/man/', '**/share/info/', '**/share/locale/',
+             '**/share/gtk-doc/'),
+    'headers': ('include/',),
+    'python': ('__pycache__/', '*.dist-info/', '*.egg-info/'),
+    'tests': ('test/', 'tests/', 'testdata/'),
+}
+
+# Python extension modules are binaries, so site-packages is not
+# excluded. Test directories may contain test programs linking the
+# internal libraries, hence not in the default either.
+PRESETS['default'] = PRESETS['vcs'] + PRESETS['docs'] + PRESETS['headers'] + PRESETS['python']
+
+
+def _translate(pattern):
+    """
+    Return the regular expression for a glob pattern
+    """
+    i = 0
+    n = len(pattern)
+    result = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            result.append('.*')
+            i += 2
+        elif c == '*':
+            result.append('[^/]*')
+            i += 1
+        elif c == '?':
+            result.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end < 0:
+                result.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                result.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end + 1
+        else:
+            result.append(re.escape(c))
+            i += 1
+    return re.compile(''.join(result) + r'\Z')
+
+
+def read_patterns(filename):
+    """
+    Read the patterns of a ``.gitignore``-style file
+
+    Empty lines and lines starting with ``#`` are skipped.
+
+    Returns:
+        list of str
+    """
+    with open(filename, 'r') as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+class Rule(object):
+
+    def __init__(self, pattern):
+        """
+        One line of the rules
+
+        Args:
+            pattern (str): a ``.gitignore`` pattern
+        """
+        self.pattern = pattern
+        self.include = pattern.startswith('!')
+        if self.include:
+            pattern = pattern[1:]
+        self.directory_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        self.anchored = '/' in pattern
+        if not pattern:
+            raise ValueError('empty pattern: {0}'.format(self.pattern))
+        self._regex = _translate(pattern.lstrip('/'))
+
+    def matches(self, path, name, is_dir):
+        """
+        Return whether the rule applies
+
+        Args:
+            path (str): the path relative to the root
+            name (str): the last component of ``path``
+            is_dir (bool): whether it is a directory
+        """
+        if self.directory_only and not is_dir:
+            return False
+        return self._regex.match(path if self.anchored else name) is not None
+
+    def __repr__(self):
+        return self.pattern
+
+
+class Rules(object):
+
+    def __init__(self, patterns=(), presets=()):
+        """
+        Decide which files and directories to skip
+
+        Args:
+            patterns (iterable of str): ``.gitignore`` patterns, applied
+                after the presets
+            presets (iterable of str): names of :data:`PRESETS`
+
+        Raises:
+            ValueError: unknown preset or invalid pattern
+        """
+        self._rules = []
+        self._file_rules = []
+        for name in presets:
+            try:
+                self.extend(PRESETS[name])
+            except KeyError:
+                raise ValueError('preset must be one of {0}, got {1}'.format(
+                    sorted(PRESETS), name))
+        self.extend(patterns)
+
+    def add(self, pattern):
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith('#'):
+            return
+        rule = Rule(pattern)
+        self._rules.append(rule)
+        if not rule.directory_only:
+            self._file_rules.append(rule)
+
+    def extend(self, patterns):
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __repr__(self):
+        return '\n'.join(repr(rule) for rule in self._rules)
+
+    def _excluded(self, rules, path, name, is_dir):
+        for rule in reversed(rules):
+            if rule.matches(path, name, is_dir):
+                return not rule.include
+        return False
+
+    def exclude_directory(self, path, name):
+        """
+        Return whether to skip a directory and everything below it
+
+        Args:
+            path (str): the directory relative to the root
+            name (str): the last component of ``path``
+        """
+        if self._excluded(self._rules, path, name, True):
+            stats.count('dirs_pruned')
+            return True
+        return False
+
+    def exclude_file(self, path, name):
+        """
+        Return whether to skip a file
+
+        Args:
+            path (str): the file relative to the root
+            name (str): the last component of ``path``
+        """
+        if self._file_rules and self._excluded(self._file_rules, path, name, False):
+            stats.count('files_pruned')
+            return True
+        return False
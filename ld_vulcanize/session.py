@@ -0,0 +1,156 @@
+"""
+Batch Sessions
+
+Processes several roots one after the other in one process. The
+interned paths, the artifact objects, the scan results of the
+external libraries and the worker pool are shared by all roots. Each
+root still gets its own :class:`ld_vulcanize.find.ArtifactFinder`, so
+whether a library is internal or external only depends on the root
+being processed.
+"""
+
+import sys
+
+from ld_vulcanize import stats
+from ld_vulcanize.logger import log
+from ld_vulcanize.find import ArtifactFinder
+from ld_vulcanize.cache import ExternalIndex
+from ld_vulcanize.parallel import shared_pool
+
+
+def read_roots(filename):
+    """
+    Read a list of roots, one per line
+
+    Empty lines and lines starting with ``#`` are skipped.
+
+    Args:
+        filename (str): the file, or ``'-'`` for standard input
+
+    Returns:
+        list of str
+    """
+    if filename == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(filename, 'r') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines
+            if line.strip() and not line.strip().startswith('#')]
+
+
+class RootResult(object):
+
+    def __init__(self, root, result=None, error=None, stats=None):
+        """
+        Outcome of one root of a session
+
+        Args:
+            root (str): the root as given
+            result: what the action returned, ``None`` if it failed
+            error (Exception or None): why the action failed
+            stats (dict): the statistics recorded while processing
+                this root, see :meth:`ld_vulcanize.stats.Stats.to_dict`
+        """
+        self.root = root
+        self.result = result
+        self.error = error
+        self.stats = stats
+
+    def __repr__(self):
+        if self.error is not None:
+            return '{0}: failed: {1}'.format(self.root, self.error)
+        return '{0}: {1}'.format(self.root, self.result)
+
+
+class SessionError(RuntimeError):
+
+    def __init__(self, results):
+        """
+        Some roots of a session failed
+
+        The other roots were still processed, see ``results``.
+        """
+        self.results = results
+        failed = [result for result in results if result.error is not None]
+        super(SessionError, self).__init__('failed {0} of {1} roots\n{2}'.format(
+            len(failed), len(results), '\n'.join(repr(result) for result in failed)))
+
+
+class Session(object):
+
+    Finder = ArtifactFinder
+
+    def __init__(self, jobs=None, cache=None, index=None, hardlinks='error', rules=None):
+        """
+        Shared state for processing several roots
+
+        Args:
+            jobs (int or None): number of worker threads shared by
+                all roots. Default: number of CPUs
+            cache (:class:`ld_vulcanize.cache.ScanCache` or None): the
+                persistent cache of scan results to use
+            index (:class:`ld_vulcanize.cache.ExternalIndex` or None):
+                the index of external libraries. Default: an index in
+                memory, so each external library is scanned once per
+                session
+            hardlinks (str): the hardlink policy, see
+                :class:`ld_vulcanize.find.ArtifactFinder`
+            rules (:class:`ld_vulcanize.rules.Rules` or None): the
+                files and directories to skip in each root
+        """
+        self._jobs = jobs
+        self._cache = cache
+        self._own_index = index is None
+        self._index = ExternalIndex(None) if index is None else index
+        self._hardlinks = hardlinks
+        self._rules = rules
+
+    @property
+    def rules(self):
+        return self._rules
+
+    def finder(self, root, files=None):
+        """
+        Return the artifact finder for one root
+
+        Args:
+            root: the root directory
+            files (iterable of str or None): the files below the root
+                to consider instead of walking it
+        """
+        return self.Finder(
+            root, jobs=self._jobs, cache=self._cache, index=self._index,
+            hardlinks=self._hardlinks, files=files, rules=self._rules)
+
+    def run(self, roots, action):
+        """
+        Apply ``action`` to each root
+
+        A failing root does not stop the others.
+
+        Args:
+            roots (iterable of str): the roots
+            action: function of a root returning the result for it.
+                Use :meth:`finder` to scan the root.
+
+        Returns:
+            list of :class:`RootResult` in the order of the roots
+        """
+        recorder = stats.get_stats()
+        results = []
+        with shared_pool(self._jobs):
+            for root in roots:
+                before = recorder.to_dict()
+                try:
+                    result = RootResult(root, result=action(root))
+                except Exception as error:
+                    log.error('Failed to process {0}: {1}'.format(root, error))
+                    result = RootResult(root, error=error)
+                result.stats = recorder.difference(before)
+                results.append(result)
+        return results
+
+    def close(self):
+        if self._own_index:
+            self._index.close()
@@ -0,0 +1,160 @@
+"""
+Instrumentation
+
+Wall time of each phase and counters of the expensive operations, for
+example files opened and subprocesses spawned. Recording is always on,
+it is cheap compared to the file system access that is counted.
+Counters are reported in the order they were first counted. The
+numbers are process-wide::
+
+    from ld_vulcanize import stats
+    with stats.phase('parse'):
+        ...
+    stats.count('files_opened')
+"""
+
+import json
+import time
+import threading
+import contextlib
+
+
+PHASES = ('walk', 'classify', 'parse', 'link', 'rewrite', 'stream')
+
+
+class Stats(object):
+
+    def __init__(self):
+        """
+        Thread-safe phase timings and counters
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Construct from the output of :meth:`to_dict`
+        """
+        result = cls()
+        result._timings = dict(data['timings'])
+        result._counters = dict(data['counters'])
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._timings = dict()
+            self._counters = dict()
+
+    def count(self, name, n=1):
+        """
+        Increment a counter
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        """
+        Add to the wall time of a phase
+        """
+        with self._lock:
+            self._timings[name] = self._timings.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Time the ``with`` block as part of the phase ``name``
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+    @property
+    def timings(self):
+        with self._lock:
+            return dict(self._timings)
+
+    @property
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def difference(self, before):
+        """
+        Return what was recorded since ``before``
+
+        Args:
+            before (dict): an earlier result of :meth:`to_dict`
+
+        Returns:
+            dict: like :meth:`to_dict`
+        """
+        result = self.to_dict()
+        for key in ('timings', 'counters'):
+            current = result[key]
+            for name, value in before[key].items():
+                current[name] = current.get(name, 0) - value
+            result[key] = dict((name, value) for name, value in current.items() if value)
+        return result
+
+    def to_dict(self):
+        """
+        Return the JSON-serializable timings and counters
+        """
+        return dict(timings=self.timings, counters=self.counters)
+
+    def save(self, filename, **extra):
+        """
+        Write the statistics to a JSON file
+
+        Args:
+            filename (str): the JSON file
+            **extra: further JSON-serializable entries of the file
+        """
+        data = self.to_dict()
+        data.update(extra)
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def format_table(self):
+        """
+        Return the statistics as a human-readable table
+        """
+        timings = self.timings
+        counters = self.counters
+        lines = ['{0:<16} {1:>12}'.format('phase', 'seconds')]
+        names = [name for name in PHASES if name in timings]
+        for name in names + sorted(name for name in timings if name not in PHASES):
+            lines.append('{0:<16} {1:>12.3f}'.format(name, timings[name]))
+        lines.append('{0:<16} {1:>12}'.format('counter', 'value'))
+        for name, value in counters.items():
+            lines.append('{0:<16} {1:>12}'.format(name, value))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.format_table()
+
+
+_stats = Stats()
+
+
+def get_stats():
+    """
+    Return the process-wide :class:`Stats`
+    """
+    return _stats
+
+
+def count(name, n=1):
+    _stats.count(name, n)
+
+
+def add_time(name, seconds):
+    _stats.add_time(name, seconds)
+
+
+def phase(name):
+    return _stats.phase(name)
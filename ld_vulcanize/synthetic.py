@@ -0,0 +1,291 @@
+"""
+Synthetic Binaries
+
+Generate minimal but structurally valid binaries for tests and
+benchmarks, without any toolchain.
+"""
+
+import os
+import struct
+
+from ld_vulcanize.tool import macho
+from ld_vulcanize.tool import elf
+from ld_vulcanize.tool.macho import MH_EXECUTE, MH_DYLIB, MH_BUNDLE
+from ld_vulcanize.find import ArtifactFinder
+from ld_vulcanize.binary import (
+    SharedLibraryOSX, ExecutableOSX, SharedLibraryLinux, ExecutableLinux)
+
+
+CPU_TYPE_X86_64 = 0x01000007
+CPU_TYPE_ARM64 = 0x0100000c
+CPU_TYPE_I386 = 0x7
+CPU_TYPE_POWERPC = 0x12
+
+
+def _padded(raw, align):
+    raw = raw + b'\0'
+    return raw + b'\0' * (-len(raw) % align)
+
+
+def _str_command(endian, cmd, fields, string, align):
+    fmt = endian + 'II' + 'I' * len(fields)
+    size = struct.calcsize(fmt)
+    raw = _padded(string.encode('utf-8'), align)
+    return struct.pack(fmt, cmd, size + len(raw), *fields) + raw
+
+
+def _segment_command(endian, is_64, text_offset, text_size):
+    if is_64:
+        cmd, seg_fmt, sect_fmt, reserved = macho.LC_SEGMENT_64, 'II16sQQQQiiII', '16s16sQQIIIIIIII', 3
+    else:
+        cmd, seg_fmt, sect_fmt, reserved = macho.LC_SEGMENT, 'II16sIIIIiiII', '16s16sIIIIIIIII', 2
+    cmdsize = struct.calcsize(endian + seg_fmt) + struct.calcsize(endian + sect_fmt)
+    filesize = text_offset + text_size
+    segment = struct.pack(
+        endian + seg_fmt, cmd, cmdsize, b'__TEXT',
+        0, filesize, 0, filesize, 5, 5, 1, 0)
+    section = struct.pack(
+        endian + sect_fmt, b'__text', b'__TEXT',
+        text_offset, text_size, text_offset, 0, 0, 0, 0, *([0] * reserved))
+    return segment + section
+
+
+def macho_image(filetype=MH_EXECUTE, dylibs=(), install_name=None, rpaths=(),
+                is_64=True, endian='<', cputype=None, text_offset=0x1000,
+                code_signature=False):
+    """
+    Return a thin Mach-O image
+
+    Args:
+        filetype (int): one of :data:`MH_EXECUTE`, :data:`MH_DYLIB`,
+            :data:`MH_BUNDLE`
+        dylibs (iterable): install names for ``LC_LOAD_DYLIB``
+        install_name (str or None): the ``LC_ID_DYLIB`` install name
+        rpaths (iterable): paths for ``LC_RPATH``
+        is_64 (bool): whether to generate a 64-bit image
+        endian (str): the :mod:`struct` byte order prefix
+        cputype (int or None): CPU type, defaults to x86_64 / i386
+        text_offset (int): file offset of the ``__text`` section. The
+            gap after the load commands is the header padding.
+        code_signature (bool): whether to add an ``LC_CODE_SIGNATURE``
+            load command. The signature itself is not written.
+
+    Returns:
+        bytes: the image
+    """
+    align = 8 if is_64 else 4
+    if cputype is None:
+        cputype = CPU_TYPE_X86_64 if is_64 else CPU_TYPE_I386
+    text = b'\xc3' * 16
+    commands = [_segment_command(endian, is_64, text_offset, len(text))]
+    if install_name is not None:
+        commands.append(_str_command(
+            endian, macho.LC_ID_DYLIB, [24, 2, 0x10000, 0x10000], install_name, align))
+    for name in dylibs:
+        commands.append(_str_command(
+            endian, macho.LC_LOAD_DYLIB, [24, 2, 0x10000, 0x10000], name, align))
+    for path in rpaths:
+        commands.append(_str_command(endian, macho.LC_RPATH, [12], path, align))
+    if code_signature:
+        commands.append(struct.pack(endian + 'IIII', macho.LC_CODE_SIGNATURE, 16, 0, 0))
+    load_commands = b''.join(commands)
+    if is_64:
+        magic = macho.MH_MAGIC_64
+        header = struct.pack(endian + 'IiiIIIII', magic, cputype, 3, filetype,
+                             len(commands), len(load_commands), 0, 0)
+    else:
+        magic = macho.MH_MAGIC
+        header = struct.pack(endian + 'IiiIIII', magic, cputype, 3, filetype,
+                             len(commands), len(load_commands), 0)
+    image = header + load_commands
+    if len(image) > text_offset:
+        raise ValueError('load commands do not fit before text offset')
+    return image + b'\0' * (text_offset - len(image)) + text
+
+
+def fat_binary(images, align=12):
+    """
+    Return a fat binary combining thin Mach-O images
+
+    Args:
+        images (list): pairs ``(cputype, image)``
+        align (int): power of two alignment of the slices
+    """
+    header = struct.pack('>II', macho.FAT_MAGIC, len(images))
+    offset = 1 << align
+    archs = []
+    body = b''
+    for cputype, image in images:
+        archs.append(struct.pack('>iiIII', cputype, 3, offset, len(image), align))
+        padding = -len(image) % (1 << align)
+        body += image + b'\0' * padding
+        offset += len(image) + padding
+    prefix = header + b''.join(archs)
+    return prefix + b'\0' * ((1 << align) - len(prefix)) + body
+
+
+def write_binary(filename, data, executable=False):
+    """
+    Write a binary to disk, creating parent directories
+    """
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(filename, 'wb') as f:
+        f.write(data)
+    if executable:
+        os.chmod(filename, 0o755)
+    return filename
+
+
+class MachOFinder(ArtifactFinder):
+    """
+    Find Mach-O binaries regardless of the host platform
+    """
+
+    SharedLibrary = SharedLibraryOSX
+    Executable = ExecutableOSX
+
+
+class ElfFinder(ArtifactFinder):
+    """
+    Find ELF binaries regardless of the host platform
+    """
+
+    SharedLibrary = SharedLibraryLinux
+    Executable = ExecutableLinux
+
+
+def make_macho_tree(root, external):
+    """
+    Write ``bin/foo -> lib/libfoo.dylib -> lib/libbar.dylib -> external``
+    """
+    libdir = os.path.join(root, 'lib')
+    write_binary(external, macho_image(MH_DYLIB))
+    write_binary(os.path.join(libdir, 'libbar.dylib'), macho_image(
+        MH_DYLIB, dylibs=[external]))
+    write_binary(os.path.join(libdir, 'libfoo.dylib'), macho_image(
+        MH_DYLIB, dylibs=[os.path.join(libdir, 'libbar.dylib'), external]))
+    write_binary(os.path.join(root, 'bin', 'foo'), macho_image(
+        dylibs=[os.path.join(libdir, 'libfoo.dylib')]), executable=True)
+
+
+EM_386 = 3
+EM_X86_64 = 62
+
+
+def elf_image(e_type=elf.ET_DYN, needed=(), soname=None, rpath=None, runpath=None,
+              pie=False, is_64=True, endian='<', machine=None, vaddr=0x400000,
+              symbols=(), verneed=()):
+    """
+    Return a minimal ELF file with a dynamic section
+
+    Args:
+        e_type (int): :data:`ld_vulcanize.tool.elf.ET_EXEC` or
+            :data:`ld_vulcanize.tool.elf.ET_DYN`
+        needed (iterable): library names for ``DT_NEEDED``
+        soname (str or None): the ``DT_SONAME``
+        rpath (str or None): the ``DT_RPATH``
+        runpath (str or None): the ``DT_RUNPATH``
+        pie (bool): whether to add an interpreter and ``DF_1_PIE``
+        is_64 (bool): whether to generate a 64-bit ELF file
+        endian (str): the :mod:`struct` byte order prefix
+        machine (int or None): ``e_machine``, defaults to x86_64 / i386
+        vaddr (int): virtual address at which the file is loaded
+        symbols (iterable): names of dynamic symbols. Like a linker,
+            a name that is the tail of an earlier string shares it.
+        verneed (iterable): pairs ``(library, versions)`` for the
+            version needs
+
+    Returns:
+        bytes: the ELF file
+    """
+    if machine is None:
+        machine = EM_X86_64 if is_64 else EM_386
+    if is_64:
+        ehdr_fmt, phdr_fmt, dyn_fmt = 'HHIQQQIHHHHHH', 'IIQQQQQQ', 'qQ'
+    else:
+        ehdr_fmt, phdr_fmt, dyn_fmt = 'HHIIIIIHHHHHH', 'IIIIIIII', 'iI'
+    ehdr_size = 16 + struct.calcsize(endian + ehdr_fmt)
+    phdr_size = struct.calcsize(endian + phdr_fmt)
+
+    strtab = bytearray(b'\0')
+
+    def add_string(value):
+        offset = len(strtab)
+        strtab.extend(value.encode('utf-8') + b'\0')
+        return offset
+
+    interp = b'/lib64/ld-linux-x86-64.so.2\0' if pie else b''
+    dynamic = [(elf.DT_NEEDED, add_string(name)) for name in needed]
+    if soname is not None:
+        dynamic.append((elf.DT_SONAME, add_string(soname)))
+    if rpath is not None:
+        dynamic.append((elf.DT_RPATH, add_string(rpath)))
+    if runpath is not None:
+        dynamic.append((elf.DT_RUNPATH, add_string(runpath)))
+    if pie:
+        dynamic.append((elf.DT_FLAGS_1, elf.DF_1_PIE))
+
+    def merged_string(value):
+        offset = bytes(strtab).find(value.encode('utf-8') + b'\0', 1)
+        return add_string(value) if offset < 0 else offset
+
+    names = [0] + [merged_string(name) for name in symbols]
+    versions = [(add_string(library), [add_string(version) for version in library_versions])
+                for library, library_versions in verneed]
+    phnum = 3 if pie else 2
+    interp_offset = ehdr_size + phnum * phdr_size
+    strtab_offset = interp_offset + len(interp)
+    tables = b''
+    if symbols:
+        sym_fmt = 'IBBHQQ' if is_64 else 'IIIBBH'
+        tables += b''.join(struct.pack(endian + sym_fmt, name, *([0] * 5)) for name in names)
+        # a single hash bucket, the chain only needs to be long enough
+        hash_table = struct.pack(endian + 'II', 1, len(names)) + b'\0' * 4 * (1 + len(names))
+        dynamic.extend([
+            (elf.DT_SYMTAB, vaddr + strtab_offset + len(strtab)),
+            (elf.DT_SYMENT, struct.calcsize(endian + sym_fmt)),
+            (elf.DT_HASH, vaddr + strtab_offset + len(strtab) + len(tables)),
+        ])
+        tables += hash_table
+    if versions:
+        dynamic.extend([
+            (elf.DT_VERNEED, vaddr + strtab_offset + len(strtab) + len(tables)),
+            (elf.DT_VERNEEDNUM, len(versions)),
+        ])
+        for i, (library, version_names) in enumerate(versions):
+            vn_next = 0 if i + 1 == len(versions) else 16 + 16 * len(version_names)
+            tables += struct.pack(endian + 'HHIII', 1, len(version_names), library, 16, vn_next)
+            for j, name in enumerate(version_names):
+                vna_next = 0 if j + 1 == len(version_names) else 16
+                tables += struct.pack(endian + 'IHHII', 0, 0, 0, name, vna_next)
+    dynamic_offset = strtab_offset + len(strtab) + len(tables)
+    dynamic_offset += -dynamic_offset % 8
+    dynamic.extend([
+        (elf.DT_STRTAB, vaddr + strtab_offset),
+        (elf.DT_STRSZ, len(strtab)),
+        (elf.DT_NULL, 0),
+    ])
+    dynamic_raw = b''.join(struct.pack(endian + dyn_fmt, tag, value) for tag, value in dynamic)
+    filesize = dynamic_offset + len(dynamic_raw)
+
+    def phdr(p_type, offset, size):
+        if is_64:
+            return struct.pack(endian + phdr_fmt, p_type, 4, offset, vaddr + offset,
+                               vaddr + offset, size, size, 8)
+        return struct.pack(endian + phdr_fmt, p_type, offset, vaddr + offset,
+                           vaddr + offset, size, size, 4, 4)
+
+    phdrs = [phdr(elf.PT_LOAD, 0, filesize), phdr(elf.PT_DYNAMIC, dynamic_offset, len(dynamic_raw))]
+    if pie:
+        phdrs.append(phdr(elf.PT_INTERP, interp_offset, len(interp)))
+    ident = elf.ELF_MAGIC + bytes(bytearray([
+        elf.ELFCLASS64 if is_64 else elf.ELFCLASS32,
+        elf.ELFDATA2LSB if endian == '<' else elf.ELFDATA2MSB,
+        1])) + b'\0' * 9
+    ehdr = ident + struct.pack(
+        endian + ehdr_fmt, e_type, machine, 1, 0, ehdr_size, 0, 0,
+        ehdr_size, phdr_size, phnum, 0, 0, 0)
+    data = ehdr + b''.join(phdrs) + interp + bytes(strtab) + tables
+    return data + b'\0' * (dynamic_offset - len(data)) + dynamic_raw
@@ -0,0 +1,241 @@
+"""
+Binary Inspection Backends
+
+The ``native`` backend parses binaries in-process, the ``otool``
+backend runs the Apple command line tools through the selected
+subprocess engine (see :mod:`ld_vulcanize.tool.engine`).
+"""
+
+import os
+import sys
+import shlex
+import shutil
+import threading
+import contextlib
+
+from ld_vulcanize.tool.engine import SyncEngine, make_engine
+
+BACKENDS = ('native', 'otool')
+
+_backend = 'native'
+
+_engine = SyncEngine()
+
+_dry_run = False
+
+_deferred = threading.local()
+
+
+def set_backend(name):
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError('backend must be one of {0}, got {1}'.format(BACKENDS, name))
+    _backend = name
+
+
+def get_backend():
+    return _backend
+
+
+def set_engine(engine, limit=None):
+    """
+    Select how the external tools are run
+
+    Args:
+        engine: an engine instance, or the name of one (see
+            :func:`ld_vulcanize.tool.engine.make_engine`)
+        limit (int or None): maximal number of concurrent subprocesses
+            if the engine is given by name
+
+    Returns:
+        the previous engine, which is not closed
+    """
+    global _engine
+    if not hasattr(engine, 'lines'):
+        engine = make_engine(engine, limit)
+    previous, _engine = _engine, engine
+    return previous
+
+
+def get_engine():
+    return _engine
+
+
+def linker_commands(path):
+    """
+    Return the Mach-O install names and search paths using the selected backend
+
+    Returns:
+        tuple of triples ``(arch, cmd, value)``, see
+        :func:`ld_vulcanize.tool.macho.macho_linker_commands`.
+    """
+    if _backend == 'native':
+        from ld_vulcanize.tool.macho import macho_linker_commands
+        return macho_linker_commands(path)
+    else:
+        from ld_vulcanize.tool.otool import otool_linker_commands
+        return otool_linker_commands(path)
+
+
+def linker_commands_many(paths, jobs=None):
+    """
+    Return the :func:`linker_commands` of many files
+
+    With the ``otool`` backend and a concurrent engine all ``otool``
+    processes are submitted as one batch, otherwise the files are
+    parsed on ``jobs`` threads.
+
+    Returns:
+        list: the linker commands of each file, in the same order
+
+    Raises:
+        the first error
+    """
+    if _backend == 'otool' and _engine.CONCURRENT:
+        from ld_vulcanize.tool.otool import otool_linker_commands_many
+        return otool_linker_commands_many(paths)
+    from ld_vulcanize.parallel import parallel_map
+    return parallel_map(linker_commands, paths, jobs)
+
+
+def batches_commands():
+    """
+    Whether rewrites should collect their commands and run them as one batch
+
+    See :func:`deferred_commands`. This pays off for the ``otool``
+    backend with a concurrent engine.
+    """
+    return _backend == 'otool' and _engine.CONCURRENT and not _dry_run
+
+
+@contextlib.contextmanager
+def deferred_commands():
+    """
+    Collect the external commands of this thread instead of running them
+
+    Yields:
+        list: the command lines, in the order they must run
+    """
+    previous = getattr(_deferred, 'commands', None)
+    _deferred.commands = commands = []
+    try:
+        yield commands
+    finally:
+        _deferred.commands = previous
+
+
+def pending_commands():
+    """
+    Return the list collecting the commands of this thread, or ``None``
+    """
+    return getattr(_deferred, 'commands', None)
+
+
+def set_dry_run(dry_run):
+    """
+    Print the commands that would modify binaries instead of running them
+    """
+    global _dry_run
+    _dry_run = bool(dry_run)
+
+
+def is_dry_run():
+    return _dry_run
+
+
+def _print_command(argv):
+    # one write per line, the rewrite runs on several threads
+    sys.stdout.write(' '.join(shlex.quote(arg) for arg in argv) + '\n')
+
+
+def change_dylibs(path, changes, rpaths=None, old_rpaths=()):
+    """
+    Change the Mach-O install names using the selected backend
+
+    In a dry run the equivalent ``install_name_tool`` commands are
+    printed instead, whatever the backend.
+
+    Args:
+        path: the Mach-O file to modify
+        changes (dict): map of old to new install names, applied to
+            all architectures of a fat binary at once
+        rpaths (list, dict or None): the new ``LC_RPATH`` search
+            paths in order, or ``None`` to leave them alone. A dict
+            maps each architecture to its own search paths.
+        old_rpaths (list or dict): the current ``LC_RPATH`` search
+            paths, per architecture if ``rpaths`` is a dict
+
+    Returns:
+        int: the number of commands issued, that is, in-place patches
+        or external tool invocations
+    """
+    if _dry_run:
+        from ld_vulcanize.tool.otool import install_name_tool_commands
+        commands = install_name_tool_commands(path, changes, rpaths, old_rpaths)
+        for argv in commands:
+            _print_command(argv)
+        return len(commands)
+    if _backend == 'native':
+        from ld_vulcanize.tool.macho import change_dylibs
+        change_dylibs(path, changes, rpaths)
+        return 1
+    else:
+        from ld_vulcanize.tool.otool import install_name_tool_change
+        return install_name_tool_change(path, changes, rpaths, old_rpaths)
+
+
+def set_runpath(path, runpath, keep_rpath=False):
+    """
+    Set the ELF ``DT_RUNPATH`` in place
+
+    In a dry run the equivalent ``patchelf`` command is printed
+    instead.
+
+    Args:
+        keep_rpath (bool): leave a ``DT_RPATH`` a ``DT_RPATH``, see
+            :func:`ld_vulcanize.tool.elf.set_runpath`
+
+    Returns:
+        int: the number of commands issued
+    """
+    if _dry_run:
+        force = ['--force-rpath'] if keep_rpath else []
+        _print_command(['patchelf'] + force + ['--set-rpath', runpath, str(path)])
+        return 1
+    from ld_vulcanize.tool.elf import set_runpath
+    set_runpath(path, runpath, keep_rpath)
+    return 1
+
+
+def split_hardlink(path):
+    """
+    Replace a hardlink by a copy of the file
+
+    Afterwards ``path`` is a separate file that can be rewritten on
+    its own. In a dry run the equivalent commands are printed
+    instead.
+    """
+    path = str(path)
+    tmp = path + '.ld-vulcanize-split'
+    if _dry_run:
+        _print_command(['cp', '-p', path, tmp])
+        _print_command(['mv', tmp, path])
+        return
+    shutil.copy2(path, tmp)
+    os.rename(tmp, path)
+
+
+def replace_by_symlink(path, target):
+    """
+    Replace a hardlink by a relative symlink to ``target``
+
+    In a dry run the equivalent command is printed instead.
+    """
+    path = str(path)
+    relative = os.path.relpath(str(target), os.path.dirname(path))
+    if _dry_run:
+        _print_command(['ln', '-sf', relative, path])
+        return
+    tmp = path + '.ld-vulcanize-link'
+    os.symlink(relative, tmp)
+    os.rename(tmp, path)
@@ -0,0 +1,421 @@
+"""
+Native ELF Parser and Writer
+
+Reads the ELF header, the program headers and the dynamic section of
+32/64-bit ELF files of either byte order with :mod:`struct` from a
+memory-mapped file, so only the pages holding them are touched. The
+library search path is changed by patching the dynamic string table
+in place.
+"""
+
+import struct
+
+from ld_vulcanize.tool.mapped import mapped, read_string
+
+
+ELF_MAGIC = b'\x7fELF'
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+ET_EXEC = 2
+ET_DYN = 3
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_HASH = 4
+DT_STRTAB = 5
+DT_SYMTAB = 6
+DT_STRSZ = 10
+DT_SYMENT = 11
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+DT_GNU_HASH = 0x6ffffef5
+DT_CONFIG = 0x6ffffefa
+DT_DEPAUDIT = 0x6ffffefb
+DT_AUDIT = 0x6ffffefc
+DT_FLAGS_1 = 0x6ffffffb
+DT_VERDEF = 0x6ffffffc
+DT_VERDEFNUM = 0x6ffffffd
+DT_VERNEED = 0x6ffffffe
+DT_VERNEEDNUM = 0x6fffffff
+DT_AUXILIARY = 0x7ffffffd
+DT_FILTER = 0x7fffffff
+
+DF_1_PIE = 0x08000000
+
+DT_NAMES = {
+    DT_NEEDED: 'NEEDED',
+    DT_RPATH: 'RPATH',
+    DT_RUNPATH: 'RUNPATH',
+}
+
+# dynamic entries whose value is an offset into the string table
+DT_STRING_TAGS = frozenset([
+    DT_NEEDED, DT_SONAME, DT_RPATH, DT_RUNPATH, DT_CONFIG, DT_DEPAUDIT, DT_AUDIT,
+    DT_AUXILIARY, DT_FILTER])
+
+
+class ElfError(ValueError):
+    pass
+
+
+class ProgramHeader(object):
+
+    def __init__(self, p_type, offset, vaddr, filesz):
+        self.p_type = p_type
+        self.offset = offset
+        self.vaddr = vaddr
+        self.filesz = filesz
+
+
+class ElfFile(object):
+
+    def __init__(self, view):
+        """
+        The headers and dynamic section of an ELF file
+
+        Args:
+            view: the file contents, typically a :class:`memoryview`
+                of a memory-mapped file. Only the headers, the dynamic
+                section and the referenced strings are accessed. The
+                view must stay valid while strings are read.
+        """
+        self._view = view
+        if len(view) < 16 or bytes(view[:4]) != ELF_MAGIC:
+            raise ElfError('not an ELF file')
+        ei_class, ei_data = bytearray(view[4:6])
+        if ei_class not in (ELFCLASS32, ELFCLASS64):
+            raise ElfError('invalid ELF class {0}'.format(ei_class))
+        if ei_data not in (ELFDATA2LSB, ELFDATA2MSB):
+            raise ElfError('invalid ELF data encoding {0}'.format(ei_data))
+        self.is_64 = (ei_class == ELFCLASS64)
+        self.endian = '<' if ei_data == ELFDATA2LSB else '>'
+        fmt = self.endian + ('HHIQQQIHHHHHH' if self.is_64 else 'HHIIIIIHHHHHH')
+        if 16 + struct.calcsize(fmt) > len(view):
+            raise ElfError('truncated ELF header')
+        header = struct.unpack_from(fmt, view, 16)
+        self.e_type = header[0]
+        self.e_machine = header[1]
+        phoff, phentsize, phnum = header[4], header[8], header[9]
+        self.program_headers = self._read_program_headers(phoff, phentsize, phnum)
+        self._dynamic = None
+
+    def _read_program_headers(self, phoff, phentsize, phnum):
+        if self.is_64:
+            fmt, fields = self.endian + 'IIQQQQQQ', (0, 2, 3, 5)
+        else:
+            fmt, fields = self.endian + 'IIIIIIII', (0, 1, 2, 4)
+        size = struct.calcsize(fmt)
+        if phnum == 0:
+            return []
+        if phentsize < size:
+            raise ElfError('invalid program header size {0}'.format(phentsize))
+        if phoff + phentsize * phnum > len(self._view):
+            raise ElfError('truncated program headers')
+        result = []
+        for i in range(phnum):
+            values = struct.unpack_from(fmt, self._view, phoff + i * phentsize)
+            result.append(ProgramHeader(*[values[j] for j in fields]))
+        return result
+
+    @property
+    def dynamic(self):
+        """
+        The ``(d_tag, d_val)`` pairs of the dynamic section, read on first use
+        """
+        if self._dynamic is None:
+            self._dynamic = self._read_dynamic()
+        return self._dynamic
+
+    def _read_dynamic(self):
+        """
+        Return the ``(d_tag, d_val)`` pairs of the dynamic section
+        """
+        dynamic = [ph for ph in self.program_headers if ph.p_type == PT_DYNAMIC]
+        if not dynamic:
+            return []
+        ph = dynamic[0]
+        fmt = self.endian + ('qQ' if self.is_64 else 'iI')
+        size = struct.calcsize(fmt)
+        self.dynamic_offset = ph.offset
+        self.dynamic_entsize = size
+        if ph.offset + ph.filesz > len(self._view):
+            raise ElfError('truncated dynamic section')
+        result = []
+        for pos in range(ph.offset, ph.offset + ph.filesz - size + 1, size):
+            tag, value = struct.unpack_from(fmt, self._view, pos)
+            if tag == DT_NULL:
+                break
+            result.append((tag, value))
+        return result
+
+    def dynamic_values(self, tag):
+        return [value for d_tag, value in self.dynamic if d_tag == tag]
+
+    @property
+    def has_interpreter(self):
+        return any(ph.p_type == PT_INTERP for ph in self.program_headers)
+
+    @property
+    def is_pie(self):
+        """
+        Whether this is a position-independent executable
+
+        These are ``ET_DYN`` like shared libraries, but request an
+        interpreter and are flagged with ``DF_1_PIE``.
+        """
+        if self.e_type != ET_DYN or not self.has_interpreter:
+            return False
+        return any(flags & DF_1_PIE for flags in self.dynamic_values(DT_FLAGS_1))
+
+    def vaddr_to_offset(self, vaddr):
+        """
+        Return the file offset of a virtual address
+        """
+        for ph in self.program_headers:
+            if ph.p_type == PT_LOAD and ph.vaddr <= vaddr < ph.vaddr + ph.filesz:
+                return vaddr - ph.vaddr + ph.offset
+        raise ElfError('address 0x{0:x} is not mapped from the file'.format(vaddr))
+
+    def read_strings(self):
+        """
+        Locate the dynamic string table
+
+        Nothing is read, strings are copied out of the view on demand.
+        """
+        strtab = self.dynamic_values(DT_STRTAB)
+        strsz = self.dynamic_values(DT_STRSZ)
+        if not strtab or not strsz:
+            self.strtab_offset = None
+            self.strtab_size = 0
+            return
+        self.strtab_offset = self.vaddr_to_offset(strtab[0])
+        self.strtab_size = strsz[0]
+        if self.strtab_offset + self.strtab_size > len(self._view):
+            raise ElfError('truncated dynamic string table')
+
+    def _string_bytes(self, offset):
+        if not 0 <= offset < self.strtab_size:
+            raise ElfError('string offset {0} outside of string table'.format(offset))
+        start = self.strtab_offset + offset
+        raw = read_string(self._view, start, self.strtab_offset + self.strtab_size)
+        if raw is None:
+            raise ElfError('unterminated string at offset {0}'.format(offset))
+        return raw
+
+    def string(self, offset):
+        return self._string_bytes(offset).decode('utf-8', 'surrogateescape')
+
+    def _words(self, offset, fmt):
+        size = struct.calcsize(self.endian + fmt)
+        if offset + size > len(self._view):
+            raise ElfError('truncated table at offset {0}'.format(offset))
+        return struct.unpack_from(self.endian + fmt, self._view, offset)
+
+    def _symbol_count(self):
+        """
+        Return the number of dynamic symbols, or ``None`` if unknown
+
+        The count is not stored anywhere, but follows from the hash
+        tables.
+        """
+        hash_table = self.dynamic_values(DT_HASH)
+        if hash_table:
+            return self._words(self.vaddr_to_offset(hash_table[0]), 'II')[1]
+        gnu_hash = self.dynamic_values(DT_GNU_HASH)
+        if not gnu_hash:
+            return None
+        offset = self.vaddr_to_offset(gnu_hash[0])
+        nbuckets, symoffset, bloom_size, bloom_shift = self._words(offset, 'IIII')
+        offset += 16 + bloom_size * (8 if self.is_64 else 4)
+        buckets = self._words(offset, 'I' * nbuckets)
+        last = max(buckets) if buckets else 0
+        if last < symoffset:
+            return symoffset
+        chain = offset + 4 * nbuckets
+        while not self._words(chain + 4 * (last - symoffset), 'I')[0] & 1:
+            last += 1
+        return last + 1
+
+    def _symbol_names(self):
+        symtab = self.dynamic_values(DT_SYMTAB)
+        if not symtab:
+            return []
+        count = self._symbol_count()
+        if count is None:
+            return None
+        syment = self.dynamic_values(DT_SYMENT)
+        syment = syment[0] if syment else (24 if self.is_64 else 16)
+        offset = self.vaddr_to_offset(symtab[0])
+        return [self._words(offset + i * syment, 'I')[0] for i in range(count)]
+
+    def _version_names(self):
+        result = []
+        for table, number, names in ((DT_VERNEED, DT_VERNEEDNUM, self._verneed_names),
+                                     (DT_VERDEF, DT_VERDEFNUM, self._verdef_names)):
+            address = self.dynamic_values(table)
+            count = self.dynamic_values(number)
+            if address and count:
+                result.extend(names(self.vaddr_to_offset(address[0]), count[0]))
+        return result
+
+    def _verneed_names(self, offset, count):
+        for i in range(count):
+            version, cnt, vn_file, vn_aux, vn_next = self._words(offset, 'HHIII')
+            yield vn_file
+            aux = offset + vn_aux
+            for j in range(cnt):
+                vna_hash, vna_flags, vna_other, vna_name, vna_next = self._words(aux, 'IHHII')
+                yield vna_name
+                aux += vna_next
+            offset += vn_next
+
+    def _verdef_names(self, offset, count):
+        for i in range(count):
+            version, flags, ndx, cnt, vd_hash, vd_aux, vd_next = self._words(offset, 'HHHHIII')
+            aux = offset + vd_aux
+            for j in range(cnt):
+                vda_name, vda_next = self._words(aux, 'II')
+                yield vda_name
+                aux += vda_next
+            offset += vd_next
+
+    def string_references(self):
+        """
+        Return the offsets of all strings in use
+
+        These are the strings of the dynamic entries, the names of the
+        dynamic symbols and the symbol version names.
+
+        Returns:
+            set of int, or ``None`` if the dynamic symbols cannot be
+            counted
+        """
+        symbols = self._symbol_names()
+        if symbols is None:
+            return None
+        referenced = set(value for tag, value in self.dynamic if tag in DT_STRING_TAGS)
+        referenced.update(symbols)
+        referenced.update(self._version_names())
+        return referenced
+
+    def string_room(self, offset):
+        """
+        Return the space available for the string at ``offset``
+
+        This is the length of the string plus the unused padding of
+        an earlier, shorter value. Padding that any other string
+        starts at is in use. Linkers merge the tails of strings, so
+        another string can also start inside this one; only the part
+        before it is available then. If the strings in use are not
+        known, only the string itself is available.
+        """
+        end = offset + len(self._string_bytes(offset))
+        referenced = self.string_references()
+        if referenced is None:
+            return end - offset
+        base = self.strtab_offset
+        limit = self.strtab_size
+        for r in referenced:
+            if r > offset:
+                # an empty string can share the new terminator
+                limit = min(limit, r + 1 if self._view[base + r] == 0 else r)
+        if end >= limit:
+            return limit - 1 - offset
+        while end + 1 < limit and self._view[base + end + 1] == 0:
+            end += 1
+        return end - offset
+
+    def entries(self):
+        """
+        Return the library search related dynamic entries
+
+        Returns:
+            tuple of pairs ``(tag, value)`` where the tag is one of
+            ``'NEEDED'``, ``'RPATH'``, ``'RUNPATH'`` in the order of
+            the dynamic section.
+        """
+        return tuple(
+            (DT_NAMES[tag], self.string(value))
+            for tag, value in self.dynamic if tag in DT_NAMES)
+
+
+def elf_machine(path):
+    """
+    Return the ELF class and machine
+
+    Returns:
+        pair ``(is_64, e_machine)`` or ``None`` if not an ELF file
+    """
+    with open(str(path), 'rb') as f:
+        raw = f.read(20)
+    if len(raw) != 20 or not raw.startswith(ELF_MAGIC):
+        return None
+    ei_class, ei_data = bytearray(raw[4:6])
+    endian = '<' if ei_data == ELFDATA2LSB else '>'
+    machine, = struct.unpack_from(endian + 'H', raw, 18)
+    return (ei_class == ELFCLASS64, machine)
+
+
+def elf_dynamic_entries(path):
+    """
+    Return the ``DT_NEEDED``, ``DT_RPATH`` and ``DT_RUNPATH`` entries
+
+    See :meth:`ElfFile.entries`.
+    """
+    with mapped(path) as view:
+        elf_file = ElfFile(view)
+        elf_file.read_strings()
+        return elf_file.entries()
+
+
+def set_runpath(path, runpath, keep_rpath=False):
+    """
+    Set ``DT_RUNPATH`` in place
+
+    The existing ``DT_RUNPATH`` string, or else the ``DT_RPATH`` string
+    which is turned into a ``DT_RUNPATH``, is overwritten. The dynamic
+    string table is not moved, so the new value must fit into the
+    space of the old one (see :meth:`ElfFile.string_room`).
+
+    Args:
+        path: the ELF file
+        runpath (str): the new colon-separated search path
+        keep_rpath (bool): leave a ``DT_RPATH`` a ``DT_RPATH``. Unlike
+            ``DT_RUNPATH`` it is also searched for the libraries of
+            the loaded libraries.
+    """
+    raw = runpath.encode('utf-8', 'surrogateescape')
+    with mapped(path, write=True) as view:
+        elf_file = ElfFile(view)
+        elf_file.read_strings()
+        index = None
+        for tag in (DT_RUNPATH, DT_RPATH):
+            for i, (d_tag, value) in enumerate(elf_file.dynamic):
+                if d_tag == tag:
+                    index, str_offset = i, value
+                    break
+            if index is not None:
+                break
+        if index is None:
+            raise ElfError('{0} has neither DT_RUNPATH nor DT_RPATH to overwrite'.format(path))
+        room = elf_file.string_room(str_offset)
+        if len(raw) > room:
+            raise ElfError(
+                'not enough room in the dynamic string table of {0}: '
+                'need {1} bytes, only {2} available'.format(path, len(raw), room))
+        start = elf_file.strtab_offset + str_offset
+        view[start:start + room + 1] = raw + b'\0' * (room + 1 - len(raw))
+        if elf_file.dynamic[index][0] != DT_RUNPATH and not keep_rpath:
+            fmt = elf_file.endian + ('q' if elf_file.is_64 else 'i')
+            struct.pack_into(
+                fmt, view, elf_file.dynamic_offset + index * elf_file.dynamic_entsize,
+                DT_RUNPATH)
@@ -0,0 +1,196 @@
+"""
+Subprocess Engines
+
+The external tools are run through an engine. :class:`SyncEngine`
+runs them in the calling thread. :class:`AsyncEngine` runs them on an
+asyncio event loop in a background thread, with a semaphore bounding
+the number of concurrent subprocesses; its :meth:`~SyncEngine.lines_many`
+submits a whole batch of commands from one thread. Both stream the output into a
+consumer line by line instead of buffering it, decoded like file names
+so that install names which are not valid text survive.
+"""
+
+import os
+import asyncio
+import threading
+import subprocess
+
+from ld_vulcanize import stats
+from ld_vulcanize.logger import log
+
+
+ENGINES = ('sync', 'asyncio')
+
+
+def _decode(line):
+    return os.fsdecode(line).rstrip('\n')
+
+
+class SyncEngine(object):
+
+    # whether lines_many runs the jobs concurrently
+    CONCURRENT = False
+
+    def lines(self, argv, consumer):
+        """
+        Run a command and pass each output line to ``consumer``
+
+        Args:
+            argv (list of str): the command
+            consumer: function of one line, without the line break
+
+        Raises:
+            :class:`subprocess.CalledProcessError`: on a non-zero exit
+        """
+        log.debug('Exec: "{0}"'.format(' '.join(argv)))
+        proc = subprocess.Popen(argv, stdout=subprocess.PIPE)
+        stats.count('subprocesses')
+        with proc.stdout:
+            try:
+                for line in proc.stdout:
+                    consumer(_decode(line))
+            except BaseException:
+                proc.kill()
+                proc.wait()
+                raise
+        returncode = proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, argv)
+
+    def call(self, argv):
+        """
+        Run a command, discarding its output
+        """
+        self.lines(argv, lambda line: None)
+
+    def lines_many(self, jobs):
+        """
+        Run a batch of jobs
+
+        Args:
+            jobs (list): each job is a list of ``(argv, consumer)``
+                pairs, see :meth:`lines`. The commands of a job run in
+                order, a failing command stops its job.
+
+        Returns:
+            list: for each job the exception that stopped it, or
+            ``None`` on success
+        """
+        errors = []
+        for job in jobs:
+            try:
+                for argv, consumer in job:
+                    self.lines(argv, consumer)
+            except Exception as error:
+                errors.append(error)
+            else:
+                errors.append(None)
+        return errors
+
+    def close(self):
+        pass
+
+
+class AsyncEngine(SyncEngine):
+
+    CONCURRENT = True
+
+    def __init__(self, limit=None):
+        """
+        Run the commands on an asyncio event loop
+
+        The methods are blocking and can be called from any number of
+        threads, the subprocesses run concurrently. The jobs of
+        :meth:`lines_many` run concurrently as well.
+
+        Args:
+            limit (int or None): maximal number of concurrent
+                subprocesses. Default: unlimited
+        """
+        self._limit = limit
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever)
+                self._thread.daemon = True
+                self._thread.start()
+        return self._loop
+
+    async def _run(self, argv, consumer):
+        if self._limit is not None and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._limit)
+        if self._semaphore is not None:
+            async with self._semaphore:
+                return await self._exec(argv, consumer)
+        return await self._exec(argv, consumer)
+
+    async def _exec(self, argv, consumer):
+        log.debug('Exec: "{0}"'.format(' '.join(argv)))
+        proc = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE)
+        stats.count('subprocesses')
+        try:
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                consumer(_decode(line))
+        except BaseException:
+            proc.kill()
+            await proc.wait()
+            raise
+        returncode = await proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, argv)
+
+    def lines(self, argv, consumer):
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._run(argv, consumer), loop)
+        return future.result()
+
+    async def _job(self, job):
+        for argv, consumer in job:
+            await self._run(argv, consumer)
+
+    async def _gather(self, jobs):
+        return await asyncio.gather(
+            *[self._job(job) for job in jobs], return_exceptions=True)
+
+    def lines_many(self, jobs):
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._gather(jobs), loop)
+        return [error if isinstance(error, Exception) else None
+                for error in future.result()]
+
+    def close(self):
+        """
+        Stop the event loop
+        """
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = self._thread = self._semaphore = None
+
+
+def make_engine(name, limit=None):
+    """
+    Return a new engine
+
+    Args:
+        name (str): one of :data:`ENGINES`
+        limit (int or None): for the asyncio engine, the maximal
+            number of concurrent subprocesses
+    """
+    if name == 'sync':
+        return SyncEngine()
+    elif name == 'asyncio':
+        return AsyncEngine(limit)
+    raise ValueError('engine must be one of {0}, got {1}'.format(ENGINES, name))
@@ -0,0 +1,175 @@
+"""
+Emulate the ld.so Library Search
+
+See ``man ld.so``. The environment (``LD_LIBRARY_PATH``,
+``LD_PRELOAD``) is deliberately ignored, the result must not depend on
+who runs ``ld-vulcanize``.
+"""
+
+import os
+import glob
+
+from ld_vulcanize.logger import log
+
+
+LD_SO_CONF = '/etc/ld.so.conf'
+
+DEFAULT_PATH = {
+    False: ['/lib', '/usr/lib'],
+    True: ['/lib64', '/usr/lib64', '/lib', '/usr/lib'],
+}
+
+
+def _read_ld_so_conf(filename, seen):
+    if filename in seen or not os.path.isfile(filename):
+        return []
+    seen.add(filename)
+    result = []
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('include '):
+                pattern = line[len('include '):].strip()
+                if not os.path.isabs(pattern):
+                    pattern = os.path.join(os.path.dirname(filename), pattern)
+                for included in sorted(glob.glob(pattern)):
+                    result.extend(_read_ld_so_conf(included, seen))
+            elif line.startswith('hwcap '):
+                continue
+            else:
+                result.append(line)
+    return result
+
+
+_system_path = dict()
+
+
+def system_search_path(is_64):
+    """
+    Return the directories from ``/etc/ld.so.conf`` and the defaults
+    """
+    try:
+        return _system_path[is_64]
+    except KeyError:
+        pass
+    result = []
+    for dirname in _read_ld_so_conf(LD_SO_CONF, set()) + DEFAULT_PATH[is_64]:
+        if dirname not in result and os.path.isdir(dirname):
+            result.append(dirname)
+    _system_path[is_64] = result
+    return result
+
+
+def split_search_path(value, origin, is_64):
+    """
+    Split a ``DT_RPATH``/``DT_RUNPATH`` value and expand ``$ORIGIN``, ``$LIB``
+
+    Args:
+        value (str or None): the colon-separated search path
+        origin (str): the directory containing the object
+        is_64 (bool): whether the object is 64-bit, for ``$LIB``
+
+    Returns:
+        list of str: the directories
+    """
+    if not value:
+        return []
+    lib = 'lib64' if is_64 else 'lib'
+    result = []
+    for entry in value.split(':'):
+        entry = entry.replace('${ORIGIN}', origin).replace('$ORIGIN', origin)
+        entry = entry.replace('${LIB}', lib).replace('$LIB', lib)
+        if entry:
+            result.append(os.path.normpath(entry))
+    return result
+
+
+class LibrarySearch(object):
+
+    def __init__(self, origin, is_64, machine, rpath=None, runpath=None,
+                 compatible=None, inherited=()):
+        """
+        Functor to find ``DT_NEEDED`` libraries like ld.so
+
+        Args:
+            origin (str): the directory of the object
+            is_64 (bool): ELF class of the object
+            machine (int): ``e_machine`` of the object
+            rpath (str or None): the ``DT_RPATH`` value
+            runpath (str or None): the ``DT_RUNPATH`` value, which
+                disables ``DT_RPATH`` if present
+            compatible: function of the candidate file name returning
+                ``(is_64, machine)``; candidates of a different
+                class or machine are skipped like ld.so does.
+            inherited (iterable of str): the expanded ``DT_RPATH``
+                directories of the objects loading this one, up to
+                the executable. Searched after its own ``DT_RPATH``,
+                unless there is a ``DT_RUNPATH``.
+        """
+        self._origin = origin
+        self._is_64 = is_64
+        self._machine = machine
+        self._compatible = compatible
+        path = []
+        if runpath is None:
+            path.extend(split_search_path(rpath, origin, is_64))
+            path.extend(dirname for dirname in inherited if dirname not in path)
+        path.extend(split_search_path(runpath, origin, is_64))
+        self._path = path
+
+    @property
+    def search_path(self):
+        return self._path + system_search_path(self._is_64)
+
+    def candidates(self, name):
+        if '/' in name:
+            # relative names are relative to the working directory at run time
+            if os.path.isabs(name):
+                yield name
+            return
+        for dirname in self.search_path:
+            yield os.path.join(dirname, name)
+
+    def probe(self, name):
+        """
+        Search the library and count the candidates tried
+
+        Returns:
+            pair ``(filename, probes)``. The file name is ``None`` if
+            the library is not found, then all candidates were tried.
+        """
+        probes = 0
+        for candidate in self.candidates(name):
+            probes += 1
+            if not os.path.isfile(candidate):
+                continue
+            if self._compatible is not None:
+                if self._compatible(candidate) != (self._is_64, self._machine):
+                    log.debug('Skipping incompatible {0}'.format(candidate))
+                    continue
+            return candidate, probes
+        return None, probes
+
+    def __call__(self, name):
+        """
+        Return the file name of the library or ``None`` if not found
+        """
+        return self.probe(name)[0]
+
+
+_compatibility = dict()
+
+
+def elf_compatibility(filename):
+    """
+    Return ``(is_64, e_machine)`` of an ELF file, memoized
+    """
+    try:
+        return _compatibility[filename]
+    except KeyError:
+        pass
+    from ld_vulcanize.tool.elf import elf_machine
+    result = _compatibility[filename] = elf_machine(filename)
+    return result
@@ -0,0 +1,472 @@
+"""
+Native Mach-O Load Command Parser and Writer
+
+Reads the Mach-O header and the load command region of thin (32/64
+bit, either byte order) and fat binaries with :mod:`struct` from a
+memory-mapped file. Nothing beyond the load commands is touched, in
+particular no section contents are paged in. Install names are
+changed by patching the load command region in place.
+"""
+
+import struct
+
+from ld_vulcanize.logger import log
+from ld_vulcanize.tool.mapped import mapped
+
+
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+MH_MAGIC = 0xfeedface
+MH_CIGAM = 0xcefaedfe
+MH_MAGIC_64 = 0xfeedfacf
+MH_CIGAM_64 = 0xcffaedfe
+
+MH_EXECUTE = 0x2
+MH_DYLIB = 0x6
+MH_BUNDLE = 0x8
+
+CPU_ARCH_ABI64 = 0x01000000
+
+CPU_NAMES = {
+    0x7: 'i386',
+    0x7 | CPU_ARCH_ABI64: 'x86_64',
+    0xc: 'arm',
+    0xc | CPU_ARCH_ABI64: 'arm64',
+    0x12: 'ppc',
+    0x12 | CPU_ARCH_ABI64: 'ppc64',
+}
+
+LC_REQ_DYLD = 0x80000000
+
+LC_SEGMENT = 0x1
+LC_LOAD_DYLIB = 0xc
+LC_ID_DYLIB = 0xd
+LC_LOAD_WEAK_DYLIB = 0x18 | LC_REQ_DYLD
+LC_SEGMENT_64 = 0x19
+LC_RPATH = 0x1c | LC_REQ_DYLD
+LC_CODE_SIGNATURE = 0x1d
+LC_REEXPORT_DYLIB = 0x1f | LC_REQ_DYLD
+LC_LAZY_LOAD_DYLIB = 0x20
+LC_LOAD_UPWARD_DYLIB = 0x23 | LC_REQ_DYLD
+
+LC_NAMES = {
+    LC_SEGMENT: 'LC_SEGMENT',
+    0x2: 'LC_SYMTAB',
+    0x5: 'LC_UNIXTHREAD',
+    0xb: 'LC_DYSYMTAB',
+    LC_LOAD_DYLIB: 'LC_LOAD_DYLIB',
+    LC_ID_DYLIB: 'LC_ID_DYLIB',
+    0xe: 'LC_LOAD_DYLINKER',
+    0xf: 'LC_ID_DYLINKER',
+    LC_LOAD_WEAK_DYLIB: 'LC_LOAD_WEAK_DYLIB',
+    LC_SEGMENT_64: 'LC_SEGMENT_64',
+    0x1b: 'LC_UUID',
+    LC_RPATH: 'LC_RPATH',
+    LC_CODE_SIGNATURE: 'LC_CODE_SIGNATURE',
+    0x1e: 'LC_SEGMENT_SPLIT_INFO',
+    LC_REEXPORT_DYLIB: 'LC_REEXPORT_DYLIB',
+    LC_LAZY_LOAD_DYLIB: 'LC_LAZY_LOAD_DYLIB',
+    0x21: 'LC_ENCRYPTION_INFO',
+    0x22: 'LC_DYLD_INFO',
+    0x22 | LC_REQ_DYLD: 'LC_DYLD_INFO_ONLY',
+    LC_LOAD_UPWARD_DYLIB: 'LC_LOAD_UPWARD_DYLIB',
+    0x24: 'LC_VERSION_MIN_MACOSX',
+    0x26: 'LC_FUNCTION_STARTS',
+    0x28 | LC_REQ_DYLD: 'LC_MAIN',
+    0x29: 'LC_DATA_IN_CODE',
+    0x2a: 'LC_SOURCE_VERSION',
+    0x32: 'LC_BUILD_VERSION',
+    0x33 | LC_REQ_DYLD: 'LC_DYLD_EXPORTS_TRIE',
+    0x34 | LC_REQ_DYLD: 'LC_DYLD_CHAINED_FIXUPS',
+}
+
+DYLIB_COMMANDS = frozenset([
+    LC_LOAD_DYLIB,
+    LC_ID_DYLIB,
+    LC_LOAD_WEAK_DYLIB,
+    LC_REEXPORT_DYLIB,
+    LC_LAZY_LOAD_DYLIB,
+    LC_LOAD_UPWARD_DYLIB,
+])
+
+
+class MachOError(ValueError):
+    pass
+
+
+def _decode(raw):
+    return raw.split(b'\0', 1)[0].decode('utf-8', 'surrogateescape')
+
+
+def _version(packed):
+    return '{0}.{1}.{2}'.format(packed >> 16, (packed >> 8) & 0xff, packed & 0xff)
+
+
+class LoadCommand(object):
+
+    def __init__(self, endian, cmd, offset, data):
+        """
+        A single load command
+
+        Args:
+            endian (str): the :mod:`struct` byte order prefix
+            cmd (int): the load command type
+            offset (int): file offset of the load command
+            data (bytes): the whole load command including the
+                ``cmd``/``cmdsize`` fields
+        """
+        self.endian = endian
+        self.cmd = cmd
+        self.offset = offset
+        self.data = data
+
+    @property
+    def cmdsize(self):
+        return len(self.data)
+
+    @property
+    def name(self):
+        return LC_NAMES.get(self.cmd, 'LC_0x{0:x}'.format(self.cmd))
+
+    def _lc_str(self, field_offset):
+        str_offset, = struct.unpack_from(self.endian + 'I', self.data, field_offset)
+        if not 8 <= str_offset < len(self.data):
+            raise MachOError('string offset {0} outside of {1}'.format(str_offset, self.name))
+        return _decode(self.data[str_offset:]), str_offset
+
+    def as_dict(self):
+        """
+        Return the load command in the shape of ``otool -l`` output
+
+        See :func:`ld_vulcanize.tool.otool.otool_load_commands`.
+        """
+        cmd = dict(cmd=self.name, cmdsize=str(self.cmdsize))
+        if self.cmd in DYLIB_COMMANDS:
+            filename, str_offset = self._lc_str(8)
+            timestamp, current, compatibility = struct.unpack_from(
+                self.endian + 'III', self.data, 12)
+            cmd['name'] = '{0} (offset {1})'.format(filename, str_offset)
+            cmd['filename'] = filename
+            cmd['time stamp'] = str(timestamp)
+            cmd['current version'] = _version(current)
+            cmd['compatibility version'] = _version(compatibility)
+        elif self.cmd == LC_RPATH:
+            path, str_offset = self._lc_str(8)
+            cmd['path'] = '{0} (offset {1})'.format(path, str_offset)
+        return cmd
+
+
+class MachImage(object):
+
+    def __init__(self, endian, is_64, offset, header):
+        """
+        A thin Mach-O image, possibly a slice of a fat binary
+
+        Args:
+            endian (str): the :mod:`struct` byte order prefix
+            is_64 (bool): whether this is a 64-bit image
+            offset (int): file offset of the image (non-zero for fat slices)
+            header (tuple): the ``mach_header`` fields following the magic
+        """
+        self.endian = endian
+        self.is_64 = is_64
+        self.offset = offset
+        (self.cputype, self.cpusubtype, self.filetype,
+         self.ncmds, self.sizeofcmds, self.flags) = header
+        self.load_commands = []
+
+    @property
+    def header_size(self):
+        return 32 if self.is_64 else 28
+
+    @property
+    def arch(self):
+        """
+        The architecture name, like ``lipo`` and ``otool -arch`` use
+        """
+        return CPU_NAMES.get(self.cputype, 'cputype{0}'.format(self.cputype))
+
+    def _read_load_commands(self, view):
+        start = self.offset + self.header_size
+        end = start + self.sizeofcmds
+        if end > len(view):
+            raise MachOError('truncated load commands')
+        pos = start
+        for i in range(self.ncmds):
+            if pos + 8 > end:
+                raise MachOError('load command {0} outside of sizeofcmds'.format(i))
+            cmd, cmdsize = struct.unpack_from(self.endian + 'II', view, pos)
+            if cmdsize < 8 or pos + cmdsize > end:
+                raise MachOError('invalid cmdsize {0} of load command {1}'.format(cmdsize, i))
+            self.load_commands.append(
+                LoadCommand(self.endian, cmd, pos, bytes(view[pos:pos + cmdsize])))
+            pos += cmdsize
+
+
+def _read_thin(view, offset):
+    if offset + 4 > len(view):
+        raise MachOError('file too short for a Mach-O header')
+    magic, = struct.unpack_from('>I', view, offset)
+    if magic in (MH_MAGIC, MH_MAGIC_64):
+        endian = '>'
+    elif magic in (MH_CIGAM, MH_CIGAM_64):
+        endian = '<'
+    else:
+        raise MachOError('not a Mach-O image (magic 0x{0:08x})'.format(magic))
+    is_64 = magic in (MH_MAGIC_64, MH_CIGAM_64)
+    if offset + 28 > len(view):
+        raise MachOError('truncated Mach-O header')
+    image = MachImage(endian, is_64, offset, struct.unpack_from(endian + 'iiIIII', view, offset + 4))
+    image._read_load_commands(view)
+    return image
+
+
+def read_images(view):
+    """
+    Read all Mach-O images from a buffer
+
+    Only the headers and load commands are accessed, so this is cheap
+    on a memory-mapped file of any size (see
+    :func:`ld_vulcanize.tool.mapped.mapped`).
+
+    Args:
+        view: the file contents, typically a :class:`memoryview` of
+            a memory-mapped file
+
+    Returns:
+        list of :class:`MachImage`, one per architecture. A thin
+        binary has a single image.
+    """
+    if len(view) < 4:
+        raise MachOError('file too short for a Mach-O header')
+    magic, = struct.unpack_from('>I', view)
+    if magic not in (FAT_MAGIC, FAT_MAGIC_64):
+        return [_read_thin(view, 0)]
+    if len(view) < 8:
+        raise MachOError('truncated fat header')
+    nfat_arch, = struct.unpack_from('>I', view, 4)
+    if magic == FAT_MAGIC:
+        fmt, size = '>iiIII', 20
+    else:
+        fmt, size = '>iiQQII', 32
+    if 8 + nfat_arch * size > len(view):
+        raise MachOError('truncated fat header')
+    images = []
+    for i in range(nfat_arch):
+        offset = struct.unpack_from(fmt, view, 8 + i * size)[2]
+        images.append(_read_thin(view, offset))
+    return images
+
+
+def macho_load_commands(path):
+    """
+    Parse the Mach-O load commands natively
+
+    Drop-in replacement for
+    :func:`ld_vulcanize.tool.otool.otool_load_commands`, yields the
+    load commands of all architectures as dictionaries.
+    """
+    with mapped(path) as view:
+        images = read_images(view)
+    for image in images:
+        for load_cmd in image.load_commands:
+            yield load_cmd.as_dict()
+
+
+LINKER_COMMANDS = {
+    LC_LOAD_DYLIB: 'LC_LOAD_DYLIB',
+    LC_RPATH: 'LC_RPATH',
+}
+
+
+def macho_linker_commands(path):
+    """
+    Return the install names and run path search paths of each architecture
+
+    Every slice of a fat binary is parsed once, at its ``fat_arch``
+    offset.
+
+    Returns:
+        tuple of triples ``(arch, cmd, value)`` in load command order.
+        The architecture is the name of the fat slice (see
+        :attr:`MachImage.arch`), or ``None`` for a thin binary. The
+        command is ``'LC_LOAD_DYLIB'`` with the install name or
+        ``'LC_RPATH'`` with the search path.
+    """
+    with mapped(path) as view:
+        images = read_images(view)
+    result = []
+    for image in images:
+        arch = image.arch if image.offset else None
+        for load_cmd in image.load_commands:
+            if load_cmd.cmd in LINKER_COMMANDS:
+                value, str_offset = load_cmd._lc_str(8)
+                result.append((arch, LINKER_COMMANDS[load_cmd.cmd], value))
+    return tuple(result)
+
+
+def rpath_edits(old, new):
+    """
+    Return the edits turning one ``LC_RPATH`` list into another
+
+    The common prefix is kept, the rest of the old list is deleted and
+    the rest of the new list is appended. This preserves the order,
+    which matters to dyld.
+
+    Returns:
+        pair ``(deleted, added)`` of lists
+    """
+    common = 0
+    while common < min(len(old), len(new)) and old[common] == new[common]:
+        common += 1
+    return list(old[common:]), list(new[common:])
+
+
+def _align(size, alignment):
+    return size + (-size % alignment)
+
+
+def _header_limit(image):
+    """
+    Return the end of the space available for load commands
+
+    This is the smallest file offset (relative to the image) of any
+    section or segment contents, the gap between the end of the load
+    commands and this offset is the header padding.
+    """
+    limit = None
+    for load_cmd in image.load_commands:
+        if load_cmd.cmd == LC_SEGMENT_64:
+            seg_fmt, sect_fmt, sect_offset = 'QQQQiiII', '16s16sQQI', 72
+        elif load_cmd.cmd == LC_SEGMENT:
+            seg_fmt, sect_fmt, sect_offset = 'IIIIiiII', '16s16sIII', 56
+        else:
+            continue
+        seg = struct.unpack_from(load_cmd.endian + seg_fmt, load_cmd.data, 24)
+        fileoff, filesize, nsects = seg[2], seg[3], seg[6]
+        if fileoff > 0 and filesize > 0:
+            limit = fileoff if limit is None else min(limit, fileoff)
+        sect_size = 80 if load_cmd.cmd == LC_SEGMENT_64 else 68
+        for i in range(nsects):
+            offset = struct.unpack_from(
+                load_cmd.endian + sect_fmt, load_cmd.data, sect_offset + i * sect_size)[4]
+            if offset > 0:
+                limit = offset if limit is None else min(limit, offset)
+    return limit
+
+
+def _renamed_dylib_command(load_cmd, filename, alignment):
+    str_offset, = struct.unpack_from(load_cmd.endian + 'I', load_cmd.data, 8)
+    raw = filename.encode('utf-8', 'surrogateescape') + b'\0'
+    cmdsize = _align(str_offset + len(raw), alignment)
+    data = bytearray(cmdsize)
+    data[:str_offset] = load_cmd.data[:str_offset]
+    struct.pack_into(load_cmd.endian + 'I', data, 4, cmdsize)
+    data[str_offset:str_offset + len(raw)] = raw
+    return bytes(data)
+
+
+def _rpath_command(endian, path, alignment):
+    raw = path.encode('utf-8', 'surrogateescape') + b'\0'
+    cmdsize = _align(12 + len(raw), alignment)
+    data = bytearray(cmdsize)
+    struct.pack_into(endian + 'III', data, 0, LC_RPATH, cmdsize, 12)
+    data[12:12 + len(raw)] = raw
+    return bytes(data)
+
+
+def _rewritten_load_commands(image, changes, path, rpaths=None):
+    """
+    Return the new load command region
+
+    Returns:
+        triple ``(data, ncmds, count)`` of the load commands, their
+        number and the number of changed load commands
+    """
+    alignment = 8 if image.is_64 else 4
+    count = 0
+    blocks = []
+    old_rpaths = []
+    rpath_index = None
+    for load_cmd in image.load_commands:
+        if load_cmd.cmd == LC_RPATH and rpaths is not None:
+            old_rpaths.append(load_cmd._lc_str(8)[0])
+            if rpath_index is None:
+                rpath_index = len(blocks)
+            continue
+        if load_cmd.cmd in DYLIB_COMMANDS and load_cmd.cmd != LC_ID_DYLIB:
+            filename, str_offset = load_cmd._lc_str(8)
+            if filename in changes:
+                blocks.append(_renamed_dylib_command(load_cmd, changes[filename], alignment))
+                count += 1
+                continue
+        blocks.append(load_cmd.data)
+    if rpaths is not None:
+        deleted, added = rpath_edits(old_rpaths, rpaths)
+        count += len(deleted) + len(added)
+        if rpath_index is None:
+            rpath_index = len(blocks)
+        blocks[rpath_index:rpath_index] = [
+            _rpath_command(image.endian, rpath, alignment) for rpath in rpaths]
+    data = b''.join(blocks)
+    limit = _header_limit(image)
+    if count > 0 and limit is None:
+        raise MachOError(
+            'cannot find the header padding in {0}: no section or segment '
+            'contents after the load commands'.format(path))
+    if limit is not None and image.header_size + len(data) > limit:
+        raise MachOError(
+            'not enough header padding in {0}: load commands need {1} bytes, '
+            'only {2} available (relink with -headerpad_max_install_names)'.format(
+                path, len(data), limit - image.header_size))
+    return data, len(blocks), count
+
+
+def change_dylibs(path, changes, rpaths=None):
+    """
+    Change the ``LC_LOAD_DYLIB`` install names and ``LC_RPATH`` in place
+
+    All changes to one file are applied in a single pass, in every
+    architecture of a fat binary. Load commands that grow use up the
+    header padding. Nothing is written unless all changes fit.
+
+    Changing the load commands invalidates a code signature, and
+    arm64 macOS refuses to run such binaries. Signed files are
+    rewritten anyway with a warning to re-sign them.
+
+    Args:
+        path: the Mach-O file
+        changes (dict): map of old to new install names, like
+            ``install_name_tool -change old new``
+        rpaths (list, dict or None): the new ``LC_RPATH`` search paths
+            in order. They replace the existing ones at the position
+            of the first. ``None`` leaves them alone. A dict maps the
+            architecture (``None`` for a thin binary, see
+            :func:`macho_linker_commands`) to the search paths of that
+            slice.
+
+    Returns:
+        int: the number of changed load commands
+    """
+    count = 0
+    with mapped(path, write=True) as view:
+        patches = []
+        for image in read_images(view):
+            image_rpaths = rpaths
+            if isinstance(rpaths, dict):
+                image_rpaths = rpaths.get(image.arch if image.offset else None)
+            data, ncmds, image_count = _rewritten_load_commands(
+                image, changes, path, image_rpaths)
+            if image_count > 0:
+                patches.append((image, data, ncmds))
+                count += image_count
+        if any(load_cmd.cmd == LC_CODE_SIGNATURE
+               for image, data, ncmds in patches for load_cmd in image.load_commands):
+            log.warning('Rewriting {0} invalidates its code signature, re-sign it '
+                        'with: codesign -f -s - {0}'.format(path))
+        for image, data, ncmds in patches:
+            struct.pack_into(image.endian + 'II', view, image.offset + 16, ncmds, len(data))
+            start = image.offset + image.header_size
+            data += b'\0' * max(0, image.sizeofcmds - len(data))
+            view[start:start + len(data)] = data
+    return count
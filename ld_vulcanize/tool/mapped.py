@@ -0,0 +1,91 @@
+"""
+Memory-Mapped Files
+
+The parsers operate on a :class:`memoryview` of the mapped file, so
+only the pages holding the headers are read from disk no matter how
+large the file is. Parsers must copy (``bytes(view[a:b])``) anything
+they keep beyond the ``with`` block.
+"""
+
+import os
+import mmap
+import contextlib
+
+from ld_vulcanize import stats
+
+
+@contextlib.contextmanager
+def map_file(f, write=False):
+    """
+    Memory-map an open file
+
+    Args:
+        f: a file object opened in binary mode, for writing if
+            ``write``
+        write (bool): whether changes to the view are written back.
+            They are flushed and fsynced on exit.
+
+    Yields:
+        :class:`memoryview` of the whole file
+    """
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        yield memoryview(b'')
+        return
+    stats.count('bytes_mapped', size)
+    access = mmap.ACCESS_WRITE if write else mmap.ACCESS_READ
+    mm = mmap.mmap(f.fileno(), 0, access=access)
+    try:
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            view.release()
+        if write:
+            mm.flush()
+            os.fsync(f.fileno())
+    finally:
+        mm.close()
+
+
+@contextlib.contextmanager
+def mapped(path, write=False):
+    """
+    Memory-map a file by name
+
+    See :func:`map_file`.
+    """
+    with open(str(path), 'r+b' if write else 'rb') as f:
+        stats.count('files_opened')
+        with map_file(f, write) as view:
+            yield view
+
+
+def read_string(view, offset, end=None, chunk=256):
+    """
+    Return the NUL-terminated string at ``offset``
+
+    Only the bytes up to the terminator are copied.
+
+    Args:
+        view: the buffer
+        offset (int): start of the string
+        end (int or None): the string must terminate before this offset
+        chunk (int): number of bytes to examine at a time
+
+    Returns:
+        bytes or ``None`` if there is no terminator before ``end``
+    """
+    if end is None:
+        end = len(view)
+    parts = []
+    pos = offset
+    while pos < end:
+        raw = bytes(view[pos:min(pos + chunk, end)])
+        nul = raw.find(b'\0')
+        if nul >= 0:
+            parts.append(raw[:nul])
+            return b''.join(parts)
+        parts.append(raw)
+        pos += len(raw)
+    return None
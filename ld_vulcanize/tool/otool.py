@@ -1,30 +1,226 @@
 
-import subprocess
+import os
 import re as re
 
 from ld_vulcanize.path import Path
 
 
+OTOOL = 'otool'
+
+INSTALL_NAME_TOOL = 'install_name_tool'
+
+LIPO = 'lipo'
+
+
+class LoadCommandParser(object):
+
+    ARCHITECTURE = re.compile(r' \(architecture (\S+)\):$')
+
+    def __init__(self):
+        """
+        Incremental parser for ``otool -l`` output
+
+        Feed it one line at a time, the parsed load commands are in
+        :attr:`commands` as pairs ``(arch, cmd)``. The architecture is
+        ``None`` unless the output is from ``otool -arch``.
+        """
+        self.commands = []
+        self._arch = None
+        self._cmd = None
+        self._index = 0
+
+    def __call__(self, line):
+        if line.startswith('Load command '):
+            index = int(line[len('Load command '):])
+            assert index in (0, self._index), 'out of sequence: {0}'.format(line)
+            self._index = index + 1
+            self._cmd = dict()
+            self.commands.append((self._arch, self._cmd))
+            return
+        if line.endswith(':') and not line[:1].isspace():
+            match = self.ARCHITECTURE.search(line)
+            self._arch = match.group(1) if match else None
+            self._cmd = None
+            return
+        if line == 'Section':
+            self._cmd = None  # Ignore section details for LC_SEGMENT*
+            return
+        if self._cmd is None or ' ' not in line.strip():
+            return
+        key, value = line.lstrip().split(' ', 1)
+        self._cmd[key] = value
+        if key in ('name', 'path'):
+            self._cmd['filename'] = value.rsplit(' (offset ', 1)[0]
+
+
 def otool_load_commands(path):
     """
-    Parse ``otool -l`` output  
-    """
-    output = subprocess.check_output(['otool', '-l', str(path)])
-    separator = re.compile('Load command ')
-    blocks = separator.split(output)
-    for i, load_cmd in enumerate(blocks[1:]):
-        cmd = dict()
-        lines = load_cmd.splitlines()
-        assert i == int(lines[0])
-        for line in lines[1:]:
-            if line == 'Section':
-                break  # Ignore section details for LC_SEGMENT*
-            key, value = line.lstrip().split(' ', 1)
-            cmd[key] = value
-            if key == 'name':
-                cmd['filename'] = value.split(' ', 1)[0]
+    Parse ``otool -l`` output
+    """
+    from ld_vulcanize.tool import get_engine
+    parser = LoadCommandParser()
+    get_engine().lines([OTOOL, '-l', str(path)], parser)
+    for arch, cmd in parser.commands:
         yield cmd
-    
+
+
+def otool_linker_commands(path):
+    """
+    Parse the ``LC_LOAD_DYLIB`` and ``LC_RPATH`` commands from ``otool -arch all -l``
+
+    See :func:`ld_vulcanize.tool.macho.macho_linker_commands`.
+    """
+    from ld_vulcanize.tool import get_engine
+    parser = LoadCommandParser()
+    get_engine().lines(_otool_argv(path), parser)
+    return _linker_commands(parser)
+
+
+def otool_linker_commands_many(paths):
+    """
+    Run :func:`otool_linker_commands` on many files as one engine batch
+
+    Raises:
+        the first error
+    """
+    from ld_vulcanize.tool import get_engine
+    parsers = [LoadCommandParser() for path in paths]
+    errors = get_engine().lines_many(
+        [[(_otool_argv(path), parser)] for path, parser in zip(paths, parsers)])
+    for error in errors:
+        if error is not None:
+            raise error
+    return [_linker_commands(parser) for parser in parsers]
+
+
+def _otool_argv(path):
+    return [OTOOL, '-arch', 'all', '-l', str(path)]
+
+
+def _linker_commands(parser):
+    return tuple(
+        (arch, cmd['cmd'], cmd['filename']) for arch, cmd in parser.commands
+        if cmd.get('cmd') in ('LC_LOAD_DYLIB', 'LC_RPATH'))
+
+
+def _argv_limit():
+    """
+    Return the byte budget for the arguments of one command
+
+    Half of ``ARG_MAX``, the environment needs room as well.
+    """
+    try:
+        arg_max = os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError):
+        arg_max = -1
+    if arg_max <= 0:
+        arg_max = 256 * 1024
+    return arg_max // 2
+
+
+def _argv_size(args):
+    # the string, its terminator and the argv pointer
+    return sum(len(os.fsencode(arg)) + 1 + 8 for arg in args)
+
+
+def _rpath_options(rpaths, old_rpaths):
+    from ld_vulcanize.tool.macho import rpath_edits
+    if rpaths is None:
+        return []
+    deleted, added = rpath_edits(list(old_rpaths), list(rpaths))
+    return ([['-delete_rpath', rpath] for rpath in deleted] +
+            [['-add_rpath', rpath] for rpath in added])
+
+
+def _split_options(path, options, limit):
+    fixed = [INSTALL_NAME_TOOL, str(path)]
+    commands = []
+    args = []
+    size = _argv_size(fixed)
+    for option in options:
+        if args and size + _argv_size(option) > limit:
+            commands.append(fixed[:1] + args + fixed[1:])
+            args = []
+            size = _argv_size(fixed)
+        args.extend(option)
+        size += _argv_size(option)
+    if args:
+        commands.append(fixed[:1] + args + fixed[1:])
+    return commands
+
+
+def install_name_tool_commands(path, changes, rpaths=None, old_rpaths=(), limit=None):
+    """
+    Return the ``install_name_tool`` command lines for the changes
+
+    All options go into a single command unless the command line
+    would exceed ``limit``, then they are split into as few commands
+    as possible.
+
+    ``install_name_tool`` edits the search paths of all slices of a
+    fat binary alike. If they differ per architecture, each slice
+    with search path edits is extracted with ``lipo``, changed and
+    put back.
+
+    Args:
+        path: the Mach-O file to modify
+        changes (dict): map of old to new install names
+        rpaths (list, dict or None): the new ``LC_RPATH`` search paths
+            in order, or ``None`` to leave them alone. A dict maps
+            each architecture to its search paths (or ``None``).
+        old_rpaths (list or dict): the current ``LC_RPATH`` search
+            paths, per architecture if ``rpaths`` is a dict
+        limit (int or None): the maximal size of a command line in
+            bytes. Default: half of ``ARG_MAX``
+
+    Returns:
+        list of argument lists
+    """
+    if limit is None:
+        limit = _argv_limit()
+    changed = [['-change', old, new] for old, new in sorted(changes.items())]
+    if not isinstance(rpaths, dict):
+        return _split_options(path, _rpath_options(rpaths, old_rpaths) + changed, limit)
+    per_arch = dict(
+        (arch, _rpath_options(new, old_rpaths.get(arch, ())))
+        for arch, new in rpaths.items())
+    if len(set(repr(options) for options in per_arch.values())) <= 1:
+        options = list(per_arch.values())[0] if per_arch else []
+        return _split_options(path, options + changed, limit)
+    commands = _split_options(path, changed, limit)
+    for arch in sorted(per_arch, key=str):
+        if not per_arch[arch]:
+            continue
+        thin = '{0}.ld-vulcanize-{1}'.format(path, arch)
+        commands.append([LIPO, str(path), '-thin', arch, '-output', thin])
+        commands.extend(_split_options(thin, per_arch[arch], limit))
+        commands.append([LIPO, str(path), '-replace', arch, thin, '-output', str(path)])
+        commands.append(['rm', thin])
+    return commands
+
+
+def install_name_tool_change(path, changes, rpaths=None, old_rpaths=()):
+    """
+    Run ``install_name_tool`` with all changes batched
+
+    See :func:`install_name_tool_commands` for the arguments. Inside
+    :func:`ld_vulcanize.tool.deferred_commands` the commands are only
+    collected.
+
+    Returns:
+        int: the number of commands run
+    """
+    from ld_vulcanize.tool import get_engine, pending_commands
+    commands = install_name_tool_commands(path, changes, rpaths, old_rpaths)
+    pending = pending_commands()
+    if pending is not None:
+        pending.extend(commands)
+        return len(commands)
+    engine = get_engine()
+    for argv in commands:
+        engine.call(argv)
+    return len(commands)
+
 
 
 class ActualPath(object):
@@ -32,17 +228,45 @@ class ActualPath(object):
     EXECUTABLE_PATH = '@executable_path'
     LOADER_PATH = '@loader_path'
     RPATH = '@rpath'
+
+    # system libraries that dyld serves from its shared cache, they
+    # need not exist on disk
+    SHARED_CACHE = ('/usr/lib/', '/System/Library/')
     
-    def __init__(self, executable_path=None, loader_path=None, rpath=None):
+    def __init__(self, executable_path=None, loader_path=None, rpath=None, rpaths=(),
+                 inherited=()):
         """
         Functor to replace dyld special path components
+
+        Args:
+            executable_path (str or None): the directory of the
+                main executable
+            loader_path (str or None): the directory of the binary
+                containing the install name
+            rpath (str or None): a fixed replacement for ``@rpath``
+            rpaths (iterable of str): the ``LC_RPATH`` search paths,
+                tried in order like dyld does
+            inherited (iterable of str): the expanded ``LC_RPATH``
+                directories of the binaries loading this one, tried
+                after its own like dyld's run path stack
         """
         self._executable_path = executable_path
         self._loader_path = loader_path
         self._rpath = rpath
+        self._rpaths = tuple(rpaths)
+        self._inherited = tuple(inherited)
 
-    def __call__(self, loader_path):
-        path = str(loader_path)
+    def expand(self, path):
+        """
+        Replace ``@executable_path`` and ``@loader_path``
+
+        Returns:
+            str: the path, which need not exist
+
+        Raises:
+            RuntimeError: if the replacement is not known
+        """
+        path = str(path)
         if path.startswith(self.EXECUTABLE_PATH):
             if self._executable_path is None:
                 raise RuntimeError('need executable path to resolve {0}'.format(path))
@@ -51,9 +275,56 @@ class ActualPath(object):
             if self._loader_path is None:
                 raise RuntimeError('need loader path to resolve {0}'.format(path))
             path = self._loader_path + path[len(self.LOADER_PATH):]
+        return path
+
+    def search_path(self):
+        """
+        Return the directories searched for ``@rpath``
+
+        Search paths that cannot be expanded, like ``@executable_path``
+        in a shared library, are skipped. The inherited directories
+        come last.
+        """
+        result = [] if self._rpath is None else [self._rpath]
+        for rpath in self._rpaths:
+            try:
+                result.append(os.path.normpath(self.expand(rpath)))
+            except RuntimeError:
+                continue
+        result.extend(dirname for dirname in self._inherited if dirname not in result)
+        return result
+
+    def probe(self, loader_path):
+        """
+        Resolve an install name and count the files dyld tries
+
+        Missing libraries in :attr:`SHARED_CACHE` directories are
+        assumed to be in the dyld shared cache, their path is
+        returned nevertheless.
+
+        Returns:
+            pair ``(path, probes)``. The path is ``None`` if an
+            ``@rpath`` install name is not found in any of the search
+            paths, then all of them were tried. Without search paths
+            nothing is tried.
+        """
+        path = self.expand(loader_path)
         if path.startswith(self.RPATH):
-            if self._rpath is None:
-                raise RuntimeError('need rpath to resolve {0}'.format(path))
-            path = self._rpath + path[len(self.RPATH):]
-        return Path(path)
-    
+            search_path = self.search_path()
+            for probes, dirname in enumerate(search_path, 1):
+                candidate = dirname + path[len(self.RPATH):]
+                if os.path.exists(candidate):
+                    return Path(candidate), probes
+            return None, len(search_path)
+        if path.startswith(self.SHARED_CACHE) and not os.path.exists(path):
+            return Path.canonical(os.path.normpath(path)), 1
+        return Path(path), 1
+
+    def __call__(self, loader_path):
+        """
+        Return the :class:`ld_vulcanize.path.Path` of an install name
+
+        Returns ``None`` if an ``@rpath`` install name is not found in
+        any of the search paths.
+        """
+        return self.probe(loader_path)[0]
@@ -7,7 +7,7 @@ setup(
     description='Self-Contained Library Paths',
     author='Volker Braun',
     author_email='vbraun.name@gmail.com',
-    packages=['ld_vulcanize', 'ld_vulcanize.tool'],
+    packages=['ld_vulcanize', 'ld_vulcanize.tool', 'ld_vulcanize.benchmark'],
     scripts=['bin/ld-vulcanize'],
     version='1.0',
     url='https://github.com/vbraun/ld-vulcanize',
@@ -0,0 +1,81 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize import synthetic
+from ld_vulcanize.analyze import LoadCost, analyze, dump
+
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
+
+
+class TestLoadCost(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.root = os.path.join(self.tmp, 'prefix')
+        make_macho_tree(self.root, os.path.join(self.tmp, 'system', 'libSystem.dylib'))
+        # @rpath/libfoo.dylib is only found in the second search path
+        other = os.path.join(self.root, 'other', 'libbar.dylib')
+        synthetic.write_binary(other, synthetic.macho_image(synthetic.MH_DYLIB))
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'rp'), synthetic.macho_image(
+            dylibs=['@rpath/libfoo.dylib', other, '@rpath/libmissing.dylib'],
+            rpaths=['@executable_path/../other', '@executable_path/../lib']), executable=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_report(self):
+        report = LoadCost(MachOFinder(self.root), worst=1).report()
+        foo, rp = report['executables']
+        self.assertEqual(foo, dict(
+            path=os.path.join(self.root, 'bin', 'foo'),
+            libraries=3, depth=2, probes=3, missing=[], duplicates=[]))
+        # libSystem is loaded by libfoo, libbar reuses it
+        self.assertEqual((rp['libraries'], rp['depth'], rp['probes']), (4, 2, 7))
+        self.assertEqual(rp['missing'], ['@rpath/libmissing.dylib'])
+        self.assertEqual(rp['duplicates'], [dict(name='libbar.dylib', paths=[
+            os.path.join(self.root, 'lib', 'libbar.dylib'),
+            os.path.join(self.root, 'other', 'libbar.dylib')])])
+        self.assertEqual(report['worst'], [rp['path']])
+        self.assertEqual(report['summary'], dict(
+            executables=2, probes=10, max_libraries=4, max_depth=2, duplicates=1, missing=1))
+
+    def test_external_dependencies(self):
+        system = os.path.join(self.tmp, 'system')
+        lib_b = synthetic.write_binary(os.path.join(system, 'libB.dylib'),
+                                       synthetic.macho_image(synthetic.MH_DYLIB))
+        lib_a = synthetic.write_binary(os.path.join(system, 'libA.dylib'),
+                                       synthetic.macho_image(synthetic.MH_DYLIB, dylibs=[lib_b]))
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'sys'),
+                               synthetic.macho_image(dylibs=[lib_a]), executable=True)
+        report = LoadCost(MachOFinder(self.root)).report()
+        sys_exe, = [entry for entry in report['executables'] if entry['path'].endswith('/sys')]
+        self.assertEqual((sys_exe['libraries'], sys_exe['depth'], sys_exe['probes']), (2, 2, 2))
+
+    def test_inherited_rpath(self):
+        # liba has no LC_RPATH, dyld searches those of bin/chain for its @rpath name
+        lib = os.path.join(self.root, 'lib')
+        synthetic.write_binary(os.path.join(lib, 'libleaf.dylib'),
+                               synthetic.macho_image(synthetic.MH_DYLIB))
+        synthetic.write_binary(os.path.join(lib, 'liba.dylib'), synthetic.macho_image(
+            synthetic.MH_DYLIB, dylibs=['@rpath/libleaf.dylib']))
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'chain'), synthetic.macho_image(
+            dylibs=['@rpath/liba.dylib'],
+            rpaths=['@executable_path/../other', '@executable_path/../lib']), executable=True)
+        binaries = MachOFinder(self.root)
+        liba, = [shlib for shlib in binaries.internal_shlib if shlib.filename == 'liba.dylib']
+        self.assertEqual(liba.load_probes(), [
+            ('@rpath/libleaf.dylib', 2, os.path.join(lib, 'libleaf.dylib'))])
+        report = LoadCost(binaries).report()
+        chain, = [entry for entry in report['executables'] if entry['path'].endswith('/chain')]
+        self.assertEqual((chain['libraries'], chain['probes'], chain['missing']), (2, 4, []))
+
+    def test_json(self):
+        binaries = MachOFinder(self.root)
+        f = io.StringIO()
+        dump(analyze(binaries, 'loadcost'), f)
+        self.assertEqual(json.loads(f.getvalue())['summary']['executables'], 2)
+        self.assertRaises(ValueError, analyze, binaries, 'nonsense')
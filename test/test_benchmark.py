@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize.benchmark.tree import generate_tree, time_phases, PHASES
+from ld_vulcanize.synthetic import ElfFinder, MachOFinder
+
+
+class TestTree(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_generate(self):
+        for fmt, finder in (('macho', MachOFinder), ('elf', ElfFinder)):
+            root = os.path.join(self.tmp, fmt)
+            counts = generate_tree(root, fmt, executables=3, libraries=12, fanout=2,
+                                   depth=3, noise=5)
+            self.assertEqual(counts, dict(files=20))
+            binaries = finder(root)
+            self.assertEqual(len(binaries.executable), 3)
+            self.assertEqual(len(binaries.internal_shlib), 12)
+            self.assertEqual(len(binaries.external_shlib), 0)
+            self.assertEqual(sorted(time_phases(root, fmt)), sorted(PHASES))
+            # the last layer of libraries links nothing
+            summary = finder(root).make_paths_absolute()
+            self.assertEqual(summary.files, 3 + 8)
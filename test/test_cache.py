@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize import synthetic
+from ld_vulcanize.cache import ScanCache, ExternalIndex
+
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
+
+
+class TestScanCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.root = os.path.join(self.tmp, 'prefix')
+        self.external = os.path.join(self.tmp, 'system', 'libSystem.dylib')
+        make_macho_tree(self.root, self.external)
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def scan(self):
+        cache = ScanCache(self.cache_dir)
+        binaries = MachOFinder(self.root, cache=cache)
+        cache.close()
+        return binaries, cache
+
+    def test_hits(self):
+        binaries, cache = self.scan()
+        self.assertEqual(cache.hits, 0)
+        binaries, cache = self.scan()
+        self.assertEqual((cache.hits, cache.misses), (7, 0))
+        exe, = binaries.executable
+        self.assertEqual([shlib.filename for shlib in exe.internal_shlib], ['libfoo.dylib'])
+
+    def test_invalidate(self):
+        self.scan()
+        synthetic.write_binary(os.path.join(self.root, 'lib', 'libbar.dylib'),
+                               synthetic.macho_image(synthetic.MH_DYLIB, text_offset=0x2000))
+        binaries, cache = self.scan()
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(binaries.external_shlib), 1)
+
+    def test_rewrite(self):
+        binaries, cache = self.scan()
+        cache = ScanCache(self.cache_dir)
+        binaries = MachOFinder(self.root, cache=cache)
+        binaries.make_paths_relative()
+        cache.close()
+        binaries, cache = self.scan()
+        self.assertEqual(cache.misses, 0)
+        exe, = binaries.executable
+        self.assertEqual(exe.linker_paths, ((None, 'LC_LOAD_DYLIB', '@executable_path/../lib/libfoo.dylib'),))
+
+
+class TestExternalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.root = os.path.join(self.tmp, 'prefix')
+        self.external = os.path.join(self.tmp, 'system', 'libSystem.dylib')
+        make_macho_tree(self.root, self.external)
+        self.index_dir = os.path.join(self.tmp, 'index')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def scan(self, fingerprint='test'):
+        index = ExternalIndex(self.index_dir, fingerprint=fingerprint)
+        binaries = MachOFinder(self.root, index=index)
+        self.assertEqual([shlib.path.absolute() for shlib in binaries.external_shlib],
+                         [self.external])
+        return binaries, index
+
+    def test_hits(self):
+        binaries, index = self.scan()
+        self.assertEqual((index.hits, index.misses, len(index)), (0, 1, 1))
+        index.close()
+        binaries, index = self.scan()
+        self.assertEqual((index.hits, index.misses), (1, 0))
+        shlib, = binaries.external_shlib
+        self.assertEqual(shlib.dependents, ())
+        index.close()
+
+    def test_invalidate(self):
+        self.scan()[1].close()
+        synthetic.write_binary(self.external, synthetic.macho_image(
+            synthetic.MH_DYLIB, text_offset=0x2000))
+        binaries, index = self.scan()
+        self.assertEqual((index.hits, index.misses), (0, 1))
+        index.close()
+        binaries, index = self.scan(fingerprint='other system')
+        self.assertEqual((index.hits, index.misses), (0, 1))
+        index.close()
+
+    def test_shared_cache(self):
+        # not on disk, but served from the dyld shared cache
+        system = '/System/Library/Frameworks/Missing.framework/Missing'
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'sys'), synthetic.macho_image(
+            dylibs=[system]), executable=True)
+        index = ExternalIndex(self.index_dir, fingerprint='test')
+        binaries = MachOFinder(self.root, index=index)
+        self.assertEqual(sorted(shlib.path.absolute() for shlib in binaries.external_shlib),
+                         sorted([self.external, system]))
+        self.assertEqual(len(index), 1)
+        index.close()
@@ -0,0 +1,77 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize import synthetic
+from ld_vulcanize import stats
+from ld_vulcanize.tool import elf
+from ld_vulcanize.classify import classify_file, MACHO, ELF, EXECUTABLE, SHARED_LIBRARY
+
+
+class TestClassify(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def classify(self, filename, data, executable=False):
+        return classify_file(synthetic.write_binary(os.path.join(self.tmp, filename), data,
+                                                    executable=executable))
+
+    def test_macho(self):
+        self.assertEqual(self.classify('libfoo.so.1.2', synthetic.macho_image(synthetic.MH_DYLIB)),
+                         (MACHO, SHARED_LIBRARY))
+        self.assertEqual(self.classify('foo.bundle', synthetic.macho_image(synthetic.MH_BUNDLE)),
+                         (MACHO, SHARED_LIBRARY))
+        self.assertEqual(self.classify('foo', synthetic.macho_image(endian='>', is_64=False),
+                                       executable=True),
+                         (MACHO, EXECUTABLE))
+        fat = synthetic.fat_binary([(synthetic.CPU_TYPE_X86_64, synthetic.macho_image())])
+        self.assertEqual(self.classify('fat', fat, executable=True), (MACHO, EXECUTABLE))
+        # not runnable without an executable bit
+        self.assertEqual(self.classify('noexec', synthetic.macho_image()), (None, None))
+
+    def test_elf_synthetic(self):
+        self.assertEqual(self.classify('foo', synthetic.elf_image(elf.ET_EXEC), executable=True),
+                         (ELF, EXECUTABLE))
+        self.assertEqual(self.classify('pie', synthetic.elf_image(pie=True), executable=True),
+                         (ELF, EXECUTABLE))
+        self.assertEqual(self.classify('libfoo.so', synthetic.elf_image(), executable=True),
+                         (ELF, SHARED_LIBRARY))
+        self.assertEqual(self.classify('noexec', synthetic.elf_image(elf.ET_EXEC)), (None, None))
+        # without an executable bit the header suffices, even for a PIE
+        stats.get_stats().reset()
+        self.assertEqual(self.classify('libbar.so', synthetic.elf_image(pie=True)),
+                         (ELF, SHARED_LIBRARY))
+        self.assertEqual(stats.get_stats().counters['bytes_read'], 24)
+
+    def test_magic_only(self):
+        stats.get_stats().reset()
+        self.assertEqual(self.classify('script', b'#!/bin/sh\n' * 8, executable=True), (None, None))
+        self.assertEqual(stats.get_stats().counters['bytes_read'], 4)
+
+    def test_not_binary(self):
+        self.assertEqual(self.classify('fake.so', b'INPUT(-lfoo)\n' * 4), (None, None))
+        self.assertEqual(self.classify('foo.h', synthetic.macho_image()), (None, None))
+        self.assertEqual(self.classify('empty', b''), (None, None))
+        java = b'\xca\xfe\xba\xbe\x00\x00\x00\x34' + b'\0' * 32
+        self.assertEqual(self.classify('Foo.class', java), (None, None))
+        # fat headers cut off before the offset of the first architecture
+        fat = b'\xca\xfe\xba\xbe\x00\x00\x00\x01'
+        fat_64 = b'\xca\xfe\xba\xbf\x00\x00\x00\x01'
+        for size in range(16, 20):
+            self.assertEqual(self.classify('fat', fat + b'\0' * (size - 8)), (None, None))
+        for size in range(16, 24):
+            self.assertEqual(self.classify('fat64', fat_64 + b'\0' * (size - 8)), (None, None))
+        self.assertEqual(self.classify('fat64', b'\xca\xfe\xba\xbf\x00\x00\x01\x00' + b'\0' * 32),
+                         (None, None))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'needs ELF system binaries')
+    def test_elf(self):
+        import _sqlite3
+        self.assertEqual(classify_file(_sqlite3.__file__), (ELF, SHARED_LIBRARY))
+        self.assertEqual(classify_file(os.path.realpath(sys.executable)), (ELF, EXECUTABLE))
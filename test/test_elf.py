@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize import synthetic
+from ld_vulcanize.tool import elf
+from ld_vulcanize.tool.elf import elf_dynamic_entries, set_runpath, ElfError, ElfFile
+from ld_vulcanize.tool.mapped import mapped
+from ld_vulcanize.find import HardlinkError
+from ld_vulcanize.synthetic import ElfFinder
+
+
+class TestElf(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, filename, executable=False, **kwds):
+        return synthetic.write_binary(os.path.join(self.tmp, filename), synthetic.elf_image(**kwds),
+                                      executable=executable)
+
+    def test_entries(self):
+        for is_64 in (True, False):
+            for endian in ('<', '>'):
+                filename = self.write('libfoo.so', needed=['libbar.so.1', 'libc.so.6'],
+                                      rpath='/opt/lib', is_64=is_64, endian=endian)
+                self.assertEqual(elf_dynamic_entries(filename), (
+                    ('NEEDED', 'libbar.so.1'), ('NEEDED', 'libc.so.6'), ('RPATH', '/opt/lib')))
+
+    def test_set_runpath(self):
+        filename = self.write('libfoo.so', needed=['libbar.so'], rpath='/opt/local/lib')
+        set_runpath(filename, '$ORIGIN')
+        self.assertEqual(elf_dynamic_entries(filename), (
+            ('NEEDED', 'libbar.so'), ('RUNPATH', '$ORIGIN')))
+        set_runpath(filename, '/opt/local/lib')
+        self.assertRaises(ElfError, set_runpath, filename, '/opt/local/lib:/usr/lib')
+        self.assertEqual(elf_dynamic_entries(filename)[-1], ('RUNPATH', '/opt/local/lib'))
+
+    def strings(self, filename):
+        with mapped(filename) as view:
+            elf_file = ElfFile(view)
+            elf_file.read_strings()
+            return sorted(elf_file.string(offset) for offset in elf_file.string_references())
+
+    def test_set_runpath_shared_strings(self):
+        # a symbol name is the tail of the rpath, the empty one shares its terminator
+        for is_64 in (True, False):
+            filename = self.write('libfoo.so', needed=['libc.so.6'], rpath='/opt/local/lib',
+                                  symbols=['lib', '', 'bar'],
+                                  verneed=[('libc.so.6', ['GLIBC_2.2.5'])], is_64=is_64)
+            strings = self.strings(filename)
+            self.assertEqual(strings, ['', '', '/opt/local/lib', 'GLIBC_2.2.5', 'bar', 'lib',
+                                       'libc.so.6', 'libc.so.6'])
+            self.assertRaises(ElfError, set_runpath, filename, '/opt/local/x')
+            set_runpath(filename, '/opt/loc')
+            self.assertEqual(self.strings(filename), sorted(['/opt/loc'] + strings[:2] + strings[3:]))
+        filename = self.write('libbar.so', runpath='/opt/local/lib', symbols=[''])
+        set_runpath(filename, '/opt')
+        set_runpath(filename, '$ORIGIN/../lib')
+        self.assertEqual(self.strings(filename), ['', '', '$ORIGIN/../lib'])
+
+    def test_inherited_rpath(self):
+        # liba has no search path, ld.so tries the DT_RPATH of bin/app for it
+        root = os.path.join(self.tmp, 'prefix')
+        lib = os.path.join(root, 'lib')
+        self.write('prefix/lib/libb.so', soname='libb.so')
+        self.write('prefix/lib/liba.so', soname='liba.so', needed=['libb.so'])
+        self.write('prefix/lib/libc.so', soname='libc.so', needed=['libb.so'], runpath='/nowhere')
+        self.write('prefix/bin/app', e_type=elf.ET_EXEC, needed=['liba.so', 'libc.so'],
+                   rpath=lib + ':/opt/x', executable=True)
+        binaries = ElfFinder(root)
+        libs = dict((shlib.filename, shlib) for shlib in binaries.internal_shlib)
+        self.assertEqual(libs['liba.so'].dependents, (os.path.join(lib, 'libb.so'),))
+        self.assertEqual(libs['liba.so'].load_probes(), [
+            ('libb.so', 1, os.path.join(lib, 'libb.so'))])
+        # DT_RUNPATH disables the inherited DT_RPATH
+        self.assertEqual(libs['libc.so'].dependents, ())
+        self.assertEqual(libs['libc.so'].missing, ('libb.so',))
+        binaries.make_paths_relative()
+        self.assertEqual(elf_dynamic_entries(os.path.join(root, 'bin', 'app'))[-1],
+                         ('RPATH', '$ORIGIN/../lib:/opt/x'))
+        self.assertEqual(elf_dynamic_entries(os.path.join(lib, 'liba.so'))[-1],
+                         ('NEEDED', 'libb.so'))
+
+    def test_hardlinks(self):
+        # bin/app and libexec/app need the same DT_RUNPATH, sbin/sub/app another
+        root = os.path.join(self.tmp, 'prefix')
+        lib = os.path.join(root, 'lib')
+        self.write('prefix/lib/liba.so', soname='liba.so')
+        app = self.write('prefix/bin/app', e_type=elf.ET_EXEC, needed=['liba.so'],
+                         runpath=lib, executable=True)
+        for dirname in ('libexec', os.path.join('sbin', 'sub')):
+            os.makedirs(os.path.join(root, dirname))
+            os.link(app, os.path.join(root, dirname, 'app'))
+        self.assertRaises(HardlinkError, ElfFinder(root).make_paths_relative)
+        self.assertEqual(elf_dynamic_entries(app)[-1], ('RUNPATH', lib))
+        self.assertEqual(ElfFinder(root).make_paths_absolute().files, 0)
+        os.remove(os.path.join(root, 'sbin', 'sub', 'app'))
+        self.assertEqual(ElfFinder(root).make_paths_relative().files, 1)
+        self.assertEqual(elf_dynamic_entries(app)[-1], ('RUNPATH', '$ORIGIN/../lib'))
+
+    def test_relocate(self):
+        root = os.path.join(self.tmp, 'prefix')
+        lib = os.path.join(root, 'lib')
+        system = os.path.join(self.tmp, 'system')
+        self.write('system/libsys.so', soname='libsys.so')
+        self.write('prefix/lib/libbar.so.1.2', soname='libbar.so.1', needed=['libsys.so'],
+                   runpath=system)
+        os.symlink('libbar.so.1.2', os.path.join(lib, 'libbar.so.1'))
+        self.write('prefix/lib/libfoo.so', needed=['libbar.so.1', 'libsys.so'],
+                   runpath=lib + ':' + system)
+        self.write('prefix/bin/foo', e_type=elf.ET_EXEC, needed=['libfoo.so'], runpath=lib,
+                   executable=True)
+        self.write('prefix/bin/bar', pie=True, needed=['libfoo.so', 'libmissing.so'], rpath=lib,
+                   executable=True)
+        binaries = ElfFinder(root)
+        self.assertEqual(sorted(exe.filename for exe in binaries.executable), ['bar', 'foo'])
+        self.assertEqual(sorted(shlib.filename for shlib in binaries.internal_shlib),
+                         ['libbar.so.1.2', 'libfoo.so'])
+        self.assertEqual([shlib.filename for shlib in binaries.external_shlib], ['libsys.so'])
+        binaries.make_paths_relative()
+
+        def runpath(filename):
+            return elf_dynamic_entries(os.path.join(root, filename))[-1]
+        self.assertEqual(runpath('bin/foo'), ('RUNPATH', '$ORIGIN/../lib'))
+        self.assertEqual(runpath('bin/bar'), ('RUNPATH', '$ORIGIN/../lib'))
+        self.assertEqual(runpath('lib/libfoo.so'), ('RUNPATH', '$ORIGIN:' + system))
+        self.assertEqual(runpath('lib/libbar.so.1.2'), ('RUNPATH', system))
+        binaries = ElfFinder(root)
+        binaries.make_paths_absolute()
+        self.assertEqual(runpath('bin/foo'), ('RUNPATH', lib))
+        self.assertEqual(runpath('lib/libfoo.so'), ('RUNPATH', lib + ':' + system))
+        binaries = ElfFinder(root)
+        binaries.make_paths_rpath()
+        self.assertEqual(runpath('bin/foo'), ('RUNPATH', '$ORIGIN/../lib'))
+        self.assertEqual(runpath('lib/libbar.so.1.2'), ('RUNPATH', system))
@@ -0,0 +1,249 @@
+import os
+import sys
+import shutil
+import tempfile
+import time
+import unittest
+import subprocess
+import contextlib
+from io import StringIO
+
+from ld_vulcanize import tool
+from ld_vulcanize.tool import otool
+from ld_vulcanize.tool.engine import SyncEngine, AsyncEngine
+from ld_vulcanize import synthetic
+from ld_vulcanize.tool.macho import macho_load_commands
+from ld_vulcanize.find import RewriteError
+
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
+
+
+FAKE_OTOOL = """#!{python}
+# Prints the native parse in the format of otool -l
+import sys
+sys.path.insert(0, {root!r})
+from ld_vulcanize.tool.macho import read_images
+from ld_vulcanize.tool.mapped import mapped
+path = sys.argv[-1]
+with mapped(path) as view:
+    images = read_images(view)
+for image in images:
+    if sys.argv[1:3] == ['-arch', 'all'] and image.offset:
+        print('{{0}} (architecture {{1}}):'.format(path, image.arch))
+    else:
+        print(path + ':')
+    for i, load_cmd in enumerate(image.load_commands):
+        print('Load command {{0}}'.format(i))
+        cmd = load_cmd.as_dict()
+        for key in ('cmd', 'cmdsize', 'name', 'path'):
+            if key in cmd:
+                print('{{0:>13}} {{1}}'.format(key, cmd[key]))
+        if load_cmd.name.startswith('LC_SEGMENT'):
+            print('Section')
+            print('  sectname __text')
+"""
+
+FAKE_INSTALL_NAME_TOOL = """#!{python}
+# install_name_tool [-change old new] [-add_rpath new] [-delete_rpath old] ... file
+import sys
+sys.path.insert(0, {root!r})
+from ld_vulcanize.tool.macho import change_dylibs, macho_linker_commands
+args = sys.argv[1:]
+path = args.pop()
+rpaths = [value for arch, cmd, value in macho_linker_commands(path) if cmd == 'LC_RPATH']
+changes = dict()
+while args:
+    if args[0] == '-change':
+        changes[args[1]] = args[2]
+        args = args[3:]
+    elif args[0] == '-add_rpath':
+        rpaths.append(args[1])
+        args = args[2:]
+    elif args[0] == '-delete_rpath':
+        rpaths.remove(args[1])
+        args = args[2:]
+    else:
+        sys.exit('unknown option ' + args[0])
+change_dylibs(path, changes, rpaths)
+"""
+
+
+def write_script(filename, template):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(filename, 'w') as f:
+        f.write(template.format(python=sys.executable, root=root))
+    os.chmod(filename, 0o755)
+    return filename
+
+
+class TestEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.root = os.path.join(self.tmp, 'prefix')
+        self.external = os.path.join(self.tmp, 'system', 'libSystem.dylib')
+        make_macho_tree(self.root, self.external)
+        self.tools = (otool.OTOOL, otool.INSTALL_NAME_TOOL)
+        otool.OTOOL = write_script(os.path.join(self.tmp, 'otool'), FAKE_OTOOL)
+        otool.INSTALL_NAME_TOOL = write_script(
+            os.path.join(self.tmp, 'install_name_tool'), FAKE_INSTALL_NAME_TOOL)
+        tool.set_backend('otool')
+
+    def tearDown(self):
+        tool.set_backend('native')
+        tool.set_engine('sync').close()
+        otool.OTOOL, otool.INSTALL_NAME_TOOL = self.tools
+        shutil.rmtree(self.tmp)
+
+    def _dylibs(self, filename):
+        return [cmd['filename'] for cmd in macho_load_commands(os.path.join(self.root, filename))
+                if cmd['cmd'] == 'LC_LOAD_DYLIB']
+
+    def test_otool_load_commands(self):
+        cmds = list(otool.otool_load_commands(os.path.join(self.root, 'lib', 'libfoo.dylib')))
+        self.assertEqual(
+            [cmd['filename'] for cmd in cmds if cmd['cmd'] == 'LC_LOAD_DYLIB'],
+            [os.path.join(self.root, 'lib', 'libbar.dylib'), self.external])
+        self.assertNotIn('sectname', cmds[0])
+
+    def test_otool_linker_commands(self):
+        cmds = otool.otool_linker_commands(os.path.join(self.root, 'lib', 'libfoo.dylib'))
+        self.assertEqual(cmds, (
+            (None, 'LC_LOAD_DYLIB', os.path.join(self.root, 'lib', 'libbar.dylib')),
+            (None, 'LC_LOAD_DYLIB', self.external)))
+
+    def test_rewrite(self):
+        for engine in (SyncEngine(), AsyncEngine(limit=2)):
+            tool.set_engine(engine).close()
+            binaries = MachOFinder(self.root, jobs=4)
+            summary = binaries.make_paths_relative()
+            self.assertEqual((summary.files, summary.commands), (2, 2))
+            self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+            self.assertEqual(self._dylibs('lib/libfoo.dylib'),
+                             ['@loader_path/libbar.dylib', self.external])
+            binaries.make_paths_rpath()
+            self.assertEqual(self._dylibs('bin/foo'), ['@rpath/libfoo.dylib'])
+            binaries = MachOFinder(self.root, jobs=4)
+            binaries.make_paths_absolute()
+            self.assertEqual(self._dylibs('bin/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+            self.assertEqual(
+                [cmd for cmd in macho_load_commands(os.path.join(self.root, 'bin/foo'))
+                 if cmd['cmd'] == 'LC_RPATH'], [])
+
+    def test_failure(self):
+        for engine in (SyncEngine(), AsyncEngine(limit=1)):
+            self.assertRaises(subprocess.CalledProcessError, engine.call, ['false'])
+
+            def consumer(line):
+                raise RuntimeError(line)
+            self.assertRaises(RuntimeError, engine.lines, ['yes'], consumer)
+            engine.close()
+
+    def test_lines_many(self):
+        echo = lambda word: [sys.executable, '-c', 'print({0!r})'.format(word)]
+        for engine in (SyncEngine(), AsyncEngine(limit=2)):
+            lines = []
+            errors = engine.lines_many([
+                [(echo('a'), lines.append), (echo('b'), lines.append)],
+                [(['false'], lines.append), (echo('c'), lines.append)],
+            ])
+            engine.close()
+            self.assertEqual(lines, ['a', 'b'])
+            self.assertIsNone(errors[0])
+            self.assertIsInstance(errors[1], subprocess.CalledProcessError)
+
+    def test_lines_many_concurrent(self):
+        sleep = [sys.executable, '-c', 'import time; time.sleep(0.5)']
+        engine = AsyncEngine(limit=4)
+        start = time.time()
+        errors = engine.lines_many([[(sleep, lambda line: None)]] * 4)
+        elapsed = time.time() - start
+        engine.close()
+        self.assertEqual(errors, [None] * 4)
+        self.assertLess(elapsed, 1.5)
+
+    def test_batch_rewrite_failure(self):
+        # the commands of one file fail, the others are still rewritten
+        tool.set_engine(AsyncEngine(limit=2)).close()
+        binaries = MachOFinder(self.root, jobs=4)
+        working = otool.INSTALL_NAME_TOOL
+        otool.INSTALL_NAME_TOOL = os.path.join(self.tmp, 'failing_install_name_tool')
+        with open(otool.INSTALL_NAME_TOOL, 'w') as f:
+            f.write('#!/bin/sh\ncase "$*" in */bin/foo) exit 1;; esac\nexec {0} "$@"\n'.format(working))
+        os.chmod(otool.INSTALL_NAME_TOOL, 0o755)
+        with self.assertRaises(RewriteError) as cm:
+            binaries.make_paths_relative()
+        otool.INSTALL_NAME_TOOL = working
+        summary = cm.exception.summary
+        self.assertEqual([str(artifact.path) for artifact, error in summary.failures],
+                         [os.path.join(self.root, 'bin/foo')])
+        self.assertEqual(self._dylibs('lib/libfoo.dylib'),
+                         ['@loader_path/libbar.dylib', self.external])
+        self.assertEqual(self._dylibs('bin/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+        # the failed artifact still knows its old install names
+        binaries.make_paths_relative()
+        self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+
+    def test_decode(self):
+        # an install name that is not UTF-8, and one that is
+        output = b'/lib/caf\xe9.dylib\n/lib/caf\xc3\xa9.dylib\n'
+        argv = [sys.executable, '-c', 'import sys; sys.stdout.buffer.write({0!r})'.format(output)]
+        expected = [os.fsdecode(b'/lib/caf\xe9.dylib'), os.fsdecode(b'/lib/caf\xc3\xa9.dylib')]
+        for engine in (SyncEngine(), AsyncEngine(limit=1)):
+            lines = []
+            engine.lines(argv, lines.append)
+            engine.close()
+            self.assertEqual(lines, expected)
+
+    def test_batch(self):
+        changes = {'/a.dylib': '@loader_path/a.dylib', '/b.dylib': '@loader_path/b.dylib'}
+        filename = synthetic.write_binary(
+            os.path.join(self.tmp, 'a.out'),
+            synthetic.macho_image(dylibs=['/a.dylib', '/b.dylib']))
+        commands = otool.install_name_tool_commands(filename, changes)
+        self.assertEqual(commands, [[
+            otool.INSTALL_NAME_TOOL,
+            '-change', '/a.dylib', '@loader_path/a.dylib',
+            '-change', '/b.dylib', '@loader_path/b.dylib', filename]])
+        chunked = otool.install_name_tool_commands(filename, changes, limit=1)
+        self.assertEqual([argv[1:4] for argv in chunked],
+                         [['-change', '/a.dylib', '@loader_path/a.dylib'],
+                          ['-change', '/b.dylib', '@loader_path/b.dylib']])
+        self.assertEqual(tool.change_dylibs(filename, changes), 1)
+        self.assertEqual(
+            [cmd['filename'] for cmd in macho_load_commands(filename)
+             if cmd['cmd'] == 'LC_LOAD_DYLIB'],
+            ['@loader_path/a.dylib', '@loader_path/b.dylib'])
+
+    def test_slice_rpaths(self):
+        # install_name_tool edits all slices alike, differing ones go through lipo
+        old = {'x86_64': ['@loader_path'], 'arm64': ['/opt/lib', '@loader_path']}
+        same = otool.install_name_tool_commands(
+            'fat', {}, {'x86_64': [], 'arm64': ['/opt/lib']}, old)
+        self.assertEqual(same, [[otool.INSTALL_NAME_TOOL, '-delete_rpath', '@loader_path', 'fat']])
+        split = otool.install_name_tool_commands(
+            'fat', {'/a.dylib': '/b.dylib'}, {'x86_64': [], 'arm64': None}, old)
+        self.assertEqual(split, [
+            [otool.INSTALL_NAME_TOOL, '-change', '/a.dylib', '/b.dylib', 'fat'],
+            [otool.LIPO, 'fat', '-thin', 'x86_64', '-output', 'fat.ld-vulcanize-x86_64'],
+            [otool.INSTALL_NAME_TOOL, '-delete_rpath', '@loader_path', 'fat.ld-vulcanize-x86_64'],
+            [otool.LIPO, 'fat', '-replace', 'x86_64', 'fat.ld-vulcanize-x86_64', '-output', 'fat'],
+            ['rm', 'fat.ld-vulcanize-x86_64'],
+        ])
+
+    def test_dry_run(self):
+        tool.set_dry_run(True)
+        output = StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                summary = MachOFinder(self.root, jobs=4).make_paths_relative()
+        finally:
+            tool.set_dry_run(False)
+        self.assertEqual((summary.files, summary.commands), (2, 2))
+        self.assertEqual(self._dylibs('bin/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+        self.assertEqual(sorted(output.getvalue().splitlines()), [
+            '{0} -change {1}/lib/libbar.dylib @loader_path/libbar.dylib {1}/lib/libfoo.dylib'.format(
+                otool.INSTALL_NAME_TOOL, self.root),
+            '{0} -change {1}/lib/libfoo.dylib @executable_path/../lib/libfoo.dylib {1}/bin/foo'.format(
+                otool.INSTALL_NAME_TOOL, self.root),
+        ])
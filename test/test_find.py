@@ -1,24 +1,285 @@
-
 import os
+import shutil
+import tempfile
 import unittest
 
+from ld_vulcanize import synthetic
 from ld_vulcanize.path import Path
-from ld_vulcanize.find import ArtifactFinder
+from ld_vulcanize import stats
+from ld_vulcanize.rules import Rules
+from ld_vulcanize.find import (
+    Find, FileList, ArtifactFinder, RewriteError, HardlinkError, read_file_list)
+from ld_vulcanize.tool.macho import macho_load_commands, macho_linker_commands
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
 
 
 class TestFindBinaries(unittest.TestCase):
 
     def setUp(self):
         import _sqlite3
+        self.sqlite_path = Path(_sqlite3.__file__)
         self.ld_dynload = Path(os.path.dirname(_sqlite3.__file__))
 
     def tearDown(self):
         pass
 
     def test_find_binaries(self):
+        # the extension suffix is platform dependent, _sqlite3*.so
         binaries = ArtifactFinder(self.ld_dynload)
-        sqlite_path = self.ld_dynload + '_sqlite3.so'
         self.assertTrue(any(
-            shlib.path == sqlite_path for shlib in binaries.internal_shlib
+            shlib.path == self.sqlite_path for shlib in binaries.internal_shlib
         ))
 
+
+class TestFind(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        os.makedirs(os.path.join(self.tmp, 'include', 'sub'))
+        with open(os.path.join(self.tmp, 'include', 'sub', 'foo.h'), 'w') as f:
+            f.write('#pragma once\n')
+        os.symlink(os.path.join(self.tmp, 'include'), os.path.join(self.tmp, 'link'))
+        os.symlink('foo.h', os.path.join(self.tmp, 'include', 'sub', 'bar.h'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_walk(self):
+        found = list(Find(self.tmp).walk())
+        self.assertEqual([path.absolute() for path, st in found],
+                         [os.path.join(self.tmp, 'include', 'sub', 'foo.h')])
+        self.assertEqual(found[0][1].st_size, 13)
+
+    def test_file_list(self):
+        names = ['include/sub/foo.h', 'include/sub/bar.h', 'link/sub/foo.h', 'missing.h',
+                 os.path.join(self.tmp, 'include', 'sub', 'foo.h')]
+        found = list(FileList(self.tmp, names).walk())
+        self.assertEqual([path.absolute() for path, st in found],
+                         [os.path.join(self.tmp, 'include', 'sub', 'foo.h')])
+        with self.assertRaises(ValueError):
+            list(FileList(os.path.join(self.tmp, 'include'), ['../other.h']).walk())
+        with self.assertRaises(ValueError):
+            list(FileList(os.path.join(self.tmp, 'include'), [os.path.dirname(self.tmp)]).walk())
+
+    def test_read_file_list(self):
+        filename = os.path.join(self.tmp, 'files')
+        with open(filename, 'w') as f:
+            f.write('bin/foo\nlib/with space.so\n\n lib/lead.so\nlib/trail.so \r\n')
+        self.assertEqual(read_file_list(filename),
+                         ['bin/foo', 'lib/with space.so', ' lib/lead.so', 'lib/trail.so '])
+        with open(filename, 'w') as f:
+            f.write('bin/foo\0lib/with\nnewline.so\0')
+        self.assertEqual(read_file_list(filename), ['bin/foo', 'lib/with\nnewline.so'])
+
+
+class TestArtifactFinder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.root = os.path.join(self.tmp, 'prefix')
+        self.external = os.path.join(self.tmp, 'system', 'libSystem.dylib')
+        make_macho_tree(self.root, self.external)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_jobs(self):
+        serial = MachOFinder(self.root, jobs=1)
+        parallel = MachOFinder(self.root, jobs=4)
+        for binaries in (serial, parallel):
+            self.assertEqual(
+                sorted(shlib.filename for shlib in binaries.internal_shlib),
+                ['libbar.dylib', 'libfoo.dylib'])
+            self.assertEqual(
+                [shlib.path for shlib in binaries.external_shlib], [Path(self.external)])
+            exe, = binaries.executable
+            self.assertEqual([shlib.filename for shlib in exe.internal_shlib], ['libfoo.dylib'])
+
+    def _dylibs(self, filename):
+        return [cmd['filename'] for cmd in macho_load_commands(os.path.join(self.root, filename))
+                if cmd['cmd'] == 'LC_LOAD_DYLIB']
+
+    def test_files(self):
+        # libbar is neither listed nor walked, but loaded by libfoo
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'unlisted'), synthetic.macho_image(
+            dylibs=[self.external]), executable=True)
+        stats.get_stats().reset()
+        binaries = MachOFinder(self.root, files=['bin/foo', 'lib/libfoo.dylib'])
+        self.assertEqual(stats.get_stats().counters['files_listed'], 2)
+        self.assertEqual([exe.filename for exe in binaries.executable], ['foo'])
+        self.assertEqual(sorted(shlib.filename for shlib in binaries.internal_shlib),
+                         ['libbar.dylib', 'libfoo.dylib'])
+        summary = binaries.make_paths_relative()
+        self.assertEqual((summary.files, summary.commands), (2, 2))
+        self.assertEqual(self._dylibs('lib/libfoo.dylib'),
+                         ['@loader_path/libbar.dylib', self.external])
+        with self.assertRaises(ValueError):
+            MachOFinder(os.path.join(self.root, 'bin', 'foo'), files=[])
+
+    def test_rules(self):
+        # the tests directory is pruned, but its library is loaded by bin/runner
+        libt = os.path.join(self.root, 'tests', 'libt.dylib')
+        synthetic.write_binary(libt, synthetic.macho_image(synthetic.MH_DYLIB, dylibs=[self.external]))
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'runner'), synthetic.macho_image(
+            dylibs=[libt]), executable=True)
+        binaries = MachOFinder(self.root, rules=Rules(presets=['tests']))
+        self.assertFalse(binaries.walks_whole_tree)
+        self.assertTrue(MachOFinder(self.root).walks_whole_tree)
+        self.assertEqual(sorted(exe.filename for exe in binaries.executable), ['foo', 'runner'])
+        self.assertEqual(sorted(shlib.filename for shlib in binaries.internal_shlib),
+                         ['libbar.dylib', 'libfoo.dylib', 'libt.dylib'])
+        binaries.make_paths_relative()
+        self.assertEqual(self._dylibs('bin/runner'), ['@executable_path/../tests/libt.dylib'])
+
+    def test_rewrite(self):
+        binaries = MachOFinder(self.root, jobs=4)
+        summary = binaries.make_paths_relative()
+        self.assertEqual((summary.files, summary.commands), (2, 2))
+        self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+        self.assertEqual(self._dylibs('lib/libfoo.dylib'),
+                         ['@loader_path/libbar.dylib', self.external])
+        binaries.make_paths_absolute()
+        self.assertEqual(self._dylibs('bin/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+
+    def test_rewrite_failure(self):
+        # absolute path barely fits, relative path does not
+        bar = os.path.join(self.root, 'lib', 'libbar.dylib')
+        synthetic.write_binary(os.path.join(self.root, 'bin', *'abcdef'), synthetic.macho_image(
+            dylibs=[bar], text_offset=32 + 72 + 80 + 24 + len(bar) + 8), executable=True)
+        binaries = MachOFinder(self.root, jobs=4)
+        with self.assertRaises(RewriteError) as context:
+            binaries.make_paths_relative()
+        summary = context.exception.summary
+        self.assertEqual([artifact.filename for artifact, error in summary.failures], ['f'])
+        self.assertEqual(summary.files, 2)
+        self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+
+    def _rpaths(self, filename):
+        return [value for arch, cmd, value in macho_linker_commands(os.path.join(self.root, filename))
+                if cmd == 'LC_RPATH']
+
+    def test_rewrite_rpath(self):
+        MachOFinder(self.root, jobs=4).make_paths_relative()
+        summary = MachOFinder(self.root, jobs=4).make_paths_rpath()
+        self.assertEqual((summary.files, summary.commands), (2, 2))
+        self.assertEqual(self._dylibs('bin/foo'), ['@rpath/libfoo.dylib'])
+        self.assertEqual(self._rpaths('bin/foo'), ['@executable_path/../lib'])
+        self.assertEqual(self._dylibs('lib/libfoo.dylib'), ['@rpath/libbar.dylib', self.external])
+        self.assertEqual(self._rpaths('lib/libfoo.dylib'), ['@loader_path'])
+        binaries = MachOFinder(self.root, jobs=4)
+        self.assertEqual(sorted(shlib.filename for shlib in binaries.internal_shlib),
+                         ['libbar.dylib', 'libfoo.dylib'])
+        self.assertEqual(binaries.make_paths_rpath().files, 0)
+        binaries.make_paths_absolute()
+        self.assertEqual(self._dylibs('bin/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+        self.assertEqual(self._rpaths('bin/foo'), [])
+        self.assertEqual(self._rpaths('lib/libfoo.dylib'), [])
+
+    def test_rpath_order(self):
+        # the most used directory comes first, a shadowed name stays relative
+        # and its directory is not searched
+        other = os.path.join(self.root, 'other')
+        for name in ('liba.dylib', 'libfoo.dylib'):
+            synthetic.write_binary(os.path.join(other, name), synthetic.macho_image(synthetic.MH_DYLIB))
+        lib = os.path.join(self.root, 'lib')
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'many'), synthetic.macho_image(dylibs=[
+            os.path.join(lib, 'libfoo.dylib'),
+            os.path.join(other, 'liba.dylib'),
+            os.path.join(other, 'libfoo.dylib'),
+        ]), executable=True)
+        MachOFinder(self.root, jobs=4).make_paths_rpath()
+        self.assertEqual(self._rpaths('bin/many'), ['@executable_path/../other'])
+        self.assertEqual(self._dylibs('bin/many'), [
+            '@executable_path/../lib/libfoo.dylib', '@rpath/liba.dylib', '@rpath/libfoo.dylib'])
+
+    def _rpath_chain(self, *names):
+        # bin/app -> @rpath/liba -> @rpath/libb ..., only bin/app has an LC_RPATH
+        lib = os.path.join(self.root, 'lib')
+        for name, needed in zip(names, names[1:] + (None,)):
+            synthetic.write_binary(os.path.join(lib, name), synthetic.macho_image(
+                synthetic.MH_DYLIB, dylibs=['@rpath/' + needed] if needed else [self.external]))
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'app'), synthetic.macho_image(
+            dylibs=['@rpath/' + names[0]], rpaths=['@executable_path/../lib']), executable=True)
+
+    def test_inherited_rpath(self):
+        # dyld resolves the @rpath names of a library along its loaders' LC_RPATH
+        self._rpath_chain('liba.dylib', 'libb.dylib', 'libc.dylib')
+        binaries = MachOFinder(self.root)
+        libs = dict((shlib.filename, shlib) for shlib in binaries.internal_shlib)
+        lib = os.path.join(self.root, 'lib')
+        self.assertEqual(libs['libb.dylib'].dependents, (Path(os.path.join(lib, 'libc.dylib')),))
+        self.assertEqual(libs['libb.dylib'].inherited_search_path, (lib,))
+        binaries.make_paths_relative()
+        self.assertEqual(self._dylibs('bin/app'), ['@executable_path/../lib/liba.dylib'])
+        self.assertEqual(self._rpaths('bin/app'), [])
+        self.assertEqual(self._dylibs('lib/liba.dylib'), ['@loader_path/libb.dylib'])
+        self.assertEqual(self._dylibs('lib/libb.dylib'), ['@loader_path/libc.dylib'])
+
+    def test_inherited_rpath_kept(self):
+        # a name that stays @rpath still needs the search path of the executable
+        self._rpath_chain('liba.dylib', 'libmissing.dylib')
+        os.remove(os.path.join(self.root, 'lib', 'libmissing.dylib'))
+        with self.assertLogs('ld-vulcanize', 'WARNING') as logs:
+            binaries = MachOFinder(self.root)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('liba.dylib needs @rpath/libmissing.dylib', logs.output[0])
+        binaries.make_paths_relative()
+        self.assertEqual(self._dylibs('bin/app'), ['@executable_path/../lib/liba.dylib'])
+        self.assertEqual(self._rpaths('bin/app'), ['@executable_path/../lib'])
+
+    def _link(self, *names):
+        foo = os.path.join(self.root, 'bin', 'foo')
+        for name in names:
+            filename = os.path.join(self.root, name)
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            os.link(foo, filename)
+
+    def test_hardlinks_same_directory(self):
+        # parsed and rewritten once, the result is right for both links
+        self._link('bin/bar')
+        stats.get_stats().reset()
+        binaries = MachOFinder(self.root, jobs=1)
+        self.assertEqual(stats.get_stats().counters['hardlinks'], 1)
+        self.assertEqual(sorted(exe.filename for exe in binaries.executable), ['bar', 'foo'])
+        self.assertEqual(binaries.make_paths_relative().files, 2)
+        self.assertEqual(self._dylibs('bin/bar'), ['@executable_path/../lib/libfoo.dylib'])
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.root, 'bin', 'foo'), os.path.join(self.root, 'bin', 'bar')))
+
+    def test_hardlinks_error(self):
+        self._link('libexec/sub/foo')
+        with self.assertRaises(HardlinkError) as context:
+            MachOFinder(self.root).make_paths_relative()
+        self.assertEqual(len(context.exception.groups), 1)
+        self.assertEqual(self._dylibs('lib/libfoo.dylib')[0], os.path.join(self.root, 'lib/libbar.dylib'))
+        self.assertRaises(ValueError, MachOFinder, self.root, hardlinks='ignore')
+
+    def test_hardlinks_same_changes(self):
+        # different directories, but at the same depth the relative paths agree
+        self._link('libexec/foo')
+        binaries = MachOFinder(self.root)
+        self.assertEqual(binaries.make_paths_relative().files, 2)
+        self.assertEqual(self._dylibs('libexec/foo'), ['@executable_path/../lib/libfoo.dylib'])
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.root, 'bin', 'foo'), os.path.join(self.root, 'libexec', 'foo')))
+
+    def test_hardlinks_absolute(self):
+        # absolute paths are the same for every link
+        self._link('libexec/sub/foo')
+        MachOFinder(self.root).make_paths_absolute()
+        self.assertEqual(self._dylibs('libexec/sub/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+
+    def test_hardlinks_split(self):
+        self._link('libexec/sub/foo')
+        MachOFinder(self.root, hardlinks='split').make_paths_relative()
+        self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+        self.assertEqual(self._dylibs('libexec/sub/foo'), ['@executable_path/../../lib/libfoo.dylib'])
+        self.assertFalse(os.path.samefile(
+            os.path.join(self.root, 'bin', 'foo'), os.path.join(self.root, 'libexec', 'sub', 'foo')))
+
+    def test_hardlinks_symlink(self):
+        self._link('libexec/sub/foo')
+        MachOFinder(self.root, hardlinks='symlink').make_paths_relative()
+        self.assertEqual(os.readlink(os.path.join(self.root, 'libexec', 'sub', 'foo')), '../../bin/foo')
+        self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
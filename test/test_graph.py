@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize.path import Path
+from ld_vulcanize.graph import DependencyGraph
+
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
+
+
+class Node(object):
+
+    def __init__(self, name, *dependents):
+        self.path = Path.canonical('/graph/' + name)
+        self.dependents = [Path.canonical('/graph/' + dep) for dep in dependents]
+
+
+def names(paths):
+    return [os.path.basename(str(path)) for path in paths]
+
+
+class TestDependencyGraph(unittest.TestCase):
+
+    def setUp(self):
+        # a -> b -> c <-> d, e -> c, and the missing x is ignored
+        self.graph = DependencyGraph.build([
+            Node('a', 'b', 'x'), Node('b', 'c'), Node('c', 'd'), Node('d', 'c'), Node('e', 'c'),
+        ])
+
+    def test_queries(self):
+        graph = self.graph
+        self.assertEqual((len(graph), graph.num_edges), (5, 5))
+        self.assertEqual(names(graph.dependencies('/graph/a')), ['b'])
+        self.assertEqual(names(graph.dependents('/graph/c')), ['b', 'd', 'e'])
+        self.assertEqual(names(graph.closure('/graph/a')), ['b', 'c', 'd'])
+        self.assertEqual(names(graph.affected_by('/graph/c')), ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(names(graph.affected_by(['/graph/b'])), ['a'])
+        self.assertRaises(ValueError, graph.affected_by, '/graph/x')
+
+    def test_lookup(self):
+        # queries do not intern unknown paths
+        size = len(Path.TABLE)
+        self.assertNotIn('/graph/unknown/y', self.graph)
+        self.assertRaises(ValueError, self.graph.dependents, '/graph/unknown/z')
+        self.assertEqual(len(Path.TABLE), size)
+        self.assertIn('/graph/./a', self.graph)
+
+    def test_components(self):
+        components = [names(c) for c in self.graph.strongly_connected_components()]
+        self.assertEqual(components, [['c', 'd'], ['b'], ['a'], ['e']])
+        self.assertRaises(ValueError, self.graph.topological_order)
+        graph = DependencyGraph.build([Node('a', 'b', 'c'), Node('b', 'c'), Node('c')])
+        self.assertEqual(names(graph.topological_order()), ['c', 'b', 'a'])
+
+    def test_save(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'graph.json')
+            self.graph.save(filename)
+            graph = DependencyGraph.load(filename)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(graph.nodes, self.graph.nodes)
+        self.assertEqual(names(graph.affected_by('/graph/d')), names(self.graph.affected_by('/graph/d')))
+
+
+class TestFinderGraph(unittest.TestCase):
+
+    def test_affected_by(self):
+        tmp = os.path.realpath(tempfile.mkdtemp())
+        try:
+            root = os.path.join(tmp, 'prefix')
+            external = os.path.join(tmp, 'system', 'libSystem.dylib')
+            make_macho_tree(root, external)
+            graph = MachOFinder(root, jobs=1).graph
+            self.assertEqual(names(graph.affected_by(external)), ['foo', 'libbar.dylib', 'libfoo.dylib'])
+            self.assertEqual(names(graph.topological_order()),
+                             ['libSystem.dylib', 'libbar.dylib', 'libfoo.dylib', 'foo'])
+        finally:
+            shutil.rmtree(tmp)
@@ -0,0 +1,203 @@
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize import synthetic
+from ld_vulcanize.tool import macho
+from ld_vulcanize.tool.macho import macho_load_commands, change_dylibs, MachOError
+from ld_vulcanize.binary import SharedLibraryOSX, ExecutableOSX
+
+
+class TestMachO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.libfoo = synthetic.write_binary(
+            os.path.join(self.tmp, 'lib', 'libfoo.dylib'),
+            synthetic.macho_image(synthetic.MH_DYLIB, install_name='libfoo.dylib'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_commands(self):
+        for is_64 in (True, False):
+            for endian in ('<', '>'):
+                image = synthetic.macho_image(
+                    dylibs=['/usr/lib/libSystem.B.dylib'], is_64=is_64, endian=endian)
+                filename = synthetic.write_binary(os.path.join(self.tmp, 'a.out'), image)
+                cmds = list(macho_load_commands(filename))
+                dyld = [cmd for cmd in cmds if cmd['cmd'] == 'LC_LOAD_DYLIB']
+                self.assertEqual(dyld[0]['filename'], '/usr/lib/libSystem.B.dylib')
+                self.assertEqual(dyld[0]['name'], '/usr/lib/libSystem.B.dylib (offset 24)')
+
+    def test_fat(self):
+        fat = synthetic.fat_binary([
+            (synthetic.CPU_TYPE_X86_64, synthetic.macho_image(dylibs=['/a.dylib'])),
+            (synthetic.CPU_TYPE_I386, synthetic.macho_image(dylibs=['/b.dylib'], is_64=False)),
+        ])
+        filename = synthetic.write_binary(os.path.join(self.tmp, 'fat'), fat)
+        filenames = [cmd['filename'] for cmd in macho_load_commands(filename)
+                     if cmd['cmd'] == 'LC_LOAD_DYLIB']
+        self.assertEqual(filenames, ['/a.dylib', '/b.dylib'])
+
+    def test_not_macho(self):
+        filename = os.path.join(self.tmp, 'text')
+        with open(filename, 'w') as f:
+            f.write('#!/bin/sh\n')
+        self.assertRaises(MachOError, list, macho_load_commands(filename))
+        open(filename, 'w').close()
+        self.assertRaises(MachOError, list, macho_load_commands(filename))
+
+    def test_sparse(self):
+        filename = os.path.join(self.tmp, 'big.dylib')
+        with open(filename, 'wb') as f:
+            f.write(synthetic.macho_image(synthetic.MH_DYLIB, dylibs=['/a.dylib']))
+            f.truncate(1 << 32)
+        self.assertEqual(change_dylibs(filename, {'/a.dylib': '/b.dylib'}), 1)
+        filenames = [cmd['filename'] for cmd in macho_load_commands(filename)
+                     if cmd['cmd'] == 'LC_LOAD_DYLIB']
+        self.assertEqual(filenames, ['/b.dylib'])
+        self.assertEqual(os.path.getsize(filename), 1 << 32)
+
+    def test_dependents(self):
+        exe = ExecutableOSX(synthetic.write_binary(
+            os.path.join(self.tmp, 'bin', 'foo'),
+            synthetic.macho_image(dylibs=['@executable_path/../lib/libfoo.dylib']),
+            executable=True))
+        self.assertIn(self.libfoo, exe.find_dependents())
+        shlib = SharedLibraryOSX(synthetic.write_binary(
+            os.path.join(self.tmp, 'lib', 'libbar.dylib'),
+            synthetic.macho_image(synthetic.MH_DYLIB, dylibs=['@loader_path/libfoo.dylib'])))
+        self.assertIn(self.libfoo, shlib.find_dependents())
+
+    def _dylibs(self, filename):
+        return [cmd['filename'] for cmd in macho_load_commands(filename)
+                if cmd['cmd'] == 'LC_LOAD_DYLIB']
+
+    def test_change_dylibs(self):
+        for is_64 in (True, False):
+            image = synthetic.macho_image(dylibs=['/a.dylib', '/b.dylib', '/c.dylib'], is_64=is_64)
+            filename = synthetic.write_binary(os.path.join(self.tmp, 'a.out'), image)
+            count = change_dylibs(filename, {
+                '/a.dylib': '@executable_path/../lib/a_much_longer_name.dylib',
+                '/c.dylib': '/c',
+            })
+            self.assertEqual(count, 2)
+            self.assertEqual(self._dylibs(filename), [
+                '@executable_path/../lib/a_much_longer_name.dylib', '/b.dylib', '/c'])
+
+    def test_change_dylibs_fat(self):
+        fat = synthetic.fat_binary([
+            (synthetic.CPU_TYPE_X86_64, synthetic.macho_image(dylibs=['/a.dylib'])),
+            (synthetic.CPU_TYPE_ARM64, synthetic.macho_image(dylibs=['/a.dylib'], endian='>')),
+        ])
+        filename = synthetic.write_binary(os.path.join(self.tmp, 'fat'), fat)
+        self.assertEqual(change_dylibs(filename, {'/a.dylib': '@loader_path/a.dylib'}), 2)
+        self.assertEqual(self._dylibs(filename), ['@loader_path/a.dylib'] * 2)
+
+    def test_slice_dependents(self):
+        libbar = synthetic.write_binary(
+            os.path.join(self.tmp, 'lib', 'libbar.dylib'),
+            synthetic.macho_image(synthetic.MH_DYLIB, install_name='libbar.dylib'))
+        fat = synthetic.fat_binary([
+            (synthetic.CPU_TYPE_X86_64, synthetic.macho_image(dylibs=[self.libfoo])),
+            (synthetic.CPU_TYPE_ARM64, synthetic.macho_image(
+                dylibs=[self.libfoo, libbar], cputype=synthetic.CPU_TYPE_ARM64)),
+        ])
+        exe = ExecutableOSX(synthetic.write_binary(
+            os.path.join(self.tmp, 'bin', 'fat'), fat, executable=True))
+        dependents = exe.find_dependents()
+        self.assertEqual(dependents, [self.libfoo, libbar])
+        self.assertEqual(exe.slice_dependents, {
+            'x86_64': (self.libfoo,),
+            'arm64': (self.libfoo, libbar),
+        })
+        exe._init_shlib([SharedLibraryOSX(path) for path in dependents], [])
+        self.assertEqual(exe.make_paths_relative(), 1)
+        self.assertEqual(self._dylibs(exe.path), [
+            '@executable_path/../lib/libfoo.dylib',
+            '@executable_path/../lib/libfoo.dylib',
+            '@executable_path/../lib/libbar.dylib',
+        ])
+
+    def test_slice_rpaths(self):
+        # the same @rpath name resolves along the search path of each slice
+        libs = [synthetic.write_binary(
+            os.path.join(self.tmp, name, 'libfoo.dylib'),
+            synthetic.macho_image(synthetic.MH_DYLIB)) for name in ('a', 'b')]
+        fat = synthetic.fat_binary([
+            (synthetic.CPU_TYPE_X86_64, synthetic.macho_image(
+                dylibs=['@rpath/libfoo.dylib'], rpaths=['@executable_path/../a'])),
+            (synthetic.CPU_TYPE_ARM64, synthetic.macho_image(
+                dylibs=['@rpath/libfoo.dylib'], rpaths=['@executable_path/../b'],
+                cputype=synthetic.CPU_TYPE_ARM64)),
+        ])
+        exe = ExecutableOSX(synthetic.write_binary(
+            os.path.join(self.tmp, 'bin', 'fat'), fat, executable=True))
+        self.assertEqual(exe.find_dependents(), libs)
+        self.assertEqual(exe.slice_dependents, {'x86_64': (libs[0],), 'arm64': (libs[1],)})
+        # one install name cannot name both libraries
+        exe._init_shlib([SharedLibraryOSX(path) for path in libs], [])
+        self.assertEqual(exe.make_paths_absolute(), 0)
+
+    def test_slice_rpaths_rewrite(self):
+        # the search paths of each slice are changed separately
+        fat = synthetic.fat_binary([
+            (synthetic.CPU_TYPE_X86_64, synthetic.macho_image(
+                dylibs=['@rpath/libfoo.dylib'], rpaths=['@executable_path/../lib'])),
+            (synthetic.CPU_TYPE_ARM64, synthetic.macho_image(
+                dylibs=['@rpath/libfoo.dylib'], rpaths=['/opt/arm64/lib', '@executable_path/../lib'],
+                cputype=synthetic.CPU_TYPE_ARM64)),
+        ])
+        exe = ExecutableOSX(synthetic.write_binary(
+            os.path.join(self.tmp, 'bin', 'fat'), fat, executable=True))
+        self.assertEqual(exe.find_dependents(), [self.libfoo])
+        libfoo = SharedLibraryOSX(self.libfoo)
+        self.assertEqual(libfoo.find_dependents(), [])
+        libfoo._init_shlib([], [])
+        exe._init_shlib([libfoo], [])
+        self.assertEqual(exe.make_paths_relative(), 1)
+        self.assertEqual(self._dylibs(exe.path), ['@executable_path/../lib/libfoo.dylib'] * 2)
+        self.assertEqual(
+            [(arch, value) for arch, cmd, value in macho.macho_linker_commands(exe.path)
+             if cmd == 'LC_RPATH'],
+            [('arm64', '/opt/arm64/lib')])
+        self.assertEqual(exe.make_paths_relative(), 0)
+
+    def test_change_dylibs_no_padding(self):
+        image = synthetic.macho_image(dylibs=['/a.dylib'], text_offset=0x100)
+        filename = synthetic.write_binary(os.path.join(self.tmp, 'a.out'), image)
+        self.assertRaises(MachOError, change_dylibs, filename, {'/a.dylib': '/' + 'x' * 256})
+        self.assertEqual(self._dylibs(filename), ['/a.dylib'])
+
+    def test_change_dylibs_no_contents(self):
+        command = struct.pack('<IIIIII', macho.LC_LOAD_DYLIB, 40, 24, 2, 0x10000, 0x10000)
+        command += b'/a.dylib'.ljust(16, b'\0')
+        header = struct.pack('<IiiIIIII', macho.MH_MAGIC_64, synthetic.CPU_TYPE_X86_64, 3,
+                             synthetic.MH_EXECUTE, 1, len(command), 0, 0)
+        filename = synthetic.write_binary(
+            os.path.join(self.tmp, 'a.out'), header + command + b'\0' * 0x1000)
+        self.assertRaises(MachOError, change_dylibs, filename, {'/a.dylib': '/b.dylib'})
+        self.assertEqual(self._dylibs(filename), ['/a.dylib'])
+
+    def test_change_dylibs_signed(self):
+        filename = synthetic.write_binary(os.path.join(self.tmp, 'a.out'), synthetic.macho_image(
+            dylibs=['/a.dylib'], code_signature=True))
+        with self.assertLogs('ld-vulcanize', 'WARNING') as logs:
+            self.assertEqual(change_dylibs(filename, {'/a.dylib': '/b.dylib'}), 1)
+        self.assertIn('codesign -f -s - ' + filename, logs.output[0])
+        self.assertEqual(self._dylibs(filename), ['/b.dylib'])
+
+    def test_make_paths_relative(self):
+        exe = ExecutableOSX(synthetic.write_binary(
+            os.path.join(self.tmp, 'bin', 'foo'),
+            synthetic.macho_image(dylibs=[self.libfoo]),
+            executable=True))
+        dependents = list(exe.find_dependents())
+        exe._init_shlib([SharedLibraryOSX(path) for path in dependents], [])
+        exe.make_paths_relative()
+        self.assertEqual(self._dylibs(exe.path), ['@executable_path/../lib/libfoo.dylib'])
+        exe.make_paths_absolute()
+        self.assertEqual(self._dylibs(exe.path), [self.libfoo])
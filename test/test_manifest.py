@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize.manifest import Manifest
+
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.root = os.path.join(self.tmp, 'prefix')
+        make_macho_tree(self.root, os.path.join(self.tmp, 'system', 'libSystem.dylib'))
+        self.filename = os.path.join(self.tmp, 'manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def rewrite(self):
+        manifest = Manifest.load(self.filename)
+        summary = MachOFinder(self.root).make_paths_relative(manifest)
+        manifest.save(self.filename)
+        return summary
+
+    def test_since(self):
+        summary = self.rewrite()
+        self.assertEqual((summary.files, summary.skipped), (2, 0))
+        summary = self.rewrite()
+        self.assertEqual((summary.files, summary.skipped), (0, 3))
+        os.utime(os.path.join(self.root, 'bin', 'foo'), (0, 0))
+        summary = self.rewrite()
+        self.assertEqual((summary.files, summary.skipped), (0, 2))
+        self.assertEqual(len(Manifest.load(self.filename)), 3)
+
+    def test_no_op(self):
+        MachOFinder(self.root).make_paths_relative()
+        summary = MachOFinder(self.root).make_paths_relative()
+        self.assertEqual((summary.files, summary.commands), (0, 0))
@@ -2,7 +2,7 @@
 import os
 import unittest
 
-from ld_vulcanize.path import Path
+from ld_vulcanize.path import Path, PathTable
 
 
 class TestPath(unittest.TestCase):
@@ -19,8 +19,24 @@ class TestPath(unittest.TestCase):
         usr_bin = Path('/usr/bin')
         self.assertTrue(usr_bin in usr)
         self.assertFalse(usr in usr_bin)
-        
-        
-
-
+        self.assertTrue(usr in usr)
+        self.assertFalse(Path.canonical('/usrx/bin') in usr)
 
+    def test_eq_string(self):
+        usr_bin = Path('/usr/bin')
+        self.assertEqual(usr_bin, '/usr/bin')
+        self.assertEqual(usr_bin, '/usr/lib/../bin')
+        self.assertNotEqual(usr_bin, '/no/such/file')
+        self.assertEqual(hash(usr_bin), hash(Path.canonical('/usr/bin')))
+
+    def test_table(self):
+        table = PathTable()
+        node = table.intern('/a/b/c')
+        self.assertEqual(table.intern('/a/b/c'), node)
+        self.assertEqual(table.string(node), '/a/b/c')
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.child(table.lookup('/a/b'), 'c'), node)
+        self.assertIsNone(table.lookup('/a/x'))
+        self.assertTrue(table.is_ancestor(table.lookup('/a'), node))
+        self.assertEqual(Path.canonical('/a/b/c').dirname(), '/a/b')
+        self.assertEqual(Path.canonical('/a').dirname(), '/')
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+
+from ld_vulcanize import synthetic
+from ld_vulcanize.find import RewriteError, HardlinkError
+from ld_vulcanize.pipeline import Pipeline
+from ld_vulcanize.tool.macho import macho_load_commands
+from ld_vulcanize.binary import SharedLibraryOSX, ExecutableOSX
+
+from ld_vulcanize.synthetic import make_macho_tree
+
+
+class MachOPipeline(Pipeline):
+
+    SharedLibrary = SharedLibraryOSX
+    Executable = ExecutableOSX
+
+
+class Stop(BaseException):
+    pass
+
+
+class DyingPipeline(MachOPipeline):
+
+    def _parse(self, artifact):
+        raise Stop()
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.root = os.path.join(self.tmp, 'prefix')
+        self.external = os.path.join(self.tmp, 'system', 'libSystem.dylib')
+        make_macho_tree(self.root, self.external)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _dylibs(self, filename):
+        return [cmd['filename'] for cmd in macho_load_commands(os.path.join(self.root, filename))
+                if cmd['cmd'] == 'LC_LOAD_DYLIB']
+
+    def test_rewrite(self):
+        for jobs in (1, 4):
+            pipeline = MachOPipeline(self.root, jobs=jobs, queue_size=1)
+            summary = pipeline.make_paths_relative()
+            self.assertEqual((summary.files, summary.commands), (2, 2))
+            self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+            self.assertEqual(self._dylibs('lib/libfoo.dylib'),
+                             ['@loader_path/libbar.dylib', self.external])
+            summary = pipeline.make_paths_absolute()
+            self.assertEqual((summary.files, summary.commands), (2, 2))
+            self.assertEqual(self._dylibs('bin/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+
+    def test_failure(self):
+        synthetic.write_binary(os.path.join(self.root, 'bin', 'broken'), synthetic.macho_image(
+            dylibs=[os.path.join(self.root, 'lib', 'missing.dylib')]), executable=True)
+        with self.assertRaises(RewriteError) as context:
+            MachOPipeline(self.root, jobs=2).make_paths_relative()
+        summary = context.exception.summary
+        self.assertEqual([artifact.filename for artifact, error in summary.failures], ['broken'])
+        self.assertEqual(summary.files, 2)
+
+    def test_hardlinks(self):
+        # rewritten after the walk, each link with its own library path
+        os.makedirs(os.path.join(self.root, 'libexec', 'sub'))
+        os.link(os.path.join(self.root, 'bin', 'foo'), os.path.join(self.root, 'libexec', 'sub', 'foo'))
+        with self.assertRaises(HardlinkError):
+            MachOPipeline(self.root, jobs=4).make_paths_relative()
+        self.assertEqual(self._dylibs('bin/foo'), [os.path.join(self.root, 'lib/libfoo.dylib')])
+        summary = MachOPipeline(self.root, jobs=4, hardlinks='split').make_paths_relative()
+        self.assertEqual(summary.files, 2)
+        self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+        self.assertEqual(self._dylibs('libexec/sub/foo'), ['@executable_path/../../lib/libfoo.dylib'])
+        self.assertFalse(os.path.samefile(
+            os.path.join(self.root, 'bin', 'foo'), os.path.join(self.root, 'libexec', 'sub', 'foo')))
+
+    def test_hardlinks_same_changes(self):
+        os.makedirs(os.path.join(self.root, 'libexec'))
+        os.link(os.path.join(self.root, 'bin', 'foo'), os.path.join(self.root, 'libexec', 'foo'))
+        summary = MachOPipeline(self.root, jobs=4).make_paths_relative()
+        self.assertEqual(summary.files, 2)
+        self.assertEqual(self._dylibs('libexec/foo'), ['@executable_path/../lib/libfoo.dylib'])
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.root, 'bin', 'foo'), os.path.join(self.root, 'libexec', 'foo')))
+
+    def _finish(self, pipeline):
+        """
+        Rewrite in a thread, fail instead of hanging
+        """
+        outcome = []
+
+        def rewrite():
+            try:
+                outcome.append(pipeline.make_paths_relative())
+            except RewriteError as error:
+                outcome.append(error.summary)
+
+        thread = threading.Thread(target=rewrite)
+        thread.daemon = True
+        thread.start()
+        thread.join(30)
+        self.assertFalse(thread.is_alive(), 'pipeline deadlocked')
+        return outcome[0] if outcome else None
+
+    def test_truncated(self):
+        # fat header announcing one architecture, cut off before it
+        truncated = bytes(bytearray([0xca, 0xfe, 0xba, 0xbe, 0, 0, 0, 1])) + bytes(8)
+        for i in range(8):
+            with open(os.path.join(self.root, 'bin', 'truncated{0}'.format(i)), 'wb') as f:
+                f.write(truncated)
+        summary = self._finish(MachOPipeline(self.root, jobs=1, queue_size=2))
+        self.assertEqual(summary.files, 2)
+        self.assertEqual(self._dylibs('bin/foo'), ['@executable_path/../lib/libfoo.dylib'])
+
+    def test_stage_dies(self):
+        for i in range(8):
+            synthetic.write_binary(os.path.join(self.root, 'bin', 'exe{0}'.format(i)),
+                                   synthetic.macho_image(), executable=True)
+        pipeline = DyingPipeline(self.root, jobs=1, queue_size=1)
+        threading.excepthook, excepthook = (lambda args: None), threading.excepthook
+        try:
+            summary = self._finish(pipeline)
+        finally:
+            threading.excepthook = excepthook
+        self.assertEqual(summary.files, 0)
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize import stats
+from ld_vulcanize.find import Find
+from ld_vulcanize.rules import Rules, read_patterns
+
+
+class TestRules(unittest.TestCase):
+
+    def excluded(self, rules, path, is_dir=False):
+        name = path.rsplit('/', 1)[-1]
+        if is_dir:
+            return rules.exclude_directory(path, name)
+        return rules.exclude_file(path, name)
+
+    def test_patterns(self):
+        rules = Rules(['*.txt', 'build/', '/top.dat', 'lib/**/cache', 'data?.bin'])
+        self.assertTrue(self.excluded(rules, 'a/b/notes.txt'))
+        self.assertFalse(self.excluded(rules, 'a/notes.txt.so'))
+        self.assertTrue(self.excluded(rules, 'a/build', is_dir=True))
+        self.assertFalse(self.excluded(rules, 'a/build'))
+        self.assertTrue(self.excluded(rules, 'top.dat'))
+        self.assertFalse(self.excluded(rules, 'sub/top.dat'))
+        self.assertTrue(self.excluded(rules, 'lib/cache', is_dir=True))
+        self.assertTrue(self.excluded(rules, 'lib/a/b/cache', is_dir=True))
+        self.assertFalse(self.excluded(rules, 'share/lib/cache', is_dir=True))
+        self.assertTrue(self.excluded(rules, 'data1.bin'))
+        self.assertFalse(self.excluded(rules, 'data10.bin'))
+
+    def test_include(self):
+        rules = Rules(['*.txt', '!keep.txt'])
+        self.assertTrue(self.excluded(rules, 'other.txt'))
+        self.assertFalse(self.excluded(rules, 'dir/keep.txt'))
+        rules = Rules(['!keep.txt', '*.txt'])
+        self.assertTrue(self.excluded(rules, 'dir/keep.txt'))
+
+    def test_presets(self):
+        rules = Rules(presets=['default'])
+        self.assertTrue(self.excluded(rules, '.git', is_dir=True))
+        self.assertTrue(self.excluded(rules, 'share/doc', is_dir=True))
+        self.assertTrue(self.excluded(rules, 'opt/pkg/share/man', is_dir=True))
+        self.assertTrue(self.excluded(rules, 'lib/python3/site-packages/foo.dist-info', is_dir=True))
+        self.assertFalse(self.excluded(rules, 'lib/python3/site-packages', is_dir=True))
+        self.assertFalse(self.excluded(rules, 'share', is_dir=True))
+        with self.assertRaises(ValueError):
+            Rules(presets=['unknown'])
+
+    def test_read_patterns(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'ignore')
+            with open(filename, 'w') as f:
+                f.write('# comment\n\n*.txt\n!keep.txt\n')
+            self.assertEqual(read_patterns(filename), ['*.txt', '!keep.txt'])
+        finally:
+            shutil.rmtree(tmp)
+
+
+class TestPrune(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        for name in ('bin/foo', 'share/doc/a.html', 'share/doc/sub/b.html', '.git/HEAD',
+                     'lib/libfoo.so', 'lib/notes.txt'):
+            filename = os.path.join(self.tmp, name)
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            with open(filename, 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def walk(self, rules):
+        return sorted(os.path.relpath(path.absolute(), self.tmp)
+                      for path, st in Find(self.tmp, rules=rules).walk())
+
+    def test_prune(self):
+        stats.get_stats().reset()
+        self.assertEqual(self.walk(Rules(['*.txt'], presets=['default'])),
+                         ['bin/foo', 'lib/libfoo.so'])
+        counters = stats.get_stats().counters
+        self.assertEqual((counters['dirs_pruned'], counters['files_pruned']), (2, 1))
+        self.assertEqual(counters['files_walked'], 2)
+
+    def test_no_rules(self):
+        self.assertEqual(len(self.walk(Rules())), 6)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize.manifest import Manifest
+from ld_vulcanize.session import Session, SessionError, read_roots
+
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
+
+
+class MachOSession(Session):
+
+    Finder = MachOFinder
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.external = os.path.join(self.tmp, 'system', 'libSystem.dylib')
+        self.roots = [os.path.join(self.tmp, name) for name in ('one', 'two')]
+        for root in self.roots:
+            make_macho_tree(root, self.external)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_run(self):
+        session = MachOSession(jobs=2)
+
+        def internal(root):
+            binaries = session.finder(root)
+            return sorted(shlib.filename for shlib in binaries.internal_shlib)
+
+        results = session.run(self.roots, internal)
+        self.assertEqual([result.root for result in results], self.roots)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(result.result, ['libbar.dylib', 'libfoo.dylib'])
+            self.assertGreater(result.stats['counters']['files_walked'], 0)
+        # the common external library is only scanned for the first root
+        self.assertEqual((session._index.hits, session._index.misses), (1, 1))
+        session.close()
+
+    def test_since(self):
+        filename = os.path.join(self.tmp, 'manifest.json')
+
+        def rewrite():
+            session = MachOSession()
+            manifest = Manifest.load(filename)
+            results = session.run(
+                self.roots, lambda root: session.finder(root).make_paths_relative(manifest))
+            manifest.save(filename)
+            session.close()
+            return [(result.result.files, result.result.skipped) for result in results]
+
+        self.assertEqual(rewrite(), [(2, 0), (2, 0)])
+        self.assertEqual(len(Manifest.load(filename)), 6)
+        self.assertEqual(rewrite(), [(0, 3), (0, 3)])
+
+    def test_failure(self):
+        session = MachOSession()
+        missing = os.path.join(self.tmp, 'missing')
+
+        def check(root):
+            if not os.path.isdir(root):
+                raise ValueError('not a directory')
+            return root
+
+        results = session.run([missing] + self.roots, check)
+        self.assertIsInstance(results[0].error, ValueError)
+        self.assertEqual([result.result for result in results[1:]], self.roots)
+        error = SessionError(results)
+        self.assertIn('failed 1 of 3 roots', str(error))
+        session.close()
+
+    def test_read_roots(self):
+        filename = os.path.join(self.tmp, 'roots.txt')
+        with open(filename, 'w') as f:
+            f.write('# roots\n{0}\n\n  {1}\n'.format(*self.roots))
+        self.assertEqual(read_roots(filename), self.roots)
@@ -0,0 +1,53 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from ld_vulcanize import stats
+from ld_vulcanize.stats import Stats
+
+from ld_vulcanize.synthetic import MachOFinder, make_macho_tree
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_stats(self):
+        recorder = Stats()
+        recorder.count('files_opened')
+        recorder.count('files_opened', 2)
+        with recorder.phase('parse'):
+            pass
+        recorder.add_time('parse', 1.0)
+        self.assertEqual(recorder.counters, dict(files_opened=3))
+        self.assertGreaterEqual(recorder.timings['parse'], 1.0)
+        lines = recorder.format_table().splitlines()
+        self.assertEqual([line.split()[0] for line in lines],
+                         ['phase', 'parse', 'counter', 'files_opened'])
+        filename = os.path.join(self.tmp, 'stats.json')
+        recorder.save(filename, roots=dict())
+        with open(filename) as f:
+            data = json.load(f)
+        self.assertEqual(data['counters'], dict(files_opened=3))
+        self.assertEqual(data['roots'], dict())
+        recorder.reset()
+        self.assertEqual(recorder.to_dict(), dict(timings=dict(), counters=dict()))
+
+    def test_finder(self):
+        root = os.path.join(self.tmp, 'prefix')
+        make_macho_tree(root, os.path.join(self.tmp, 'system', 'libSystem.dylib'))
+        stats.get_stats().reset()
+        MachOFinder(root, jobs=1).make_paths_relative()
+        recorded = stats.get_stats()
+        self.assertEqual(sorted(recorded.timings), ['classify', 'link', 'parse', 'rewrite', 'walk'])
+        counters = recorded.counters
+        self.assertEqual(counters['files_walked'], 3)
+        # classify the 3 files, parse the 4 binaries, rewrite the 2 with internal links
+        self.assertEqual(counters['files_opened'], 3 + 4 + 2)
+        self.assertGreater(counters['bytes_mapped'], counters['bytes_read'])